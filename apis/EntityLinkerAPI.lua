@@ -18,77 +18,10 @@ function EntityLinkerAPI:link(question, ngrams, num_results)
 	assert(num_results ~= nil, "Must specify number of results to get back")
 
 	local max_num_facts = 5000
-	-- keep track of entity name mapping and entity name topic mapping
-	local entity_name_mapping = {}
-	local fact_mappings = {}
-
-	local result = {}
-	local use_char_level = false
-
-	-- use both tokenized and split text
-	local tokenized_text = datasets.tokenize_text(question, use_char_level)
-	local split_text = question:split(' ')
-
-	-- construct all ngrams: 
-	-- for unigram get all nouns only.
-	local all_posibilities = {} --datasets.nlp_util:nouns(question)
-	for i = 1, ngrams do 
-		local igrams = dmn.functions.ngrams(tokenized_text, i)
-		local sgrams = dmn.functions.ngrams(split_text, i)
-
-		dmn.functions.table_concat(all_posibilities, igrams)
-		dmn.functions.table_concat(all_posibilities, sgrams)
-	end
-
-	local all_entities = {}
-	local all_names = {}
-
-	-- get candidates for all entities and names.
-	-- gets freebase id and corresponding name
-	for i = 1, #all_posibilities do 
-		cur_name = all_posibilities[i]
-		local entities, names = datasets.freebase_api:entities(cur_name, num_results)
-		dmn.functions.table_concat(all_entities, entities)
-		dmn.functions.table_concat(all_names, names)
-	end
 
-	for i = 1, #all_entities do 
-		local cur_entity = all_entities[i]
-		local cur_name = all_names[i]
-		entity_name_mapping[cur_entity] = cur_name
-	end
-
-	local keyed_entities =  dmn.functions.create_dictionary(all_entities)
-	local keyed_names = dmn.functions.create_dictionary(all_names)
-	local unique_entities = dmn.functions.keys(keyed_entities)
-
-	local all_predicates = {}
-	local all_facts = {}
-
-	for i = 1, #unique_entities do 
-		if i % 20 == 0 then 
-			dmn.logger:print("Extracting facts on entity " .. i 
-				.. " from " .. #unique_entities)
-		end
-		local cur_entity = unique_entities[i]
-		local cur_name = entity_name_mapping[cur_entity]
-		local predicates, facts = datasets.freebase_api:facts(cur_entity, max_num_facts)
-		dmn.functions.table_concat(all_predicates, predicates)
-
-		for i = 1, #predicates do 
-			local cur_predicate = predicates[i]
-			if facts[i] ~= nil and facts[i].values ~= nil and facts[i].values[1] ~= nil
-				and cur_name ~= nil and cur_predicate ~= nil then 
-				fact_mappings[cur_name .. " " .. cur_predicate] = facts[i].values[1].text
-			end
-		end
-	end
-
-	local predicate_keys = dmn.functions.create_dictionary(all_predicates)
-	local entity_keys = dmn.functions.create_dictionary(all_names)
-
-	local predicate_candidates = dmn.functions.keys(predicate_keys)
-	local entity_candidates = dmn.functions.keys(entity_keys)
+	-- n-grams, name lookups, filtering and fact lookups all run in the server
+	local predicate_candidates, entity_candidates, fact_mappings = 
+		datasets.freebase_api:link(question, ngrams, num_results, max_num_facts)
 
 	return predicate_candidates, entity_candidates, fact_mappings
 end
@@ -155,18 +88,12 @@ function EntityLinkerAPI:candidate_entities(all_posibilities, num_results)
 	local all_names = {}
 	local all_types = {}
 
-	-- get candidates for all entities and names.
+	-- get candidates for all entities and names with a single batched request.
 	-- gets freebase id and corresponding name
-	for i = 1, #all_posibilities do 
-		if i % 10 == 0 then 
-			print("On " .. i  .. " of " .. #all_posibilities)
-		end
-		cur_name = all_posibilities[i]
-		local entities, names, types = datasets.freebase_api:entities(cur_name, num_results)
-		dmn.functions.table_concat(all_entities, entities)
-		dmn.functions.table_concat(all_names, names)
-		dmn.functions.table_concat(all_types, types)
-	end
+	local entities, names, types = datasets.freebase_api:entities_batch(all_posibilities, num_results)
+	dmn.functions.table_concat(all_entities, entities)
+	dmn.functions.table_concat(all_names, names)
+	dmn.functions.table_concat(all_types, types)
 
 	return all_entities, all_names, all_types
 end
@@ -9,9 +9,13 @@ local FreebaseAPI = torch.class('datasets.Freebase_EL_API')
 function FreebaseAPI:__init(config)
    self.base_url = 'http://localhost:5000'
 
-   self.entity_freebase_endpoint = self.base_url .. "/api/v1/freebase/name?query=%s&num_results=%d&remove_stopwords=True"--filter=suggest&key=%s"
-   self.name_freebase_endpoint = self.base_url .. "/api/v1/freebase/name?query=%s&num_results=%d&remove_stopwords=True"
-   self.topic_freebase_endpoint = self.base_url .. "/api/v1/freebase/fact?topic_ids=%s&num_results=%d&remove_stopwords=True"
+   self.entity_freebase_endpoint = self.base_url .. "/api/v1/freebase/name?query=%s&num_results=%d&remove_stopwords=True&raw=false"--filter=suggest&key=%s"
+   self.name_freebase_endpoint = self.base_url .. "/api/v1/freebase/name?query=%s&num_results=%d&remove_stopwords=True&raw=false"
+   self.batch_name_freebase_endpoint = self.base_url .. "/api/v1/freebase/name/batch"
+   self.link_freebase_endpoint = self.base_url .. "/api/v1/freebase/link?question=%s&ngrams=%d&num_results=%d&num_facts=%d"
+     .. "&exclude_domains=/type/object/&fields=predicate_candidates,entity_candidates,fact_mappings"
+   self.topic_freebase_endpoint = self.base_url .. "/api/v1/freebase/fact?topic_ids=%s&num_results=%d&remove_stopwords=True&exclude_domains=/type/object/"
+     .. "&raw=false&fields=src_freebase_id,src_freebase_name,pred_freebase_name,tgt_freebase_id"
 
    self.num_calls = 0
 end
@@ -99,6 +103,83 @@ function FreebaseAPI:entities(query, num_results)
   return ids, entity_names, entity_types
 end
 
+-- Returns freebase ids of all entities that match each query, using one request for all queries
+-- returns: ids, entity_names, entity_types concatenated over queries in order
+function FreebaseAPI:entities_batch(queries, num_results)
+  assert(queries ~= nil, "queries must not be null")
+  assert(num_results ~= nil, "Number of results must not be null")
+
+  self:increment_num_calls()
+
+  local request_body = cjson.encode({queries = queries, num_results = num_results, raw = false})
+  local json_vals
+
+  local num_tries = 0
+  while (json_vals == nil or json_vals["result"] == nil) and (num_tries <= dmn.constants.NUM_RETRIES) do 
+    num_tries = num_tries + 1
+    dmn.io_functions.trycatch(
+      function() 
+        local response = dmn.io_functions.post_request(self.batch_name_freebase_endpoint, request_body)
+        json_vals = dmn.io_functions.json_decode(table.concat(response))
+      end,
+      function(err)
+        dmn.logger:print("Error requesting url " .. self.batch_name_freebase_endpoint .. " " .. err)
+        json_vals = nil
+    end)
+  end
+
+  local ids = {}
+  local entity_names = {}
+  local entity_types = {}
+
+  for i = 1, #json_vals["result"] do
+    local names = json_vals["result"][i]["result"]
+    for j = 1, #names do
+      local cur_entity = names[j]
+      table.insert(entity_names, cur_entity["freebase_name"])
+      table.insert(ids, cur_entity["freebase_id"])
+      table.insert(entity_types, {"TYPES_NOT_SUPPORTED"})
+    end
+  end
+
+  return ids, entity_names, entity_types
+end
+
+-- Links a question to candidate predicates, entities and facts with a single request.
+-- The server builds the n-grams, looks up and filters names and gets the facts of the entities
+-- returns: predicate_candidates, entity_candidates, fact_mappings (entity name .. " " .. predicate -> target id)
+function FreebaseAPI:link(question, ngrams, num_results, num_facts)
+  assert(question ~= nil, "question must not be null")
+  assert(ngrams ~= nil, "Number of ngrams must not be null")
+  assert(num_results ~= nil, "Number of results must not be null")
+  assert(num_facts ~= nil, "Number of facts must not be null")
+
+  self:increment_num_calls()
+
+  local extract_url = string.format(self.link_freebase_endpoint,
+    dmn.io_functions.url_encode(question),
+    ngrams,
+    num_results,
+    num_facts)
+  local json_vals
+
+  local num_tries = 0
+  while (json_vals == nil or json_vals["entity_candidates"] == nil) and (num_tries <= dmn.constants.NUM_RETRIES) do 
+    num_tries = num_tries + 1
+    dmn.io_functions.trycatch(
+      function() 
+        local html = dmn.io_functions.http_request(extract_url)
+        json_vals = dmn.io_functions.json_decode(html)
+      end,
+      function(err)
+        dmn.logger:print("Error requesting url " .. extract_url .. " " .. err)
+        json_vals = nil
+    end)
+  end
+
+  return json_vals["predicate_candidates"], json_vals["entity_candidates"], json_vals["fact_mappings"]
+end
+
 -- Gets facts about a topic id
 -- image_url: URL to extract images from, must be not null
 -- returns: Torch double tensor of size 1024 with googlenet features from image url
@@ -1,12 +1,35 @@
 """
 Preprocessing script for MT data.
 
+Word and character vocabularies are built in one pass over every file: the files
+are split into chunks of whole lines, counted by a pool of worker processes and
+merged in file order, so words keep the index of their first occurrence.
+
+On python 3 the word vocabularies are the same as the ones of the previous
+build_vocab, which wrote the words of a dict in insertion order. On python 2 that
+dict was in hash order, so the words of a rebuilt vocabulary get other indices:
+keep the old *_vocab.txt files of models trained on them.
+
+Tests: cd dmn/scripts && python -m unittest create_vocab_test
+
 """
 import re
-import json
 import os
 import glob
 import time
+import heapq
+import pickle
+import shutil
+import argparse
+import tempfile
+from collections import Counter, OrderedDict
+from multiprocessing import Pool, cpu_count
+from vocab_mmap import binary_path, write_binary_vocab
+
+# Lines are split like reading the files in universal newline mode
+NEWLINE_REGEX = re.compile(b'\r\n|\r|\n')
+CHUNK_BYTES = 16 * 1024 * 1024
+SPILL_BLOCK_SIZE = 10000
 
 def make_dirs(dirs):
     for d in dirs:
@@ -14,57 +37,233 @@ def make_dirs(dirs):
             os.makedirs(d)
 
 
-def build_vocab(dataset_paths, dst_path, word_count_threshold = 5):
-   
-  # count up all word counts so that we can threshold
-  # this shouldnt be too expensive of an operation
+class OrderedCounter(Counter, OrderedDict):
+  """Counter that remembers the order in which words were first counted"""
+
+  def __reduce__(self):
+    # Counter pickles through a plain dict, which loses the order on python 2
+    return self.__class__, (OrderedDict(self),)
+
+
+def tokenize_line(line):
+  """Splits a line (bytes, without line break) into words"""
+  trimmedLine = line.replace(b'\n', b'').replace(b'\r', b'').replace(b'(', b'( ')
+  # add space between question marks and periods
+  paddedLine = trimmedLine.replace(b'?', b' ?').replace(b'.', b' .').replace(b')', b' )').replace(b'-', b' - ')
+  paddedLine = paddedLine.replace(b',', b' , ').replace(b'"', b' " ')
+  return paddedLine.split(b' ')
+
+
+def find_chunks(dataset_path, chunk_bytes=CHUNK_BYTES):
+  """Returns (start, end) byte offsets of chunks of dataset_path that end after a line break"""
+  size = os.path.getsize(dataset_path)
+  chunks = []
+  with open(dataset_path, 'rb') as f:
+    start = 0
+    while start < size:
+      f.seek(min(start + chunk_bytes, size))
+      f.readline()
+      end = min(f.tell(), size)
+      chunks.append((start, end))
+      start = end
+  return chunks
+
+
+def read_lines(dataset_path, start, end):
+  """Returns the lines between byte offsets start and end, without line breaks"""
+  with open(dataset_path, 'rb') as f:
+    f.seek(start)
+    data = f.read(end - start)
+  lines = NEWLINE_REGEX.split(data)
+  # The piece after the last line break is not a line
+  if lines and lines[-1] == b'':
+    lines.pop()
+  return lines
+
+
+def count_chunk(task):
+  """Counts the words and bytes of a chunk, returns (job, word counts, char counts)"""
+  job, dataset_path, start, end, char_level = task
+  word_counts = OrderedCounter()
+  char_counts = OrderedCounter()
+  for line in read_lines(dataset_path, start, end):
+    word_counts.update(tokenize_line(line))
+    if char_level:
+      char_counts.update(bytearray(line))
+  return job, word_counts, char_counts
+
+
+class VocabCounter(object):
+  """
+  Merges chunk counts in order, keeping the first position of every word.
+
+  Once more than max_words distinct words are held, the counts are either spilled
+  to sorted run files and merged at the end (exact), or the least frequent words
+  are dropped (approximate: words close to the count threshold may be missed).
+  """
+
+  def __init__(self, max_words=None, approximate=False, spill_dir=None):
+    self.max_words = max_words
+    self.approximate = approximate
+    self.spill_dir = spill_dir
+    self.counts = {}
+    self.position = 0
+    self.run_paths = []
+
+  def update(self, counts):
+    for w, count in counts.items():
+      entry = self.counts.get(w)
+      if entry is None:
+        self.counts[w] = [self.position, count]
+      else:
+        entry[1] += count
+      self.position += 1
+    if self.max_words is not None and len(self.counts) > self.max_words:
+      if self.approximate:
+        self.prune()
+      else:
+        self.spill()
+
+  def prune(self):
+    # Drop the lowest counts until at most half of max_words are left
+    counts = sorted(entry[1] for entry in self.counts.values())
+    cutoff = counts[-(self.max_words // 2) - 1] if self.max_words // 2 < len(counts) else 0
+    self.counts = dict((w, entry) for w, entry in self.counts.items() if entry[1] > cutoff)
+
+  def spill(self):
+    if self.spill_dir is None:
+      self.spill_dir = tempfile.mkdtemp(prefix='vocab_')
+    run_path = os.path.join(self.spill_dir, 'run_%d.pkl' % len(self.run_paths))
+    entries = sorted((w, entry[0], entry[1]) for w, entry in self.counts.items())
+    with open(run_path, 'wb') as f:
+      for i in range(0, len(entries), SPILL_BLOCK_SIZE):
+        pickle.dump(entries[i:i + SPILL_BLOCK_SIZE], f, pickle.HIGHEST_PROTOCOL)
+    self.run_paths.append(run_path)
+    self.counts = {}
+
+  def read_run(self, run_path):
+    with open(run_path, 'rb') as f:
+      while True:
+        try:
+          block = pickle.load(f)
+        except EOFError:
+          return
+        for entry in block:
+          yield entry
+
+  def entries(self):
+    """Yields (word, first position, count) of every word, sorted by word when spilled"""
+    if not self.run_paths:
+      for w, entry in self.counts.items():
+        yield w, entry[0], entry[1]
+      return
+
+    self.spill()
+    current = None
+    for w, position, count in heapq.merge(*[self.read_run(run_path) for run_path in self.run_paths]):
+      if current is not None and current[0] == w:
+        current[2] += count
+      else:
+        if current is not None:
+          yield tuple(current)
+        # Runs are sorted by (word, position), so the first entry has the first position
+        current = [w, position, count]
+    if current is not None:
+      yield tuple(current)
+
+  def vocab(self, count_threshold):
+    """Returns the words counted at least count_threshold times, in order of first occurrence"""
+    num_words = 0
+    kept = []
+    for w, position, count in self.entries():
+      num_words += 1
+      if count >= count_threshold:
+        kept.append((position, w))
+    kept.sort()
+    return [w for position, w in kept], num_words
+
+  def close(self):
+    if self.run_paths:
+      shutil.rmtree(os.path.dirname(self.run_paths[0]), ignore_errors=True)
+      self.run_paths = []
+
+
+def write_vocab(vocab, dst_path, first_token=None):
+  """Writes the text vocabulary and its memory-mappable binary version next to it"""
+  words = ([first_token] if first_token is not None else []) + list(vocab)
+  with open(dst_path, 'wb') as f:
+    for w in words:
+      f.write(w + b'\n')
+  write_binary_vocab(words, binary_path(dst_path))
+
+
+def build_vocabs(jobs, word_count_threshold=5, char_count_threshold=1, num_workers=None,
+  chunk_bytes=CHUNK_BYTES, max_words=None, approximate=False, spill_dir=None):
+  """
+  Builds the vocabularies of several datasets with one pool of workers.
+  jobs: list of (dataset_paths, dst_path, char_dst_path), char_dst_path can be None
+  """
   print ('preprocessing word counts and creating vocab based on word count threshold %d' % (word_count_threshold, ))
   t0 = time.time()
-  word_counts = {}
-  nsents = 0
-
-  for dataset_path in dataset_paths:
-    dataset = open(dataset_path, 'r')
-    line = 'asdf'
-    while True:
-      line = dataset.readline()
-      if line == '': break
-      # Remove newline characters
-      trimmedLine = line.replace('\n', '').replace('\r', '').replace('\r\n', '').replace('(', '( ')
-      # add space between question marks and periods
-      paddedLine = trimmedLine.replace('?', ' ?').replace('.', ' .').replace(')', ' )').replace('-', ' - ')
-      paddedLine = paddedLine.replace(',', ' , ').replace('"', ' " ')
-      
-      tokens = paddedLine.split(' ')
-      for w in tokens:
-        word_counts[w] = word_counts.get(w, 0) + 1
-
-  vocab = [w for w in word_counts if word_counts[w] >= word_count_threshold]
-  print ('filtered words from %d to %d in %.2fs' % (len(word_counts), len(vocab), time.time() - t0))
-
-  # with K distinct words:
-  # - there are K+1 possible inputs (START token and all the words)
-  # - there are K+1 possible outputs (END token and all the words)
-  # we use ixtoword to take predicted indeces and map them to words for output visualization
-  # we use wordtoix to take raw words and get their index in word vector matrix
-  ixtoword = {}
-  ixtoword[0] = '.'  # period at the end of the sentence. make first dimension be end token
-  wordtoix = {}
-  wordtoix['#START#'] = 0 # make first vector be the start token
-  ix = 1
-  for w in vocab:
-    wordtoix[w] = ix
-    ixtoword[ix] = w
-    ix += 1
-
-  with open(dst_path, 'w') as f:
-    for i in ixtoword:
-      w = ixtoword[i]
-      f.write(w + '\n')
-      
-  print('saved vocabulary to %s' % dst_path)
+  tasks = []
+  for job, (dataset_paths, dst_path, char_dst_path) in enumerate(jobs):
+    for dataset_path in dataset_paths:
+      for start, end in find_chunks(dataset_path, chunk_bytes):
+        tasks.append((job, dataset_path, start, end, char_dst_path is not None))
+
+  word_counters = [VocabCounter(max_words, approximate, spill_dir and os.path.join(spill_dir, 'words_%d' % job))
+    for job in range(len(jobs))]
+  char_counters = [VocabCounter() for job in range(len(jobs))]
+  for path in [counter.spill_dir for counter in word_counters if counter.spill_dir is not None]:
+    make_dirs([path])
+
+  num_workers = num_workers or cpu_count()
+  pool = Pool(num_workers) if num_workers > 1 and len(tasks) > 1 else None
+  try:
+    # imap returns the chunks in order, which keeps the order of first occurrence
+    results = pool.imap(count_chunk, tasks) if pool is not None else map(count_chunk, tasks)
+    for job, word_counts, char_counts in results:
+      word_counters[job].update(word_counts)
+      char_counters[job].update(char_counts)
+  finally:
+    if pool is not None:
+      pool.close()
+      pool.join()
+
+  for job, (dataset_paths, dst_path, char_dst_path) in enumerate(jobs):
+    vocab, num_words = word_counters[job].vocab(word_count_threshold)
+    word_counters[job].close()
+    print ('filtered words from %d to %d in %.2fs' % (num_words, len(vocab), time.time() - t0))
+
+    # with K distinct words:
+    # - there are K+1 possible inputs (START token and all the words)
+    # - there are K+1 possible outputs (END token and all the words)
+    # the period at the end of the sentence is the first line, so index 0 is the end token
+    write_vocab(vocab, dst_path, b'.')
+    print('saved vocabulary to %s' % dst_path)
+
+    if char_dst_path is not None:
+      chars, num_chars = char_counters[job].vocab(char_count_threshold)
+      write_vocab([bytes(bytearray([c])) for c in chars], char_dst_path)
+      print('saved character vocabulary to %s' % char_dst_path)
+
+
+def build_vocab(dataset_paths, dst_path, word_count_threshold = 5, char_dst_path=None, **kwargs):
+  build_vocabs([(dataset_paths, dst_path, char_dst_path)], word_count_threshold, **kwargs)
+
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create the word and character vocabularies of the QA dataset')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes, defaults to the number of CPUs')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_BYTES, help='Bytes of every chunk sent to a worker')
+    parser.add_argument('--threshold', type=int, default=1, help='Minimum count of a word')
+    parser.add_argument('--max-words', type=int, default=None,
+      help='Distinct words held in memory before spilling to disk (or pruning with --approximate)')
+    parser.add_argument('--approximate', action='store_true',
+      help='Drop the least frequent words instead of spilling, words close to the threshold may be missed')
+    parser.add_argument('--spill-dir', default=None, help='Directory for spilled counts, defaults to a temporary one')
+    args = parser.parse_args()
+
     print('=' * 80)
     print('Preprocessing QA dataset')
     print('=' * 80)
@@ -73,21 +272,19 @@ if __name__ == '__main__':
     data_dir = os.path.join(base_dir, 'data')
     QA_dir = os.path.join(data_dir, 'Translation/train')
 
-    input_paths = [os.path.join(QA_dir, 'inputs.txt')]
-    question_paths = [os.path.join(QA_dir, 'questions.txt')]
-    output_paths = [os.path.join(QA_dir, 'outputs.txt')]
-
-    input_save_path = os.path.join(QA_dir, 'input_vocab.txt')
-    question_save_path = os.path.join(QA_dir, 'question_vocab.txt')
-    output_save_path = os.path.join(QA_dir, 'output_vocab.txt')
-
     # get vocabulary
-    token_paths = [input_paths, question_paths, output_paths]
-    save_paths = [input_save_path, question_save_path, output_save_path]
-
-    for i in range(0, len(token_paths)):   
-      build_vocab(
-          token_paths[i],
-          save_paths[i],
-          1
-          )
+    jobs = []
+    for name in ['input', 'question', 'output']:
+      jobs.append((
+          [os.path.join(QA_dir, '%ss.txt' % name)],
+          os.path.join(QA_dir, '%s_vocab.txt' % name),
+          os.path.join(QA_dir, '%s_vocab_char.txt' % name)))
+
+    build_vocabs(
+        jobs,
+        args.threshold,
+        num_workers=args.workers,
+        chunk_bytes=args.chunk_size,
+        max_words=args.max_words,
+        approximate=args.approximate,
+        spill_dir=args.spill_dir)
@@ -0,0 +1,81 @@
+"""
+Tests of create_vocab: chunk order with several workers, spilled counts and char vocabularies.
+
+Run from dmn/scripts: python -m unittest create_vocab_test
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from create_vocab import VocabCounter, build_vocab, build_vocabs
+
+LINES = [
+  b'what format is fearless?',
+  b'which genre of album is harder.....faster?',
+  b'who produced fearless (the album)?',
+  b'what is the genre of fearless, the album?',
+]
+
+
+def read_words(path):
+  with open(path, 'rb') as f:
+    return f.read().split(b'\n')[:-1]
+
+
+class CreateVocabTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.dataset_path = os.path.join(self.tmp_dir, 'questions.txt')
+    with open(self.dataset_path, 'wb') as f:
+      # Mixed line breaks are split like universal newline mode
+      f.write(b'\r\n'.join(LINES * 10) + b'\n')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def build(self, name, **kwargs):
+    dst_path = os.path.join(self.tmp_dir, name + '_vocab.txt')
+    char_dst_path = os.path.join(self.tmp_dir, name + '_vocab_char.txt')
+    build_vocab([self.dataset_path], dst_path, 1, char_dst_path=char_dst_path, **kwargs)
+    return read_words(dst_path), read_words(char_dst_path)
+
+  def test_first_occurrence_order(self):
+    words, chars = self.build('single', num_workers=1)
+    self.assertEqual(words[:6], [b'.', b'what', b'format', b'is', b'fearless', b'?'])
+    self.assertEqual(len(words) - 1, len(set(words[1:])))
+
+    # Small chunks counted by several workers are merged in file order
+    self.assertEqual(self.build('pool', num_workers=3, chunk_bytes=64), (words, chars))
+
+  def test_spilled_counts_are_exact(self):
+    words, chars = self.build('memory', num_workers=1)
+    spill_dir = os.path.join(self.tmp_dir, 'spill')
+    self.assertEqual(self.build('spilled', num_workers=2, chunk_bytes=64, max_words=4, spill_dir=spill_dir),
+      (words, chars))
+
+    counter = VocabCounter(max_words=2)
+    for counts in [{b'a': 1, b'b': 1}, {b'c': 3}, {b'a': 2, b'd': 1}]:
+      counter.update(counts)
+    self.assertTrue(counter.run_paths)
+    self.assertEqual(counter.vocab(2), ([b'a', b'c'], 4))
+    counter.close()
+
+  def test_char_vocab(self):
+    _, chars = self.build('chars', num_workers=1)
+    # One byte per line in order of first occurrence, without an end token
+    self.assertEqual(chars[:5], [b'w', b'h', b'a', b't', b' '])
+    self.assertEqual(sorted(chars), sorted(set(b''.join(LINES)[i:i + 1] for i in range(len(b''.join(LINES))))))
+
+  def test_jobs_share_a_pool(self):
+    jobs = []
+    for name in ['input', 'question']:
+      jobs.append(([self.dataset_path], os.path.join(self.tmp_dir, name + '_vocab.txt'), None))
+    build_vocabs(jobs, 1, num_workers=2, chunk_bytes=64)
+    self.assertEqual(read_words(jobs[0][1]), read_words(jobs[1][1]))
+    self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'input_vocab_char.txt')))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,136 @@
+"""
+Binary vocabulary format that is memory-mapped instead of parsed.
+
+Layout (little endian):
+  header   magic 'DVOC', version, number of words, hash table size, blob size
+  offsets  number of words + 1 uint32 offsets of every word in the blob
+  table    hash table size uint32 word indices, EMPTY_SLOT when unused
+  blob     bytes of every word, in vocabulary order
+
+The hash table uses open addressing with linear probing on the FNV-1a hash of a
+word. Like datasets.Vocab, a word listed twice maps to its last index. Indices
+are line numbers starting at 0 (datasets.Vocab starts at 1).
+
+Usage: python vocab_mmap.py question_vocab.txt entity_vocab.txt ...
+writes question_vocab.bin, entity_vocab.bin, ...
+"""
+import os
+import sys
+import mmap
+import struct
+
+MAGIC = b'DVOC'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIQ')
+EMPTY_SLOT = 0xFFFFFFFF
+FNV_OFFSET = 0x811c9dc5
+FNV_PRIME = 0x01000193
+
+def fnv1a(word):
+  h = FNV_OFFSET
+  for c in bytearray(word):
+    h = ((h ^ c) * FNV_PRIME) & 0xFFFFFFFF
+  return h
+
+
+def table_size_for(num_words):
+  # Power of two at least twice the number of words keeps probe sequences short
+  size = 1
+  while size < 2 * max(num_words, 1):
+    size *= 2
+  return size
+
+
+def binary_path(vocab_path):
+  return os.path.splitext(vocab_path)[0] + '.bin'
+
+
+def write_binary_vocab(words, dst_path):
+  """Writes words (bytes, in index order) in the binary format"""
+  offsets = [0]
+  for w in words:
+    offsets.append(offsets[-1] + len(w))
+  if offsets[-1] > EMPTY_SLOT or len(words) >= EMPTY_SLOT:
+    raise Exception("Vocabulary too large for the binary format: %d words, %d bytes" % (len(words), offsets[-1]))
+
+  table_size = table_size_for(len(words))
+  mask = table_size - 1
+  table = [EMPTY_SLOT] * table_size
+  for i, w in enumerate(words):
+    slot = fnv1a(w) & mask
+    while table[slot] != EMPTY_SLOT and words[table[slot]] != w:
+      slot = (slot + 1) & mask
+    table[slot] = i
+
+  with open(dst_path, 'wb') as f:
+    f.write(HEADER.pack(MAGIC, VERSION, len(words), table_size, offsets[-1]))
+    f.write(struct.pack('<%dI' % len(offsets), *offsets))
+    f.write(struct.pack('<%dI' % table_size, *table))
+    f.write(b''.join(words))
+
+
+def read_text_vocab(path):
+  """Returns the lines of a text vocabulary as bytes, like datasets.Vocab reads them"""
+  with open(path, 'rb') as f:
+    data = f.read()
+  words = data.split(b'\n')
+  if words and words[-1] == b'':
+    words.pop()
+  return words
+
+
+class MmapVocab(object):
+  """Read-only vocabulary backed by a memory-mapped binary file, shared between processes"""
+
+  def __init__(self, path):
+    self.path = path
+    with open(path, 'rb') as f:
+      self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, self.size, self.table_size, blob_size = HEADER.unpack_from(self.data, 0)
+    if magic != MAGIC or version != VERSION:
+      raise Exception("%s is not a version %d binary vocabulary" % (path, VERSION))
+    self.offsets_start = HEADER.size
+    self.table_start = self.offsets_start + 4 * (self.size + 1)
+    self.blob_start = self.table_start + 4 * self.table_size
+    self.mask = self.table_size - 1
+
+  def __len__(self):
+    return self.size
+
+  def __contains__(self, word):
+    return self.index(word) is not None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def close(self):
+    self.data.close()
+
+  def token(self, i):
+    """Returns the word at index i as bytes"""
+    if i < 0 or i >= self.size:
+      raise IndexError('Index %d out of bounds' % i)
+    start, end = struct.unpack_from('<II', self.data, self.offsets_start + 4 * i)
+    return self.data[self.blob_start + start:self.blob_start + end]
+
+  def index(self, word, default=None):
+    """Returns the index of word (bytes, or unicode encoded as utf-8), default when missing"""
+    if not isinstance(word, bytes):
+      word = word.encode('utf-8')
+    slot = fnv1a(word) & self.mask
+    while True:
+      i, = struct.unpack_from('<I', self.data, self.table_start + 4 * slot)
+      if i == EMPTY_SLOT:
+        return default
+      if self.token(i) == word:
+        return i
+      slot = (slot + 1) & self.mask
+
+
+if __name__ == '__main__':
+  for path in sys.argv[1:]:
+    write_binary_vocab(read_text_vocab(path), binary_path(path))
+    print('saved binary vocabulary to %s' % binary_path(path))
@@ -0,0 +1,85 @@
+"""
+Tests of vocab_mmap: round trips through the binary format, hash collisions and unknown tokens.
+
+Run from dmn/scripts: python -m unittest vocab_mmap_test
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from vocab_mmap import EMPTY_SLOT, MmapVocab, fnv1a, read_text_vocab, table_size_for, write_binary_vocab
+
+
+def colliding_words(num_words, mask):
+  """Returns num_words words whose hashes land in the same slot of a table of mask + 1 slots"""
+  words = []
+  i = 0
+  while len(words) < num_words:
+    word = ('w%d' % i).encode('utf-8')
+    if fnv1a(word) & mask == 0:
+      words.append(word)
+    i += 1
+  return words
+
+
+class VocabMmapTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def write(self, words):
+    path = os.path.join(self.tmp_dir, 'vocab.bin')
+    write_binary_vocab(words, path)
+    return MmapVocab(path)
+
+  def test_fnv1a(self):
+    # Reference values of 32 bit FNV-1a
+    self.assertEqual(fnv1a(b''), 0x811c9dc5)
+    self.assertEqual(fnv1a(b'a'), 0xe40c292c)
+    self.assertEqual(fnv1a(b'foobar'), 0xbf9cf968)
+    self.assertEqual(table_size_for(0), 2)
+    self.assertEqual(table_size_for(5), 16)
+
+  def test_round_trip(self):
+    text_path = os.path.join(self.tmp_dir, 'vocab.txt')
+    with open(text_path, 'wb') as f:
+      f.write(u'.\nwhat\nfearless\n\u00e9t\u00e9\n'.encode('utf-8'))
+    words = read_text_vocab(text_path)
+    self.assertEqual(words, [b'.', b'what', b'fearless', u'\u00e9t\u00e9'.encode('utf-8')])
+
+    with self.write(words) as vocab:
+      self.assertEqual(len(vocab), 4)
+      self.assertEqual([vocab.token(i) for i in range(len(vocab))], words)
+      self.assertEqual([vocab.index(word) for word in words], [0, 1, 2, 3])
+      self.assertEqual(vocab.index(u'\u00e9t\u00e9'), 3)
+      self.assertRaises(IndexError, vocab.token, 4)
+
+  def test_collisions_and_unknown_tokens(self):
+    words = colliding_words(5, table_size_for(5) - 1)
+    with self.write(words) as vocab:
+      # Every word probes past the ones hashed to the same slot before it
+      self.assertEqual([vocab.index(word) for word in words], list(range(5)))
+
+      unknown = colliding_words(6, vocab.mask)[5]
+      self.assertNotIn(unknown, vocab)
+      self.assertEqual(vocab.index(unknown), None)
+      self.assertEqual(vocab.index(b'fearless', EMPTY_SLOT), EMPTY_SLOT)
+
+  def test_duplicates_map_to_last_index(self):
+    with self.write([b'a', b'b', b'a']) as vocab:
+      self.assertEqual(vocab.index(b'a'), 2)
+      self.assertEqual(vocab.token(0), b'a')
+
+  def test_rejects_other_files(self):
+    path = os.path.join(self.tmp_dir, 'vocab.txt')
+    with open(path, 'wb') as f:
+      f.write(b'not a binary vocabulary at all\n')
+    self.assertRaises(Exception, MmapVocab, path)
+
+
+if __name__ == '__main__':
+  unittest.main()
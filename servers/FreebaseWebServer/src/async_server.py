@@ -0,0 +1,33 @@
+# Serves the same app as server.py on gevent, so thousands of in-flight lookups
+# share one process. Patching has to happen before anything opens sockets.
+from gevent import monkey
+monkey.patch_all()
+
+import gevent
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+
+import config
+from server import server
+from prefork_server import local_backends, preload
+from util.executor_backend import with_executor
+
+
+def use_executor():
+    """Moves local backend lookups, which block on numpy, off the event loop.
+    Elasticsearch lookups already yield on their patched sockets.
+    """
+    if not local_backends(config.FREEBASE_HELPER):
+        return
+
+    # Build the indices up front instead of in whichever thread asks first
+    preload()
+    threadpool = gevent.get_hub().threadpool
+    threadpool.maxsize = config.FREEBASE_EXECUTOR_THREADS
+    config.FREEBASE_HELPER = with_executor(config.FREEBASE_HELPER, threadpool)
+
+
+if __name__ == '__main__':
+    use_executor()
+    http_server = WSGIServer((config.HOST, config.PORT), server, spawn=Pool(config.ASYNC_MAX_CONNECTIONS))
+    http_server.serve_forever()
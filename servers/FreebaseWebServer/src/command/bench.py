@@ -0,0 +1,109 @@
+import os
+import json
+import threading
+from flask.ext.script import Manager
+
+import config
+from util import replay_bench
+from util.lookup_cache import CachedFreebaseHelper
+
+
+bench_manager = Manager(usage='Benchmark the freebase endpoints')
+
+SIMPLE_QUESTIONS_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    '..', '..', '..', '..', 'datasets', 'SimpleQuestions'))
+
+
+def local_requester():
+    """Sends requests to the app in this process, one test client per thread"""
+    from server import server
+    clients = threading.local()
+
+    def request(method, path, body):
+        if not hasattr(clients, 'client'):
+            clients.client = server.test_client()
+        if method == 'POST':
+            response = clients.client.post(path, data=json.dumps(body), content_type='application/json')
+        else:
+            response = clients.client.get(path)
+        if response.status_code != 200:
+            raise Exception("Request to %s failed with status %d" % (path, response.status_code))
+        return json.loads(response.data.decode('utf-8'))
+    return request
+
+
+def remote_requester(url):
+    """Sends requests to a running server"""
+    import requests
+    session = requests.Session()
+
+    def request(method, path, body):
+        if method == 'POST':
+            response = session.post(url + path, data=json.dumps(body), headers={'Content-Type': 'application/json'})
+        else:
+            response = session.get(url + path)
+        response.raise_for_status()
+        return response.json()
+    return request
+
+
+@bench_manager.option('-d', '--dataset', dest='dataset_dir', default=SIMPLE_QUESTIONS_DIR,
+                      help='SimpleQuestions directory with annotated_fb_data_test.txt and test/')
+@bench_manager.option('-m', '--mode', dest='mode', choices=['questions', 'queries'], default='questions',
+                      help='Replay test/questions.txt expanded to n-grams, or test/queries.txt as is')
+@bench_manager.option('-n', '--ngrams', dest='max_ngrams', type=int, default=3,
+                      help='Longest n-gram built from every question')
+@bench_manager.option('-r', '--num-results', dest='num_results', type=int, default=1000,
+                      help='Names requested per candidate query')
+@bench_manager.option('-f', '--num-facts', dest='num_facts', type=int, default=10000,
+                      help='Facts requested per question')
+@bench_manager.option('-c', '--concurrency', dest='concurrency', type=int, nargs='+', default=[1],
+                      help='Concurrent questions, every value is a separate run')
+@bench_manager.option('-l', '--limit', dest='limit', type=int, default=None,
+                      help='Only replay the first questions')
+@bench_manager.option('--cache-size', dest='cache_size', type=int, default=0,
+                      help='Entries of the lookup cache in front of the local backend')
+@bench_manager.option('-u', '--url', dest='url', default=None,
+                      help='Replay against a running server instead of a local backend')
+@bench_manager.option('-o', '--output', dest='output_path', default=None,
+                      help='JSON file to save the results to')
+def replay(dataset_dir, mode, max_ngrams, num_results, num_facts, concurrency, limit, cache_size, url, output_path):
+    """Replay SimpleQuestions test questions through the name and fact endpoints"""
+    if mode == 'questions':
+        questions = replay_bench.read_lines(os.path.join(dataset_dir, 'test', 'questions.txt'), limit)
+        workload = replay_bench.question_workload(questions, max_ngrams)
+    else:
+        queries = replay_bench.read_lines(os.path.join(dataset_dir, 'test', 'queries.txt'), limit)
+        workload = replay_bench.query_workload(queries)
+
+    counter = None
+    if url is None:
+        counter = replay_bench.CountingBackend(replay_bench.load_simple_questions(dataset_dir))
+        config.FREEBASE_HELPER = counter
+        if cache_size > 0:
+            config.FREEBASE_HELPER = CachedFreebaseHelper(counter, max_entries=cache_size)
+        request = local_requester()
+    else:
+        request = remote_requester(url.rstrip('/'))
+
+    benchmark = replay_bench.ReplayBenchmark(request, counter, num_results, num_facts)
+    runs = []
+    for num_threads in concurrency:
+        results = benchmark.run(workload, num_threads)
+        print('concurrency %d: %.1f questions/sec, p50 %.1f ms, p95 %.1f ms, p99 %.1f ms, '
+              '%s backend calls/question, peak rss %s MB' % (
+                  num_threads, results['questions_per_sec'], results['latency_ms']['p50'],
+                  results['latency_ms']['p95'], results['latency_ms']['p99'],
+                  results['backend_calls_per_question'], results['peak_rss_mb']))
+        runs.append(results)
+
+    if output_path is not None:
+        replay_bench.save_results({
+            'mode': mode,
+            'max_ngrams': max_ngrams,
+            'num_results': num_results,
+            'num_facts': num_facts,
+            'cache_size': cache_size,
+            'backend': url or 'local',
+            'runs': runs
+        }, output_path)
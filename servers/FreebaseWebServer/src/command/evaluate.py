@@ -0,0 +1,86 @@
+import os
+import json
+from multiprocessing import Pool, cpu_count
+from flask.ext.script import Manager
+
+import config
+from command.bench import SIMPLE_QUESTIONS_DIR, local_requester, remote_requester
+from util import replay_bench, sq_eval
+
+
+eval_manager = Manager(usage='Evaluate question answering on the SimpleQuestions test set')
+
+# Set in the parent before the pool forks, so workers share the loaded backend
+worker_options = {}
+
+
+def answer_shard(shard_range):
+    shard, start, end = shard_range
+    url = worker_options['url']
+    request = local_requester() if url is None else remote_requester(url)
+    predictor = sq_eval.LinkPredictor(request, worker_options['max_ngrams'], worker_options['num_results'],
+                                      worker_options['num_facts'])
+    num_answered = sq_eval.run_shard(predictor, worker_options['questions'], shard, start, end,
+                                     worker_options['output_dir'])
+    return shard, num_answered
+
+
+def save_scores(scores, output_dir):
+    print('entity %.4f, predicate %.4f, fact %.4f, parse %.4f over %d questions' % (
+        scores['entity_accuracy'], scores['predicate_accuracy'], scores['fact_accuracy'],
+        scores['accuracy'], scores['questions']))
+    with open(os.path.join(output_dir, 'scores.json'), 'w') as f:
+        json.dump(scores, f, indent=2, sort_keys=True)
+
+
+@eval_manager.option('-d', '--dataset', dest='dataset_dir', default=SIMPLE_QUESTIONS_DIR,
+                     help='SimpleQuestions directory with annotated_fb_data_test.txt and test/')
+@eval_manager.option('-o', '--output', dest='output_dir', required=True,
+                     help='Directory for shard checkpoints, merged predictions and scores')
+@eval_manager.option('-s', '--shards', dest='num_shards', type=int, default=64,
+                     help='Number of shards the questions are split into')
+@eval_manager.option('-w', '--workers', dest='num_workers', type=int, default=cpu_count(),
+                     help='Processes answering shards concurrently')
+@eval_manager.option('-l', '--limit', dest='limit', type=int, default=None,
+                     help='Only answer the first questions')
+@eval_manager.option('-n', '--ngrams', dest='max_ngrams', type=int, default=3)
+@eval_manager.option('-r', '--num-results', dest='num_results', type=int, default=10)
+@eval_manager.option('-f', '--num-facts', dest='num_facts', type=int, default=5000)
+@eval_manager.option('-u', '--url', dest='url', default=None,
+                     help='Answer against a running server instead of a local backend')
+def run(dataset_dir, output_dir, num_shards, num_workers, limit, max_ngrams, num_results, num_facts, url):
+    """Answer the test questions in sharded processes, then merge and score the predictions"""
+    questions = [question.strip() for question in
+                 sq_eval.read_lines(os.path.join(dataset_dir, 'test', 'questions.txt'))][:limit]
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    if url is None:
+        config.FREEBASE_HELPER = replay_bench.load_simple_questions(dataset_dir)
+    worker_options.update(questions=questions, output_dir=output_dir, url=url,
+                          max_ngrams=max_ngrams, num_results=num_results, num_facts=num_facts)
+
+    shards = sq_eval.shard_ranges(len(questions), num_shards)
+    pool = Pool(num_workers)
+    try:
+        for shard, num_answered in pool.imap_unordered(
+                answer_shard, [(shard, start, end) for shard, (start, end) in enumerate(shards)]):
+            print('Finished shard %d, answered %d questions' % (shard, num_answered))
+    finally:
+        pool.close()
+        pool.join()
+
+    predictions = sq_eval.merge_shards(output_dir, len(shards))
+    sq_eval.write_predictions(predictions, output_dir)
+    save_scores(sq_eval.score_predictions(sq_eval.load_gold(dataset_dir), predictions), output_dir)
+
+
+@eval_manager.option('-d', '--dataset', dest='dataset_dir', default=SIMPLE_QUESTIONS_DIR,
+                     help='SimpleQuestions directory with annotated_fb_data_test.txt and test/')
+@eval_manager.option('-p', '--predictions', dest='prediction_dir', required=True,
+                     help='Directory with predictions_*_<start_index>.txt of evaluate_sq_fb_dataset_v2.lua runs')
+def score(dataset_dir, prediction_dir):
+    """Merge and score the predictions of Lua evaluation runs"""
+    predictions = sq_eval.read_lua_predictions(prediction_dir)
+    sq_eval.write_predictions(predictions, prediction_dir)
+    save_scores(sq_eval.score_predictions(sq_eval.load_gold(dataset_dir), predictions), prediction_dir)
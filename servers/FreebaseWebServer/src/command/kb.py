@@ -0,0 +1,224 @@
+import os
+from collections import OrderedDict
+from flask.ext.script import Manager
+from six.moves.urllib.parse import urlencode
+
+import config
+from command.bench import SIMPLE_QUESTIONS_DIR, local_requester
+from util import bulk_ingest, fact_store, ngrams, replay_bench, snapshot
+from util.bulk_ingest import BulkIngester
+from util.candidate_store import CandidateStore, CandidateStoreBackend
+from util.freebase_helper import FreebaseHelper
+from util.index_router import IndexRouter
+from util.local_freebase_helper import read_names, read_triples
+from util.lookup_cache import CachedFreebaseHelper
+from util.name_index import ShingleNameIndex
+from util.predicate_index import PredicateSetIndex
+from util.trigram_index import TrigramNameIndex
+
+
+kb_manager = Manager(usage='Build local knowledge base files')
+
+
+@kb_manager.option('-f', '--facts', dest='fact_paths', nargs='+', required=True,
+                   help='Triple files in the annotated_fb_data_*.txt / FB_2M / FB_5M format')
+@kb_manager.option('-n', '--names', dest='name_paths', nargs='*', default=[],
+                   help='freebase_id <tab> name files')
+@kb_manager.option('-o', '--output', dest='store_dir', required=True,
+                   help='Directory to write the fact store to')
+def build_fact_store(fact_paths, name_paths, store_dir):
+    """Build a memory-mapped fact store from triple files"""
+    store = fact_store.build_fact_store(fact_paths, store_dir, name_paths)
+    print('Fact store has %d entities and %d facts' % (len(store), store.num_facts))
+
+
+@kb_manager.option('-n', '--names', dest='name_paths', nargs='+', required=True,
+                   help='freebase_id <tab> name [<tab> description] files')
+@kb_manager.option('-o', '--output', dest='index_dir', required=True,
+                   help='Directory to write the name index to')
+def build_name_index(name_paths, index_dir):
+    """Build a shingle BM25 index over entity names and descriptions"""
+    # Later files override names of earlier ones, like LocalFreebaseHelper.load_names
+    documents = OrderedDict()
+    for name_path in name_paths:
+        for freebase_id, name, description in read_names(name_path):
+            documents[freebase_id] = (freebase_id, name, description)
+    index = ShingleNameIndex.build(documents.values(), index_dir)
+    print('Name index has %d documents' % index.num_docs)
+
+
+@kb_manager.option('-n', '--names', dest='name_paths', nargs='+', required=True,
+                   help='freebase_id <tab> name [<tab> description] files')
+@kb_manager.option('-o', '--output', dest='index_dir', required=True,
+                   help='Directory to write the trigram index to')
+def build_trigram_index(name_paths, index_dir):
+    """Build a character trigram index over entity names for fuzzy lookups"""
+    names = OrderedDict()
+    for name_path in name_paths:
+        for freebase_id, name, _ in read_names(name_path):
+            names[freebase_id] = name
+    index = TrigramNameIndex.build(names.items(), index_dir)
+    print('Trigram index has %d names' % index.num_docs)
+
+
+@kb_manager.option('-f', '--facts', dest='fact_paths', nargs='*', default=[],
+                   help='Triple files in the annotated_fb_data_*.txt / FB_2M / FB_5M format')
+@kb_manager.option('-s', '--store', dest='store_dir', default=None,
+                   help='Fact store written by build_fact_store, read instead of triple files')
+@kb_manager.option('-o', '--output', dest='index_dir', required=True,
+                   help='Directory to write the predicate set index to')
+def build_predicate_index(fact_paths, store_dir, index_dir):
+    """Build the distinct predicates of every subject for /api/v1/freebase/predicates"""
+    if store_dir:
+        index = PredicateSetIndex.from_fact_store(fact_store.FactStore(store_dir), index_dir)
+    elif fact_paths:
+        index = PredicateSetIndex.build((triple for fact_path in fact_paths for triple in read_triples(fact_path)),
+                                        index_dir)
+    else:
+        raise Exception("Must specify triple files or a fact store")
+    print('Predicate set index has %d subjects and %d predicates' % (len(index.entities), len(index.predicates)))
+
+
+def ingest_helper(kb, create):
+    helper = FreebaseHelper(config.FREEBASE_IP, create_index=False, timeout=300)
+    helper.set_index(kb)
+    if create:
+        helper.create_indeces()
+    return helper
+
+
+@kb_manager.option('-n', '--names', dest='name_paths', nargs='+', required=True,
+                   help='freebase_id <tab> name [<tab> description] files')
+@kb_manager.option('-k', '--kb', dest='kb', default=FreebaseHelper.FREEBASE_2M,
+                   help='Index set to load, FB_2M or FB_5M')
+@kb_manager.option('-w', '--workers', dest='num_workers', type=int, default=4)
+@kb_manager.option('-c', '--chunk-size', dest='chunk_size', type=int, default=5000)
+@kb_manager.option('--checkpoint', dest='checkpoint_path', default=None,
+                   help='File recording finished chunks, an interrupted load resumes from it')
+@kb_manager.option('--create', dest='create', action='store_true', default=False,
+                   help='Delete and create the names and facts indices first')
+def ingest_names(name_paths, kb, num_workers, chunk_size, checkpoint_path, create):
+    """Stream names into the elasticsearch names index with parallel bulk workers"""
+    helper = ingest_helper(kb, create)
+    ingester = BulkIngester(helper.es, helper.name_index, 'name', chunk_size, num_workers, checkpoint_path)
+    ingester.ingest(bulk_ingest.name_documents(name_paths))
+
+
+@kb_manager.option('-f', '--facts', dest='fact_paths', nargs='+', required=True,
+                   help='Triple files in the annotated_fb_data_*.txt / FB_2M / FB_5M format')
+@kb_manager.option('-n', '--names', dest='name_paths', nargs='*', default=[],
+                   help='freebase_id <tab> name files used to name subjects and objects')
+@kb_manager.option('-k', '--kb', dest='kb', default=FreebaseHelper.FREEBASE_2M,
+                   help='Index set to load, FB_2M or FB_5M')
+@kb_manager.option('-w', '--workers', dest='num_workers', type=int, default=4)
+@kb_manager.option('-c', '--chunk-size', dest='chunk_size', type=int, default=5000)
+@kb_manager.option('--checkpoint', dest='checkpoint_path', default=None,
+                   help='File recording finished chunks, an interrupted load resumes from it')
+def ingest_facts(fact_paths, name_paths, kb, num_workers, chunk_size, checkpoint_path):
+    """Stream triples into the elasticsearch facts index with parallel bulk workers"""
+    names = {}
+    for name_path in name_paths:
+        for freebase_id, name, _ in read_names(name_path):
+            names[freebase_id] = name
+
+    helper = ingest_helper(kb, create=False)
+    ingester = BulkIngester(helper.es, helper.fact_index, 'fact', chunk_size, num_workers, checkpoint_path)
+    ingester.ingest(bulk_ingest.fact_documents(fact_paths, names))
+
+
+@kb_manager.option('-k', '--kb', dest='kb', default=FreebaseHelper.FREEBASE_2M,
+                   help='Index set to export, FB_2M or FB_5M')
+@kb_manager.option('-t', '--type', dest='doc_type', choices=['name', 'fact'], required=True,
+                   help='Export the names or the facts index')
+@kb_manager.option('-o', '--output', dest='snapshot_path', required=True,
+                   help='Snapshot file, an interrupted export resumes into it')
+@kb_manager.option('-s', '--slices', dest='num_slices', type=int, default=8,
+                   help='Scroll slices read in parallel, one thread each')
+@kb_manager.option('-c', '--chunk-size', dest='chunk_size', type=int, default=1000,
+                   help='Documents per scroll page and snapshot chunk')
+def export_snapshot(kb, doc_type, snapshot_path, num_slices, chunk_size):
+    """Export the names or facts index into a compressed snapshot file with a sliced scroll"""
+    helper = ingest_helper(kb, create=False)
+    index = helper.name_index if doc_type == 'name' else helper.fact_index
+    snapshot.SnapshotExporter(helper.es, index, doc_type, snapshot_path, num_slices, chunk_size).export()
+    print('Snapshot has %d docs, sha256 %s' % tuple(snapshot.snapshot_info(snapshot_path)[key]
+                                                    for key in ('num_docs', 'sha256')))
+
+
+@kb_manager.option('-s', '--snapshot', dest='snapshot_path', required=True)
+@kb_manager.option('-k', '--kb', dest='kb', default=FreebaseHelper.FREEBASE_2M,
+                   help='Index set to load, FB_2M or FB_5M')
+@kb_manager.option('-w', '--workers', dest='num_workers', type=int, default=4)
+@kb_manager.option('-c', '--chunk-size', dest='chunk_size', type=int, default=5000)
+@kb_manager.option('--checkpoint', dest='checkpoint_path', default=None,
+                   help='File recording finished chunks, an interrupted load resumes from it')
+@kb_manager.option('--create', dest='create', action='store_true', default=False,
+                   help='Delete and create the names and facts indices first')
+def import_snapshot(snapshot_path, kb, num_workers, chunk_size, checkpoint_path, create):
+    """Load a snapshot into the elasticsearch index of its type with parallel bulk workers"""
+    doc_type = snapshot.snapshot_info(snapshot_path)['doc_type']
+    helper = ingest_helper(kb, create)
+    index = helper.name_index if doc_type == 'name' else helper.fact_index
+    ingester = BulkIngester(helper.es, index, doc_type, chunk_size, num_workers, checkpoint_path)
+    ingester.ingest(snapshot.read_snapshot(snapshot_path, verify=False))
+
+
+@kb_manager.option('-s', '--snapshot', dest='snapshot_path', required=True)
+@kb_manager.option('-o', '--output', dest='output_path', required=True,
+                   help='Name file or triple file to write, for FREEBASE_NAME_PATHS / FREEBASE_FACT_PATHS')
+def snapshot_to_text(snapshot_path, output_path):
+    """Write a names snapshot as a name file, or a facts snapshot as a triple file"""
+    num_lines = 0
+    with open(output_path, 'wb') as f:
+        for line in snapshot.snapshot_lines(snapshot_path):
+            f.write(line)
+            num_lines += 1
+    print('Wrote %d lines to %s' % (num_lines, output_path))
+
+
+@kb_manager.option('-o', '--output', dest='store_path', required=True,
+                   help='sqlite file of the store, lookups it already has are not repeated')
+@kb_manager.option('-q', '--questions', dest='questions_path',
+                   default=os.path.join(SIMPLE_QUESTIONS_DIR, 'test', 'questions.txt'))
+@kb_manager.option('-n', '--ngrams', dest='max_ngrams', type=int, default=3)
+@kb_manager.option('-r', '--num-results', dest='num_results', type=int, default=10)
+@kb_manager.option('-f', '--num-facts', dest='num_facts', type=int, default=5000)
+@kb_manager.option('-p', '--num-results-per-topic', dest='num_results_per_topic', type=int, default=10)
+@kb_manager.option('-b', '--batch-size', dest='batch_size', type=int, default=500,
+                   help='N-grams sent to the backend per name lookup')
+def build_candidate_store(store_path, questions_path, max_ngrams, num_results, num_facts, num_results_per_topic,
+                          batch_size):
+    """Store the name and fact lookups of linking every question, for FREEBASE_CANDIDATE_STORE"""
+    from resource.freebase import get_names_batch
+    # Queries reach the resources as unicode
+    questions = [question.strip().decode('utf-8') if isinstance(question, bytes) else question.strip()
+                 for question in replay_bench.read_lines(questions_path)]
+
+    # The store is built for the default index, from the backend behind its cache and store
+    backend = config.FREEBASE_HELPER
+    if isinstance(backend, IndexRouter):
+        backend = backend.default
+    while isinstance(backend, (CachedFreebaseHelper, CandidateStoreBackend)):
+        backend = backend.backend
+    store_backend = CandidateStoreBackend(backend, CandidateStore(store_path), write=True)
+    config.FREEBASE_HELPER = store_backend
+
+    # Names of every distinct n-gram first, in large batches
+    unique_queries = list(OrderedDict.fromkeys(
+        query for question in questions for query in ngrams.question_ngrams(question, max_ngrams)))
+    for i in range(0, len(unique_queries), batch_size):
+        get_names_batch(unique_queries[i:i + batch_size], num_results)
+    print('Looked up %d distinct n-grams of %d questions' % (len(unique_queries), len(questions)))
+
+    # Then the facts of the entities linked in every question, the names are served by the store
+    request = local_requester()
+    for i, question in enumerate(questions):
+        request('GET', '/api/v1/freebase/link?' + urlencode({
+            'question': question.encode('utf-8'), 'ngrams': max_ngrams, 'num_results': num_results,
+            'num_facts': num_facts, 'num_results_per_topic': num_results_per_topic}), None)
+        if (i + 1) % 1000 == 0:
+            print('Linked %d questions' % (i + 1))
+
+    stats = store_backend.stats()
+    print('Candidate store has %d name and %d fact lookups, %d lookups went to the backend' % (
+        stats['names'], stats['facts'], stats['misses']))
@@ -1,5 +1,9 @@
-import os, logging
+import os, logging, multiprocessing
 from util.freebase_helper import FreebaseHelper
+from util.local_freebase_helper import LocalFreebaseHelper
+from util.lookup_cache import CachedFreebaseHelper
+from util.candidate_store import CandidateStore, CandidateStoreBackend
+from util.index_router import IndexRouter
 
 DEBUG = True
 HOST = os.getenv('HOST', '0.0.0.0')
@@ -20,12 +24,108 @@ logging.basicConfig(
     datefmt='%d/%m/%y %H:%M:%S',
 )
 
-FREEBASE_HELPER = FreebaseHelper(
-    ip_addresses=FreebaseHelper.FREEBASE_IP, 
-    create_index=False,
-    timeout=60 #['192.168.99.100:32769'], False
-)
+# Either 'elasticsearch' or 'local' for the in-memory backend loaded from triple files
+FREEBASE_BACKEND = os.getenv('FREEBASE_BACKEND', 'elasticsearch')
+# Comma separated host:port elasticsearch nodes
+FREEBASE_IP = os.getenv('FREEBASE_IP', FreebaseHelper.FREEBASE_IP)
+
+# Connections per node, seconds between node sniffing (0 disables it), and timeouts in seconds
+FREEBASE_POOL_SIZE = int(os.getenv('FREEBASE_POOL_SIZE', '10'))
+FREEBASE_SNIFF_INTERVAL = float(os.getenv('FREEBASE_SNIFF_INTERVAL', '0')) or None
+FREEBASE_TIMEOUT = float(os.getenv('FREEBASE_TIMEOUT', '60'))
+FREEBASE_NAME_TIMEOUT = float(os.getenv('FREEBASE_NAME_TIMEOUT', '0')) or None
+FREEBASE_FACT_TIMEOUT = float(os.getenv('FREEBASE_FACT_TIMEOUT', '0')) or None
+
+# Reads slower than this latency percentile are duplicated on a second node, 0 disables hedging
+FREEBASE_HEDGE_PERCENTILE = float(os.getenv('FREEBASE_HEDGE_PERCENTILE', '0')) or None
+
+# Comma separated files in the annotated_fb_data_*.txt format, and freebase_id <tab> name files
+FREEBASE_FACT_PATHS = [path for path in os.getenv('FREEBASE_FACT_PATHS', '').split(',') if path]
+FREEBASE_NAME_PATHS = [path for path in os.getenv('FREEBASE_NAME_PATHS', '').split(',') if path]
+
+# Directory written by `manage.py kb build_fact_store`, replaces FREEBASE_FACT_PATHS when set
+FREEBASE_FACT_STORE = os.getenv('FREEBASE_FACT_STORE')
+
+# Directory written by `manage.py kb build_name_index`, built from FREEBASE_NAME_PATHS when unset
+FREEBASE_NAME_INDEX = os.getenv('FREEBASE_NAME_INDEX')
+
+# Directory written by `manage.py kb build_trigram_index` for fuzzy name lookups. The elasticsearch
+# backend reads it for FREEBASE_INDEX only, the local one builds it from FREEBASE_NAME_PATHS when unset
+FREEBASE_FUZZY_INDEX = os.getenv('FREEBASE_FUZZY_INDEX')
+
+# Directory written by `manage.py kb build_predicate_index` for /api/v1/freebase/predicates. The
+# elasticsearch backend reads it for FREEBASE_INDEX and aggregates the facts of other indices,
+# the local one builds it from its facts when unset
+FREEBASE_PREDICATE_INDEX = os.getenv('FREEBASE_PREDICATE_INDEX')
+
+# Knowledge bases served by the elasticsearch backend, picked per request with index=
+# (or index=both to query all of them), and the one used when a request does not pick one
+FREEBASE_INDICES = [index for index in os.getenv('FREEBASE_INDICES', FreebaseHelper.FREEBASE_2M).split(',') if index]
+FREEBASE_INDEX = os.getenv('FREEBASE_INDEX', FREEBASE_INDICES[0])
+
+# sqlite file written by `manage.py kb build_candidate_store`, checked before the backend
+FREEBASE_CANDIDATE_STORE = os.getenv('FREEBASE_CANDIDATE_STORE')
+
+# Name and fact lookup cache of up to FREEBASE_CACHE_SIZE entries per index and worker, off (0) by default
+FREEBASE_CACHE_SIZE = int(os.getenv('FREEBASE_CACHE_SIZE', '0'))
+FREEBASE_CACHE_MAX_BYTES = int(os.getenv('FREEBASE_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))
+FREEBASE_CACHE_TTL = float(os.getenv('FREEBASE_CACHE_TTL', '0')) or None
+
+# /api/v1/freebase/expand: most facts read per entity in a hop, elasticsearch rejects top_hits
+# above index.max_inner_result_window (100 by default), and most entities expanded in a hop
+FREEBASE_EXPAND_MAX_FANOUT = int(os.getenv('FREEBASE_EXPAND_MAX_FANOUT', '100'))
+FREEBASE_EXPAND_MAX_FRONTIER = int(os.getenv('FREEBASE_EXPAND_MAX_FRONTIER', '1000'))
+
+def wrap_backend(backend, default_index=True):
+    """ Puts the candidate store (built for the default index) and the lookup cache in front of backend """
+    if FREEBASE_CANDIDATE_STORE and default_index:
+        backend = CandidateStoreBackend(backend, CandidateStore(FREEBASE_CANDIDATE_STORE))
+
+    if FREEBASE_CACHE_SIZE > 0:
+        backend = CachedFreebaseHelper(
+            backend,
+            max_entries=FREEBASE_CACHE_SIZE,
+            max_bytes=FREEBASE_CACHE_MAX_BYTES,
+            ttl=FREEBASE_CACHE_TTL
+        )
+    return backend
+
+if FREEBASE_BACKEND == 'local':
+    FREEBASE_HELPER = wrap_backend(LocalFreebaseHelper(
+        fact_paths=FREEBASE_FACT_PATHS,
+        name_paths=FREEBASE_NAME_PATHS,
+        fact_store_path=FREEBASE_FACT_STORE,
+        name_index_path=FREEBASE_NAME_INDEX,
+        fuzzy_index_path=FREEBASE_FUZZY_INDEX,
+        predicate_index_path=FREEBASE_PREDICATE_INDEX
+    ))
+else:
+    es_helper = FreebaseHelper(
+        ip_addresses=FREEBASE_IP, 
+        create_index=False,
+        timeout=FREEBASE_TIMEOUT, #['192.168.99.100:32769'], False
+        maxsize=FREEBASE_POOL_SIZE,
+        sniff_interval=FREEBASE_SNIFF_INTERVAL,
+        name_timeout=FREEBASE_NAME_TIMEOUT,
+        fact_timeout=FREEBASE_FACT_TIMEOUT,
+        hedge_percentile=FREEBASE_HEDGE_PERCENTILE
+    )
+
+    # Every index gets its own helper over the shared connections and its own cache
+    FREEBASE_HELPER = IndexRouter([(index, wrap_backend(
+        es_helper.index_view(index, FREEBASE_PREDICATE_INDEX if index == FREEBASE_INDEX else None,
+            FREEBASE_FUZZY_INDEX if index == FREEBASE_INDEX else None),
+        index == FREEBASE_INDEX)) for index in FREEBASE_INDICES], FREEBASE_INDEX)
+
+# async_server.py: greenlets serving requests at once, and threads running local backend lookups
+ASYNC_MAX_CONNECTIONS = int(os.getenv('ASYNC_MAX_CONNECTIONS', '10000'))
+FREEBASE_EXECUTOR_THREADS = int(os.getenv('FREEBASE_EXECUTOR_THREADS', '4'))
 
-FREEBASE_HELPER.set_index(FreebaseHelper.FREEBASE_2M)
+# prefork_server.py: worker processes, requests after which a worker is replaced (0 never) plus
+# up to a random jitter, and seconds stopping workers get to finish their requests
+PREFORK_WORKERS = int(os.getenv('PREFORK_WORKERS', str(multiprocessing.cpu_count())))
+PREFORK_MAX_REQUESTS = int(os.getenv('PREFORK_MAX_REQUESTS', '0'))
+PREFORK_MAX_REQUESTS_JITTER = int(os.getenv('PREFORK_MAX_REQUESTS_JITTER', '0'))
+PREFORK_GRACEFUL_TIMEOUT = float(os.getenv('PREFORK_GRACEFUL_TIMEOUT', '30'))
 
 SUPERHERO_API_URL = os.getenv('HOST', '127.0.0.1:5001')
@@ -4,6 +4,9 @@ from flask.ext.migrate import Migrate, MigrateCommand
 
 import config
 from model.abc import db
+from command.kb import kb_manager
+from command.bench import bench_manager
+from command.evaluate import eval_manager
 
 server = Flask(__name__)
 server.debug = config.DEBUG
@@ -13,6 +16,9 @@ db.init_app(server)
 migrate = Migrate(server, db)
 manager = Manager(server)
 manager.add_command('db', MigrateCommand)
+manager.add_command('kb', kb_manager)
+manager.add_command('bench', bench_manager)
+manager.add_command('eval', eval_manager)
 
 if __name__ == '__main__':
     manager.run()
@@ -0,0 +1,74 @@
+# Production entry point: loads the knowledge base once in the parent and forks
+# workers serving the app, so its indices are shared copy-on-write between them.
+#   kill -HUP <pid>: re-read the knowledge base data files, then replace the workers
+#   kill -TTIN/-TTOU <pid>: add or remove a worker
+import gc
+from six.moves import reload_module
+
+import config
+from server import server
+from util.prefork import PreforkServer
+from util.es_pool import reset_connections
+from util.freebase_helper import FreebaseHelper
+from util.index_router import IndexRouter
+from util.local_freebase_helper import LocalFreebaseHelper
+
+
+def find_backends(helper, backend_class):
+    """Returns the backend_class backends behind the router and the wrappers of helper"""
+    if isinstance(helper, IndexRouter):
+        return [backend for index_helper in helper.backends.values()
+                for backend in find_backends(index_helper, backend_class)]
+    if isinstance(helper, backend_class):
+        return [helper]
+    backend = getattr(helper, '__dict__', {}).get('backend')
+    return find_backends(backend, backend_class) if backend is not None else []
+
+
+def local_backends(helper):
+    """Returns the local backends behind the router and the wrappers of helper"""
+    return find_backends(helper, LocalFreebaseHelper)
+
+
+def preload():
+    """Builds the indices the local backend otherwise builds on the first query of every worker"""
+    for backend in local_backends(config.FREEBASE_HELPER):
+        backend.build_name_index()
+        backend.build_fuzzy_index()
+        backend.build_predicate_index()
+    # Collect the garbage of building them once here instead of in every worker
+    gc.collect()
+
+
+def reset_worker_connections():
+    """Gives a forked worker its own elasticsearch connections. The parent connected them,
+    and when sniffing on start their keep-alive sockets would be shared by every worker"""
+    clients = {}
+    for backend in find_backends(config.FREEBASE_HELPER, FreebaseHelper):
+        for client in backend.clients():
+            clients[id(client)] = client
+    for client in clients.values():
+        reset_connections(client)
+
+
+def reload_knowledge_base():
+    """Rebuilds config.FREEBASE_HELPER, re-reading its data files, resources read it on every request.
+    The environment is the one the parent started with"""
+    reload_module(config)
+    preload()
+
+
+if __name__ == '__main__':
+    server.debug = False
+    preload()
+    PreforkServer(
+        server,
+        config.HOST,
+        config.PORT,
+        num_workers=config.PREFORK_WORKERS,
+        max_requests=config.PREFORK_MAX_REQUESTS,
+        max_requests_jitter=config.PREFORK_MAX_REQUESTS_JITTER,
+        graceful_timeout=config.PREFORK_GRACEFUL_TIMEOUT,
+        reload=reload_knowledge_base,
+        post_fork=reset_worker_connections
+    ).serve_forever()
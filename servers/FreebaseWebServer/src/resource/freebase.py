@@ -1,83 +1,439 @@
 from flask import jsonify
-from flask.ext.restful import Resource
-from flask import request 
+from flask.ext.restful import Resource, abort
+from flask import request, Response
 from flask_restful import reqparse
 
 import re
+import six
+import itertools
+from collections import OrderedDict
 from model.abc import db
 from model import User
 import config
-from util.freebase import FreebaseObject, FreebaseFact 
+from util.freebase import FreebaseObject, FreebaseFact, FactBatch
+from util.lookup_cache import CachedFreebaseHelper
+from util.predicate_index import PredicateFilter
 import util.tokenizer as tokenizer
+import util.response_format as response_format
+from util import metrics, ngrams
 
 
-class FreebaseNameAPI(Resource):
-	# Gets all of the names for specified query
-    def get(self):
-    	# Get query and number of desired results
-        #try:
-        query = request.args.get('query')
-        remove_stopwords = request.args.get('remove_stopwords')
-
+def normalize_name_query(query):
+    """ Returns the accent-free query and the stopword-free query sent to the backend """
+    with metrics.stage('normalize'):
         # Replace '\''
         query = query.replace('\'', " ")
         query = tokenizer.replace_accents(query.encode('utf-8'))
 
         removed_stopwords_query = tokenizer.remove_stopwords(query)
-    	num_results = request.args.get('num_results')
+    return query, removed_stopwords_query
+
+
+def int_arg(args, name, default):
+    """ Returns the integer value of the name arg, default when it is not given """
+    value = args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        abort(400, message="%s must be an integer, got %s" % (name, value))
+
+
+def response_options(args, all_fields):
+    """ Returns (fields, include_raw, format) requested by the fields, raw and format args """
+    output_format = str(args.get('format', 'json')).lower()
+    if output_format not in response_format.FORMATS:
+        abort(400, message="Unknown format %s, expected one of %s" % (output_format, ', '.join(response_format.FORMATS)))
+    try:
+        fields = response_format.parse_fields(args.get('fields'), all_fields)
+    except ValueError as e:
+        abort(400, message=str(e))
+    include_raw = str(args.get('raw', 'True')).lower() == 'true'
+    return fields, include_raw, output_format
+
 
-    	fb_helper = config.FREEBASE_HELPER
+def get_backend(args):
+    """ Returns the backend of the knowledge base picked by the index arg (FB_2M, FB_5M or both),
+        resolved per request so concurrent requests can read different indices
+    """
+    index_name = args.get('index')
+    if index_name is None:
+        return config.FREEBASE_HELPER
+    try:
+        return config.FREEBASE_HELPER.for_index(index_name)
+    except ValueError as e:
+        abort(400, message=str(e))
 
-    	names, num_items = fb_helper.get_names(removed_stopwords_query, num_results)
-    	jsoned_names = [{'freebase_name': name.freebase_name, 'freebase_id': name.freebase_id} for name in names]
-        topic_ids = [name.freebase_id for name in names]
+
+def get_predicate_filter(args):
+    """ Returns the filter of the comma separated predicates, exclude_predicates, domains and
+        exclude_domains args, run by the backend lookup, or None when none is given
+    """
+    def values(name):
+        return [value for value in (args.get(name) or '').split(',') if value]
+    predicate_filter = PredicateFilter(values('predicates'), values('exclude_predicates'), values('domains'),
+        values('exclude_domains'))
+    return predicate_filter if predicate_filter else None
+
+
+def make_response(payload, output_format):
+    """ Serializes payload as json, or msgpack when asked for """
+    with metrics.stage('serialize'):
+        if output_format == 'msgpack':
+            import msgpack
+            return Response(msgpack.packb(payload, use_bin_type=False), mimetype='application/x-msgpack')
+        return jsonify(**payload)
+
+
+def ndjson_response(header, rows):
+    """ Streams the header and then one row per line """
+    return Response(response_format.ndjson_lines(header, rows), mimetype='application/x-ndjson')
+
+
+def jsonify_names(names, num_items, query, fields=response_format.NAME_FIELDS, include_raw=True, columnar=False,
+                  filter_by_query=True):
+    """ Builds the name response for one query, only keeping names that appear in it
+        unless filter_by_query is off, as for fuzzy matches
+    """
+    with metrics.stage('serialize'):
+        jsoned_names = [{'freebase_name': name.freebase_name, 'freebase_id': name.freebase_id} for name in names]
         topic_names = [name.freebase_name for name in names]
-        
-        # Only keep names that have an alias in the sentence
-        cleaned_names = tokenizer.clean_name_arr(topic_names, query)
-        removed_substring_names = tokenizer.remove_substrings_arr(cleaned_names)
-        cleaned_jsoned_names = filter(lambda name: name['freebase_name'] \
-            in set(removed_substring_names), jsoned_names)
-        return jsonify(result=cleaned_jsoned_names,cleaned_names=cleaned_names,raw_names=jsoned_names,num_items=num_items)
-        #except Exception as e:
-        #    print("Error requesting %s" % e)
-        #    jsoned_names = [{'freebase_name': "NONE", 'freebase_id': '/m/test'}]
-        #    return jsonify(result=jsoned_names,num_items=num_items)
+
+        # Only keep names that have an alias in the sentence and are not part of a longer name
+        with metrics.stage('filter'):
+            if filter_by_query:
+                cleaned_names, removed_substring_names = tokenizer.filter_names(topic_names, query)
+                cleaned_jsoned_names = [name for name in jsoned_names \
+                    if name['freebase_name'] in removed_substring_names]
+            else:
+                cleaned_names, cleaned_jsoned_names = topic_names, jsoned_names
+
+        encode = response_format.name_columns if columnar else response_format.name_rows
+        payload = dict(result=encode(cleaned_jsoned_names, fields), num_items=num_items)
+        if include_raw:
+            payload.update(cleaned_names=cleaned_names, raw_names=encode(jsoned_names, fields))
+    return payload
+
+
+def get_names_batch(queries, num_results, fb_helper=None):
+    """ Returns (normalized query, names, num_items) for every query with a single backend request
+        fb_helper: Backend to query, config.FREEBASE_HELPER by default
+    """
+    normalized_queries = [normalize_name_query(query) for query in queries]
+
+    # Identical backend queries are only searched once
+    unique_queries = []
+    unique_indices = {}
+    for _, removed_stopwords_query in normalized_queries:
+        if removed_stopwords_query not in unique_indices:
+            unique_indices[removed_stopwords_query] = len(unique_queries)
+            unique_queries.append(removed_stopwords_query)
+
+    fb_helper = fb_helper or config.FREEBASE_HELPER
+    with metrics.stage('backend'):
+        batch_results = fb_helper.get_names_batch(unique_queries, num_results)
+
+    results = []
+    for query, removed_stopwords_query in normalized_queries:
+        names, num_items = batch_results[unique_indices[removed_stopwords_query]]
+        results.append((query, names, num_items))
+    return results
+
+
+class FreebaseNameAPI(Resource):
+    # Gets all of the names for specified query
+    def get(self):
+        # Get query and number of desired results
+        query, removed_stopwords_query = normalize_name_query(request.args.get('query'))
+        num_results = int_arg(request.args, 'num_results', 10)
+
+        fb_helper = get_backend(request.args)
+
+        # Typo tolerant lookup in the character trigram index instead of the backend search
+        fuzzy = request.args.get('fuzzy', 'False').lower() == 'true'
+
+        fields, include_raw, output_format = response_options(request.args, response_format.NAME_FIELDS)
+        with metrics.stage('backend'):
+            if fuzzy:
+                if not fb_helper.supports_fuzzy():
+                    abort(400, message="Fuzzy name lookups need a trigram index, set FREEBASE_FUZZY_INDEX")
+                names, num_items = fb_helper.get_names_fuzzy(removed_stopwords_query, num_results)
+            else:
+                names, num_items = fb_helper.get_names(removed_stopwords_query, num_results)
+        payload = jsonify_names(names, num_items, query, fields, include_raw and output_format != 'ndjson',
+            columnar=output_format == 'columnar', filter_by_query=not fuzzy)
+
+        if output_format == 'ndjson':
+            result = payload.pop('result')
+            payload['num_result'] = len(result)
+            return ndjson_response(payload, result)
+        return make_response(payload, output_format)
+
+
+class FreebaseNameBatchAPI(Resource):
+    # Gets all of the names for a list of queries with a single backend request
+    def post(self):
+        body = request.get_json(force=True)
+        queries = body.get('queries') if isinstance(body, dict) else None
+        if not isinstance(queries, list) or not all(isinstance(query, six.string_types) for query in queries):
+            abort(400, message="Must specify queries as a list of strings")
+        num_results = body.get('num_results')
+        fields, include_raw, output_format = response_options(body, response_format.NAME_FIELDS)
+        if output_format == 'ndjson':
+            abort(400, message="Batch name lookups do not support ndjson")
+
+        fb_helper = get_backend(body)
+        results = []
+        for query, names, num_items in get_names_batch(queries, num_results, fb_helper):
+            results.append(jsonify_names(names, num_items, query, fields, include_raw,
+                columnar=output_format == 'columnar'))
+        return make_response(dict(result=results), output_format)
 
 class FreebaseFactAPI(Resource):
 	# Gets all of the names for specified query
     def get(self):
     	# Get topic_id and number of desired results
     	topic_ids = request.args.get('topic_ids').split(',')
-    	num_results = request.args.get('num_results')
-        num_results_per_topic = request.args.get("num_results_per_topic")
-        if num_results_per_topic is None:
-            num_results_per_topic = 10
-        else:
-            num_results_per_topic = int(num_results_per_topic)
-
-    	fb_helper = config.FREEBASE_HELPER
-    	facts, filtered_facts, name_fact_mapper, num_items = \
-            fb_helper.get_facts_by_ids(topic_ids, \
-            num_results=num_results, num_results_per_topic=num_results_per_topic)
-
-    	jsoned_facts = [{'src_freebase_name': fact.src.freebase_name,
-    	'src_freebase_id': fact.src.freebase_id, 
-    	'pred_freebase_name': fact.pred.freebase_name,
-    	'pred_freebase_id': fact.pred.freebase_id,
-    	'tgt_freebase_name': fact.tgt.freebase_name,
-    	'tgt_freebase_id': fact.tgt.freebase_id } for fact in facts]
-  
-        jsoned_filtered_facts = [{'src_freebase_name': fact.src.freebase_name,
-        'src_freebase_id': fact.src.freebase_id, 
-        'pred_freebase_name': fact.pred.freebase_name,
-        'pred_freebase_id': fact.pred.freebase_id,
-        'tgt_freebase_name': fact.tgt.freebase_name,
-        'tgt_freebase_id': fact.tgt.freebase_id } for fact in filtered_facts] 
-
-        print(jsoned_filtered_facts)
-        print(jsoned_facts)
-        return jsonify(result=jsoned_filtered_facts, \
-            raw_facts = jsoned_facts, \
-            num_items=num_items,
-            num_results_per_topic=num_results_per_topic)
+    	num_results = int_arg(request.args, 'num_results', 10)
+        num_results_per_topic = int_arg(request.args, 'num_results_per_topic', 10)
+
+        # Let the backend dedup facts and pick ids per name over every fact of the topics,
+        # keeping num_predicates distinct predicates per id instead of num_results facts
+        aggregate = request.args.get('aggregate', 'False').lower() == 'true'
+        num_predicates = int_arg(request.args, 'num_predicates', 100)
+        fields, include_raw, output_format = response_options(request.args, response_format.FACT_FIELDS)
+        predicate_filter = get_predicate_filter(request.args)
+
+    	fb_helper = get_backend(request.args)
+        with metrics.stage('backend'):
+            if aggregate:
+                facts, filtered_facts, name_fact_mapper, num_items = fb_helper.get_facts_by_ids_aggregated(
+                    topic_ids, num_predicates=num_predicates, num_results_per_topic=num_results_per_topic,
+                    predicate_filter=predicate_filter)
+            else:
+                facts, filtered_facts, name_fact_mapper, num_items = \
+                    fb_helper.get_facts_by_ids(topic_ids, \
+                    num_results=num_results, num_results_per_topic=num_results_per_topic,
+                    predicate_filter=predicate_filter)
+
+        if output_format == 'ndjson':
+            # Facts are encoded one by one while the response is written
+            header = dict(num_items=num_items, num_results_per_topic=num_results_per_topic,
+                num_result=len(filtered_facts), num_raw_facts=len(facts) if include_raw else 0)
+            rows = (response_format.fact_row(fact, fields) for fact in \
+                itertools.chain(filtered_facts, facts if include_raw else []))
+            return ndjson_response(header, rows)
+
+        with metrics.stage('serialize'):
+            encode = response_format.fact_columns if output_format == 'columnar' else response_format.fact_rows
+            payload = dict(result=encode(filtered_facts, fields), num_items=num_items,
+                num_results_per_topic=num_results_per_topic)
+            if include_raw:
+                payload['raw_facts'] = encode(facts, fields)
+        return make_response(payload, output_format)
+
+
+class FreebaseLinkAPI(Resource):
+    # Links a question to candidate entities, predicates and facts in one request,
+    # running the n-gram, name and fact lookups of EntityLinkerAPI:link in the server
+    def get(self):
+        question = request.args.get('question')
+        if not question:
+            abort(400, message="Must specify question to link")
+        max_ngrams = int_arg(request.args, 'ngrams', 3)
+        num_results = int_arg(request.args, 'num_results', 10)
+        num_facts = int_arg(request.args, 'num_facts', 5000)
+        num_results_per_topic = int_arg(request.args, 'num_results_per_topic', 10)
+        predicate_filter = get_predicate_filter(request.args)
+        fields, _, output_format = response_options(request.args, response_format.LINK_FIELDS)
+        if output_format not in ('json', 'msgpack'):
+            abort(400, message="Links are returned as json or msgpack, got %s" % output_format)
+
+        fb_helper = get_backend(request.args)
+
+        with metrics.stage('normalize'):
+            queries = ngrams.question_ngrams(question, max_ngrams)
+
+        # Entities whose names survive the alias and substring filtering of their query
+        entity_ids = []
+        entity_names = {}
+        for query, names, num_items in get_names_batch(queries, num_results, fb_helper):
+            with metrics.stage('filter'):
+                _, removed_substring_names = tokenizer.filter_names([name.freebase_name for name in names], query)
+                for name in names:
+                    if name.freebase_name in removed_substring_names and name.freebase_id not in entity_names:
+                        entity_names[name.freebase_id] = name.freebase_name
+                        entity_ids.append(name.freebase_id)
+
+        filtered_facts = []
+        if entity_ids:
+            with metrics.stage('backend'):
+                _, filtered_facts, _, _ = fb_helper.get_facts_by_ids(entity_ids, \
+                    num_results=num_facts, num_results_per_topic=num_results_per_topic,
+                    predicate_filter=predicate_filter)
+
+        with metrics.stage('serialize'):
+            predicate_candidates = []
+            seen_predicates = set()
+            fact_mappings = {}
+            facts = FactBatch.from_facts(filtered_facts)
+            for src_name, predicate, tgt_id in zip(facts.src_names, facts.predicates, facts.tgt_ids):
+                if predicate not in seen_predicates:
+                    seen_predicates.add(predicate)
+                    predicate_candidates.append(predicate)
+                fact_mappings[src_name + " " + predicate] = tgt_id
+
+            entity_candidates = []
+            seen_names = set()
+            for freebase_id in entity_ids:
+                if entity_names[freebase_id] not in seen_names:
+                    seen_names.add(entity_names[freebase_id])
+                    entity_candidates.append(entity_names[freebase_id])
+
+            values = dict(predicate_candidates=predicate_candidates,
+                entity_candidates=entity_candidates,
+                entity_ids=entity_ids,
+                fact_mappings=fact_mappings)
+            payload = dict((field, values[field]) for field in fields)
+            payload['num_queries'] = len(queries)
+        return make_response(payload, output_format)
+
+
+class FreebasePredicateAPI(Resource):
+    # Gets the distinct predicates of every topic id from the predicate set index, for
+    # predicate candidate generation that does not need the facts themselves
+    def get(self):
+        topic_ids = request.args.get('topic_ids')
+        if not topic_ids:
+            abort(400, message="Must specify topic_ids to get the predicates of")
+        topic_ids = topic_ids.split(',')
+        output_format = str(request.args.get('format', 'json')).lower()
+        if output_format not in ('json', 'msgpack'):
+            abort(400, message="Predicate sets are returned as json or msgpack, got %s" % output_format)
+        predicate_filter = get_predicate_filter(request.args)
+
+        fb_helper = get_backend(request.args)
+        with metrics.stage('backend'):
+            predicate_sets = fb_helper.get_predicate_sets(topic_ids, predicate_filter)
+
+        with metrics.stage('serialize'):
+            # Predicates of all ids in the order of the ids, like predicate_candidates of /link
+            predicate_candidates = []
+            seen_predicates = set()
+            for predicates in predicate_sets:
+                for predicate in predicates:
+                    if predicate not in seen_predicates:
+                        seen_predicates.add(predicate)
+                        predicate_candidates.append(predicate)
+            payload = dict(result=dict(zip(topic_ids, predicate_sets)), predicate_candidates=predicate_candidates,
+                num_items=len(predicate_candidates))
+        return make_response(payload, output_format)
+
+
+def expand_subgraph(fb_helper, topic_ids, fanouts, hop_predicates, reverse=False, max_frontier=None):
+    """ Follows the facts of topic_ids for len(fanouts) hops with one backend lookup per hop.
+        Hop i reads at most fanouts[i] facts, with a predicate in hop_predicates[i] if given,
+        of every entity the previous hop reached for the first time
+        reverse: Follow facts from their target to their subject instead
+        max_frontier: Most entities expanded per hop, the first ones reached. The others are
+            still returned as nodes
+        returns: facts without duplicates, {freebase_id: (name, hop)} of every entity, total facts per hop
+    """
+    facts = FactBatch()
+    seen_facts = set()
+    nodes = OrderedDict((topic_id, (None, 0)) for topic_id in topic_ids)
+    frontier = list(nodes)
+    num_items = []
+    for hop, (fanout, predicates) in enumerate(zip(fanouts, hop_predicates)):
+        if not frontier:
+            break
+        frontier = frontier[:max_frontier]
+        with metrics.stage('backend'):
+            hop_facts, num_total = fb_helper.get_neighbor_facts(frontier, fanout, predicates, reverse)
+        num_items.append(num_total)
+
+        frontier = []
+        for row in zip(hop_facts.src_ids, hop_facts.src_names, hop_facts.predicates, hop_facts.tgt_ids,
+                       hop_facts.tgt_names):
+            src_id, src_name, predicate, tgt_id, tgt_name = row
+            if (src_id, predicate, tgt_id) in seen_facts:
+                continue
+            seen_facts.add((src_id, predicate, tgt_id))
+            facts.append(*row)
+
+            # The entity the fact was reached from, whose name comes with its facts, and the one it leads to
+            ends = ((tgt_id, tgt_name), (src_id, src_name)) if reverse else ((src_id, src_name), (tgt_id, tgt_name))
+            for distance, (freebase_id, name) in zip((hop, hop + 1), ends):
+                if freebase_id not in nodes:
+                    nodes[freebase_id] = (name, distance)
+                    frontier.append(freebase_id)
+                elif nodes[freebase_id][0] is None:
+                    nodes[freebase_id] = (name, nodes[freebase_id][1])
+    return facts, nodes, num_items
+
+
+def parse_hop_values(value, num_hops, parse):
+    """ Returns one value per hop from value, a single value for every hop or one per hop
+        separated by ;
+    """
+    values = [parse(item) for item in value.split(';')]
+    if len(values) == 1:
+        values = values * num_hops
+    if len(values) != num_hops:
+        raise ValueError("Expected 1 or %d values separated by ;, got %s" % (num_hops, value))
+    return values
+
+
+class FreebaseExpandAPI(Resource):
+    # Expands entities over one or two hops of facts and returns the subgraph, with one
+    # backend lookup per hop instead of a /fact round trip per entity
+    def get(self):
+        topic_ids = request.args.get('topic_ids')
+        if not topic_ids:
+            abort(400, message="Must specify topic_ids to expand")
+        topic_ids = topic_ids.split(',')
+        if len(topic_ids) > config.FREEBASE_EXPAND_MAX_FRONTIER:
+            abort(400, message="At most %d topic_ids are expanded, got %d" % (
+                config.FREEBASE_EXPAND_MAX_FRONTIER, len(topic_ids)))
+        num_hops = int_arg(request.args, 'hops', 1)
+        if num_hops not in (1, 2):
+            abort(400, message="hops must be 1 or 2, got %d" % num_hops)
+        direction = request.args.get('direction', 'out')
+        if direction not in ('out', 'in'):
+            abort(400, message="direction must be out or in, got %s" % direction)
+
+        try:
+            fanouts = parse_hop_values(request.args.get('fanout', '100'), num_hops, int)
+            hop_predicates = parse_hop_values(request.args.get('predicates', ''), num_hops,
+                lambda predicates: [predicate for predicate in predicates.split(',') if predicate] or None)
+        except ValueError as e:
+            abort(400, message=str(e))
+        if not all(1 <= fanout <= config.FREEBASE_EXPAND_MAX_FANOUT for fanout in fanouts):
+            abort(400, message="fanout must be between 1 and %d, got %s" % (
+                config.FREEBASE_EXPAND_MAX_FANOUT, request.args.get('fanout')))
+
+        fields, _, output_format = response_options(request.args, response_format.FACT_FIELDS)
+        if output_format == 'ndjson':
+            abort(400, message="Expansions do not support ndjson")
+
+        fb_helper = get_backend(request.args)
+        facts, nodes, num_items = expand_subgraph(fb_helper, topic_ids, fanouts, hop_predicates,
+            reverse=direction == 'in', max_frontier=config.FREEBASE_EXPAND_MAX_FRONTIER)
+
+        with metrics.stage('serialize'):
+            encode = response_format.fact_columns if output_format == 'columnar' else response_format.fact_rows
+            payload = dict(result=encode(facts, fields), num_items=num_items,
+                nodes=[{'freebase_id': freebase_id, 'freebase_name': name, 'hop': hop} \
+                    for freebase_id, (name, hop) in nodes.items()])
+        return make_response(payload, output_format)
+
+
+class FreebaseCacheAPI(Resource):
+    # Gets hit/miss/eviction counters of the lookup cache of the default or index= knowledge base
+    def get(self):
+        # The default backend of a router, or the backend of the index picked
+        fb_helper = get_backend(request.args).for_index(None)
+        if not isinstance(fb_helper, CachedFreebaseHelper):
+            return jsonify(enabled=False)
+        return jsonify(enabled=True, **fb_helper.stats())
@@ -1,5 +1,6 @@
-from flask import Blueprint, jsonify, current_app
+from flask import Blueprint, Response, jsonify, current_app
 from flask.ext.restful import Api
+from util import metrics
 
 
 common_blueprint = Blueprint('common', __name__)
@@ -14,3 +15,8 @@ def list_routes():
         line = "{:50s} {:20s}".format(str(rule), methods)
         output.append(line)
     return jsonify(routes=output)
+
+
+@common_blueprint.route('/metrics')
+def list_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
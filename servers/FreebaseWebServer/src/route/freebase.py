@@ -1,15 +1,46 @@
-from flask import Blueprint
+from flask import Blueprint, request
 from flask.ext.restful import Api
+from util import metrics
 
 
 freebase_blueprint = Blueprint('freebase', __name__)
 freebase_blueprint_api = Api(freebase_blueprint)
 
 
-from resource.freebase import FreebaseNameAPI, FreebaseFactAPI
+@freebase_blueprint.before_request
+def start_timings():
+    metrics.start_request()
+
+
+@freebase_blueprint.after_request
+def publish_timings(response):
+    # Streamed responses are encoded after this, their serialization is not timed
+    timings = metrics.finish_request()
+    if timings is not None:
+        timings.publish(request.endpoint)
+        response.headers['Server-Timing'] = timings.server_timing()
+    return response
+
+
+from resource.freebase import FreebaseNameAPI, FreebaseNameBatchAPI, FreebaseFactAPI, FreebaseLinkAPI, FreebaseCacheAPI, \
+    FreebaseExpandAPI, FreebasePredicateAPI
 
 #, 'query', 'num_results'
 freebase_blueprint_api.add_resource(FreebaseNameAPI, '/api/v1/freebase/name')
 
-#, 'topic_ids', 'num_results'
+#, 'queries', 'num_results'
+freebase_blueprint_api.add_resource(FreebaseNameBatchAPI, '/api/v1/freebase/name/batch')
+
+#, 'topic_ids', 'num_results', 'predicates', 'exclude_predicates', 'domains', 'exclude_domains'
 freebase_blueprint_api.add_resource(FreebaseFactAPI, '/api/v1/freebase/fact')
+
+#, 'topic_ids', 'predicates', 'exclude_predicates', 'domains', 'exclude_domains'
+freebase_blueprint_api.add_resource(FreebasePredicateAPI, '/api/v1/freebase/predicates')
+
+#, 'question', 'ngrams', 'num_results', 'num_facts'
+freebase_blueprint_api.add_resource(FreebaseLinkAPI, '/api/v1/freebase/link')
+
+freebase_blueprint_api.add_resource(FreebaseCacheAPI, '/api/v1/freebase/cache')
+
+#, 'topic_ids', 'hops', 'fanout', 'predicates', 'direction'
+freebase_blueprint_api.add_resource(FreebaseExpandAPI, '/api/v1/freebase/expand')
@@ -1,3 +1,5 @@
 from .parse_params import parse_params
 from .freebase import FreebaseObject, FreebaseFact
-from .freebase_helper import FreebaseHelper
\ No newline at end of file
+from .freebase_helper import FreebaseHelper
+from .kb_backend import KnowledgeBaseBackend
+from .local_freebase_helper import LocalFreebaseHelper
\ No newline at end of file
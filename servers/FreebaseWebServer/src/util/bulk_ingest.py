@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import threading
+from six.moves.queue import Queue
+from .local_freebase_helper import read_triples, read_names
+
+def chunks(iterable, chunk_size):
+	""" Yields lists of chunk_size items of iterable, the last one may be shorter """
+	chunk = []
+	for item in iterable:
+		chunk.append(item)
+		if len(chunk) == chunk_size:
+			yield chunk
+			chunk = []
+	if chunk:
+		yield chunk
+
+def name_documents(name_paths):
+	""" Yields (doc id, names index document) from freebase_id <tab> name files """
+	for name_path in name_paths:
+		for freebase_id, name, description in read_names(name_path):
+			yield freebase_id, {
+				'freebase_id': freebase_id,
+				'name': name,
+				'description': description,
+				'aliases': 'NOALIAS'
+			}
+
+def fact_documents(fact_paths, names):
+	""" Yields (doc id, facts index document) from triple files
+		names: Maps freebase ids to names, ids without a name are used as their name
+	"""
+	doc_id = 0
+	for fact_path in fact_paths:
+		for src, pred, tgt in read_triples(fact_path):
+			src_name = names.get(src, src)
+			yield doc_id, {
+				'src_freebase_id': src,
+				'src_freebase_name': src_name,
+				'src_freebase_name_analyzed': src_name,
+				'predicate': pred,
+				'tgt_freebase_id': tgt,
+				'tgt_freebase_name': names.get(tgt, tgt)
+			}
+			doc_id += 1
+
+class BulkIngester(object):
+	""" Streams documents into an elasticsearch index with concurrent bulk workers.
+		Refresh and replicas are turned off during the load, and the number of
+		finished chunks is checkpointed so an interrupted load resumes where it stopped
+	"""
+	def __init__(self, es, index, doc_type, chunk_size=5000, num_workers=4, checkpoint_path=None):
+		self.es = es
+		self.index = index
+		self.doc_type = doc_type
+		self.chunk_size = chunk_size
+		self.num_workers = num_workers
+		self.checkpoint_path = checkpoint_path
+
+		self.lock = threading.Lock()
+		self.finished_chunks = set()
+		self.num_chunks_done = 0
+		self.num_docs = 0
+		self.error = None
+
+	def load_checkpoint(self):
+		""" Returns the number of leading chunks already indexed """
+		if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+			return 0
+		with open(self.checkpoint_path, 'r') as f:
+			checkpoint = json.load(f)
+		if checkpoint['index'] != self.index or checkpoint['chunk_size'] != self.chunk_size:
+			raise Exception("Checkpoint %s was written for index %s with chunk size %s" % \
+				(self.checkpoint_path, checkpoint['index'], checkpoint['chunk_size']))
+		return checkpoint['chunks_done']
+
+	def save_checkpoint(self):
+		if self.checkpoint_path is None:
+			return
+		tmp_path = self.checkpoint_path + '.tmp'
+		with open(tmp_path, 'w') as f:
+			json.dump({
+				'index': self.index,
+				'chunk_size': self.chunk_size,
+				'chunks_done': self.num_chunks_done
+			}, f)
+		os.rename(tmp_path, self.checkpoint_path)
+
+	def prepare_index(self):
+		""" Turns off refresh and replicas, returns the settings to restore """
+		settings = self.es.indices.get_settings(index=self.index)[self.index]['settings']['index']
+		original_settings = {
+			'refresh_interval': settings.get('refresh_interval', '1s'),
+			'number_of_replicas': settings.get('number_of_replicas', '1')
+		}
+		self.es.indices.put_settings(index=self.index, body={
+			'index': {'refresh_interval': '-1', 'number_of_replicas': 0}
+		})
+		return original_settings
+
+	def restore_index(self, original_settings):
+		self.es.indices.put_settings(index=self.index, body={'index': original_settings})
+		self.es.indices.refresh(index=self.index)
+
+	def bulk_operands(self, chunk):
+		bulk_operands = []
+		for doc_id, doc in chunk:
+			bulk_operands.append({
+				"index": {
+					"_index": self.index,
+					"_id": doc_id,
+					"_type": self.doc_type
+				}
+			})
+			bulk_operands.append(doc)
+		return bulk_operands
+
+	def finish_chunk(self, chunk_number, num_docs):
+		""" Records a finished chunk and advances the checkpoint past every chunk
+			that finished without a gap before it
+		"""
+		with self.lock:
+			self.finished_chunks.add(chunk_number)
+			self.num_docs += num_docs
+			checkpoint_moved = False
+			while self.num_chunks_done in self.finished_chunks:
+				self.finished_chunks.remove(self.num_chunks_done)
+				self.num_chunks_done += 1
+				checkpoint_moved = True
+			if checkpoint_moved:
+				self.save_checkpoint()
+
+	def worker(self, queue):
+		while True:
+			item = queue.get()
+			if item is None:
+				queue.task_done()
+				return
+			chunk_number, chunk = item
+			try:
+				if self.error is None:
+					res = self.es.bulk(index=self.index, body=self.bulk_operands(chunk), refresh=False)
+					if res.get('errors'):
+						failed_items = [item for item in res['items'] if 'error' in list(item.values())[0]]
+						raise Exception("Bulk chunk %d failed: %s" % (chunk_number, failed_items[:1]))
+					self.finish_chunk(chunk_number, len(chunk))
+			except Exception as e:
+				self.error = e
+			finally:
+				queue.task_done()
+
+	def ingest(self, documents, report_every=10):
+		""" Indexes (doc id, document) pairs, skipping chunks of a previous run
+			returns: Number of documents indexed by this run and docs/sec
+		"""
+		self.num_chunks_done = self.load_checkpoint()
+		self.finished_chunks = set()
+		self.num_docs = 0
+		self.error = None
+		if self.num_chunks_done > 0:
+			print("Resuming %s after %d chunks" % (self.index, self.num_chunks_done))
+
+		# Bounded queue keeps the generator from running ahead of the workers
+		queue = Queue(maxsize=self.num_workers * 2)
+		workers = [threading.Thread(target=self.worker, args=(queue,)) for _ in range(self.num_workers)]
+		for worker in workers:
+			worker.daemon = True
+			worker.start()
+
+		original_settings = self.prepare_index()
+		start_time = time.time()
+		try:
+			for chunk_number, chunk in enumerate(chunks(documents, self.chunk_size)):
+				if self.error is not None:
+					break
+				if chunk_number < self.num_chunks_done:
+					continue
+				queue.put((chunk_number, chunk))
+
+				if chunk_number % report_every == 0:
+					elapsed = max(time.time() - start_time, 1e-6)
+					print("Indexed %d docs into %s, %.0f docs/sec" % (self.num_docs, self.index, self.num_docs / elapsed))
+		finally:
+			for _ in workers:
+				queue.put(None)
+			for worker in workers:
+				worker.join()
+			self.restore_index(original_settings)
+
+		if self.error is not None:
+			raise self.error
+
+		docs_per_sec = self.num_docs / max(time.time() - start_time, 1e-6)
+		print("Indexed %d docs into %s, %.0f docs/sec" % (self.num_docs, self.index, docs_per_sec))
+		return self.num_docs, docs_per_sec
@@ -0,0 +1,166 @@
+import os
+import json
+import zlib
+import sqlite3
+import threading
+from .kb_backend import BackendWrapper
+from .freebase import FreebaseObject, FactBatch
+from . import metrics
+
+def to_bytes(value):
+	return value if isinstance(value, bytes) else value.encode('utf-8')
+
+def names_key(query, num_results):
+	return to_bytes(query) + b'\t' + to_bytes(str(num_results))
+
+def facts_key(topic_ids, num_results):
+	# Like the lookup cache, the ids are kept in request order since backends return the facts
+	# of the first ids first
+	return b','.join(to_bytes(topic_id) for topic_id in topic_ids) + b'\t' + to_bytes(str(num_results))
+
+def encode_value(value):
+	return sqlite3.Binary(zlib.compress(json.dumps(value).encode('utf-8')))
+
+def decode_value(data):
+	return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+def encode_names(names):
+	freebase_objs, num_total = names
+	return [num_total, [[obj.freebase_id, obj.freebase_name, getattr(obj, 'freebase_description', None)] \
+		for obj in freebase_objs]]
+
+def decode_names(value):
+	num_total, objs = value
+	return [FreebaseObject(-1, freebase_id, name, [], description) for freebase_id, name, description in objs], num_total
+
+def encode_facts(facts, num_total):
+	batch = FactBatch.from_facts(facts)
+	return [num_total, [list(row) for row in zip(batch.src_ids, batch.src_names, batch.predicates,
+		batch.tgt_ids, batch.tgt_names)]]
+
+def decode_facts(value):
+	num_total, rows = value
+	facts = FactBatch()
+	for src_id, src_name, predicate, tgt_id, tgt_name in rows:
+		facts.append(src_id, src_name, predicate, tgt_id, tgt_name)
+	return facts, num_total
+
+class CandidateStore(object):
+	""" On-disk key-value store of name and fact lookups, a sqlite file with
+		zlib compressed json values. Every thread (and forked process) opens its own connection
+	"""
+	def __init__(self, path):
+		self.path = path
+		self.local = threading.local()
+		connection = self.connection()
+		connection.execute('CREATE TABLE IF NOT EXISTS names (key BLOB PRIMARY KEY, value BLOB)')
+		connection.execute('CREATE TABLE IF NOT EXISTS facts (key BLOB PRIMARY KEY, value BLOB)')
+		connection.commit()
+
+	def connection(self):
+		connection = getattr(self.local, 'connection', None)
+		# A connection opened before a fork must not be used by the child
+		if connection is None or self.local.pid != os.getpid():
+			connection = self.local.connection = sqlite3.connect(self.path)
+			self.local.pid = os.getpid()
+		return connection
+
+	def get(self, table, key):
+		""" Returns the decoded value stored under key, None if missing """
+		row = self.connection().execute('SELECT value FROM %s WHERE key = ?' % table, (sqlite3.Binary(key),)).fetchone()
+		return decode_value(row[0]) if row is not None else None
+
+	def put(self, table, key, value):
+		self.put_many(table, [(key, value)])
+
+	def put_many(self, table, items):
+		""" Stores the (key, value) items in one transaction """
+		connection = self.connection()
+		with connection:
+			connection.executemany('INSERT OR REPLACE INTO %s (key, value) VALUES (?, ?)' % table,
+				[(sqlite3.Binary(key), encode_value(value)) for key, value in items])
+
+	def count(self, table):
+		return self.connection().execute('SELECT COUNT(*) FROM %s' % table).fetchone()[0]
+
+	def close(self):
+		connection = getattr(self.local, 'connection', None)
+		if connection is not None:
+			connection.close()
+			self.local.connection = None
+
+class CandidateStoreBackend(BackendWrapper):
+	""" Serves name and fact lookups from a CandidateStore before asking the wrapped backend.
+		With write=True, lookups missing from the store are added to it
+	"""
+	def __init__(self, backend, store, write=False):
+		self.backend = backend
+		self.name = backend.name
+		self.store = store
+		self.write = write
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def record(self, hits, misses):
+		with self.lock:
+			self.hits += hits
+			self.misses += misses
+		metrics.count('store_hits', hits)
+
+	def get_names(self, query, num_results):
+		return self.get_names_batch([query], num_results)[0]
+
+	def get_names_batch(self, queries, num_results):
+		results = [None] * len(queries)
+		missed_queries = []
+		missed_indices = []
+		for i, query in enumerate(queries):
+			value = self.store.get('names', names_key(query, num_results))
+			if value is not None:
+				results[i] = decode_names(value)
+			else:
+				missed_queries.append(query)
+				missed_indices.append(i)
+		self.record(len(queries) - len(missed_queries), len(missed_queries))
+
+		if missed_queries:
+			missed_results = self.backend.get_names_batch(missed_queries, num_results)
+			for i, names in zip(missed_indices, missed_results):
+				results[i] = names
+			if self.write:
+				self.store.put_many('names', [(names_key(query, num_results), encode_names(names)) \
+					for query, names in zip(missed_queries, missed_results)])
+		return results
+
+	def get_facts_by_ids(self, topic_ids, num_results, num_results_per_topic, predicate_filter=None):
+		# Stored facts are the unfiltered first num_results, filtered lookups go to the backend
+		if predicate_filter:
+			return self.backend.get_facts_by_ids(topic_ids, num_results, num_results_per_topic, predicate_filter)
+
+		key = facts_key(topic_ids, num_results)
+		value = self.store.get('facts', key)
+		if value is not None:
+			self.record(1, 0)
+			# Stored facts are already deduped, only the per topic filtering is left
+			facts, num_total = decode_facts(value)
+			facts, filtered_facts, name_facts_counter = self.filter_facts_per_topic(facts, num_results_per_topic)
+			return facts, filtered_facts, name_facts_counter, num_total
+
+		self.record(0, 1)
+		result = self.backend.get_facts_by_ids(topic_ids, num_results, num_results_per_topic)
+		if self.write:
+			self.store.put('facts', key, encode_facts(result[0], result[3]))
+		return result
+
+	def stats(self):
+		""" Returns the hit and miss counters and the number of stored lookups """
+		with self.lock:
+			num_lookups = self.hits + self.misses
+			return {
+				'hits': self.hits,
+				'misses': self.misses,
+				'hit_rate': float(self.hits) / num_lookups if num_lookups > 0 else 0.0,
+				'names': self.store.count('names'),
+				'facts': self.store.count('facts')
+			}
@@ -0,0 +1,133 @@
+import os
+import time
+import itertools
+import threading
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from six.moves.queue import Queue, Empty
+from elasticsearch import Elasticsearch
+
+def parse_nodes(nodes):
+	""" Returns a list of host:port nodes from a comma separated string or a list """
+	if isinstance(nodes, (list, tuple)):
+		return list(nodes)
+	return [node.strip() for node in nodes.split(',') if node.strip()]
+
+def reset_connections(client):
+	""" Replaces the pooled connections of an elasticsearch client with new ones, so a forked
+		process does not share the keep-alive sockets it inherited from its parent. The sniffed
+		hosts are kept, the inherited sockets are closed in this process only
+	"""
+	transport = client.transport
+	inherited = transport.connection_pool
+	# set_connections reuses the connections of an existing pool
+	del transport.connection_pool
+	transport.set_connections(transport.hosts)
+	transport.seed_connections = list(transport.connection_pool.connections)
+	inherited.close()
+
+class LatencyTracker(object):
+	""" Keeps the latencies of the most recent reads to compute percentiles """
+	def __init__(self, window=1000, min_samples=20):
+		self.latencies = deque(maxlen=window)
+		self.min_samples = min_samples
+		self.lock = threading.Lock()
+
+	def add(self, latency):
+		with self.lock:
+			self.latencies.append(latency)
+
+	def percentile(self, percentile):
+		""" Returns the latency at percentile (0-100), None until min_samples were seen """
+		with self.lock:
+			if len(self.latencies) < self.min_samples:
+				return None
+			latencies = sorted(self.latencies)
+		index = min(int(len(latencies) * percentile / 100.0), len(latencies) - 1)
+		return latencies[index]
+
+class HedgedReader(object):
+	""" Sends every read to one node, and a duplicate to the next node when the first
+		has not answered within the given percentile of recent read latencies or fails.
+		The first successful answer wins, so one degraded node does not set the tail latency.
+		Reads run on a pool of num_threads threads, by default one per pooled connection.
+		client_options are passed to every client, with sniffing a client starts from its
+		node and follows the nodes of the cluster
+	"""
+	def __init__(self, nodes, percentile=95, min_samples=20, window=1000, num_threads=None, **client_options):
+		self.clients = [Elasticsearch([node], **client_options) for node in nodes]
+		self.percentile = percentile
+		self.latencies = LatencyTracker(window, min_samples)
+		self.round_robin = itertools.count()
+		self.num_threads = num_threads or len(nodes) * client_options.get('maxsize', 10)
+
+		self.pool = None
+		self.pool_pid = None
+		self.lock = threading.Lock()
+
+		self.num_reads = 0
+		self.num_hedged = 0
+
+	def get_pool(self):
+		with self.lock:
+			# A pool inherited from a parent process has no threads left, start a new one
+			if self.pool_pid != os.getpid():
+				self.pool = ThreadPool(self.num_threads)
+				self.pool_pid = os.getpid()
+			return self.pool
+
+	def start_read(self, client, method, kwargs, results):
+		def read():
+			start_time = time.time()
+			try:
+				value = getattr(client, method)(**kwargs)
+			except Exception as e:
+				results.put((False, e))
+				return
+			self.latencies.add(time.time() - start_time)
+			results.put((True, value))
+
+		self.get_pool().apply_async(read)
+
+	def call(self, method, **kwargs):
+		""" Runs the client method (search, msearch) and returns the first successful answer """
+		results = Queue()
+		first = next(self.round_robin) % len(self.clients)
+		self.start_read(self.clients[first], method, kwargs, results)
+		with self.lock:
+			self.num_reads += 1
+
+		hedge_delay = self.latencies.percentile(self.percentile)
+		hedged = len(self.clients) < 2
+		num_pending = 1
+		error = None
+		while num_pending > 0:
+			try:
+				ok, value = results.get(timeout=None if hedged else hedge_delay)
+			except Empty:
+				ok, value = None, None
+
+			if not ok and not hedged:
+				# Slow or failed, duplicate the read on the next node
+				self.start_read(self.clients[(first + 1) % len(self.clients)], method, kwargs, results)
+				with self.lock:
+					self.num_hedged += 1
+				num_pending += 1
+				hedged = True
+			if ok is None:
+				continue
+
+			num_pending -= 1
+			if ok:
+				return value
+			error = value
+		raise error
+
+	def stats(self):
+		with self.lock:
+			num_reads, num_hedged = self.num_reads, self.num_hedged
+		return {
+			'reads': num_reads,
+			'hedged': num_hedged,
+			'hedge_delay': self.latencies.percentile(self.percentile)
+		}
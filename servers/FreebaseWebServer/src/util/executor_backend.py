@@ -0,0 +1,39 @@
+from .kb_backend import BackendWrapper
+
+class ExecutorBackend(BackendWrapper):
+	""" Runs the lookups of a blocking backend on an executor, so a cooperative
+		server keeps accepting requests while the local backend searches.
+		executor: Any pool with apply(func, args), like gevent's hub threadpool or
+		multiprocessing.pool.ThreadPool
+	"""
+	def __init__(self, backend, executor):
+		self.backend = backend
+		self.name = backend.name
+		self.executor = executor
+
+	def forward(self, method, *args):
+		return self.executor.apply(getattr(self.backend, method), args)
+
+def with_executor(helper, executor):
+	""" Returns helper with an ExecutorBackend right above every local backend behind its
+		wrappers and index router, so lookups answered by a cache in front of it stay on the caller
+	"""
+	from .local_freebase_helper import LocalFreebaseHelper
+	from .index_router import IndexRouter, FanOutBackend
+	if isinstance(helper, LocalFreebaseHelper):
+		return ExecutorBackend(helper, executor)
+	if isinstance(helper, ExecutorBackend):
+		return helper
+	if isinstance(helper, IndexRouter):
+		for index_name, backend in helper.backends.items():
+			helper.backends[index_name] = with_executor(backend, executor)
+		helper.default = helper.backends[helper.default_index]
+		helper.both.backends = list(helper.backends.values())
+		return helper
+	if isinstance(helper, FanOutBackend):
+		helper.backends = [with_executor(backend, executor) for backend in helper.backends]
+		return helper
+	backend = getattr(helper, '__dict__', {}).get('backend')
+	if backend is not None:
+		helper.backend = with_executor(backend, executor)
+	return helper
@@ -0,0 +1,228 @@
+import os
+import itertools
+import numpy as np
+from .local_freebase_helper import read_triples, read_names
+
+ENTITIES_FILE = 'entities.npy'
+PREDICATES_FILE = 'predicates.txt'
+OFFSETS_FILE = 'offsets.npy'
+FACT_PREDICATES_FILE = 'fact_predicates.npy'
+FACT_OBJECTS_FILE = 'fact_objects.npy'
+NAME_BLOB_FILE = 'names.bin'
+NAME_OFFSETS_FILE = 'name_offsets.npy'
+OBJECT_OFFSETS_FILE = 'object_offsets.npy'
+OBJECT_ROWS_FILE = 'object_rows.npy'
+
+# Triples encoded at once by build_fact_store
+CHUNK_SIZE = 100000
+
+class FactStore(object):
+	""" Read-only, memory-mapped subject -> facts adjacency store.
+		MIDs and predicates are interned to integer ids and facts are sorted by
+		subject, so the facts of entity i are rows offsets[i]:offsets[i + 1] of
+		fact_predicates and fact_objects. object_rows lists the rows of every object
+		the same way, at object_offsets. Arrays are opened with mmap so several
+		processes share the same pages.
+	"""
+	def __init__(self, store_dir):
+		self.store_dir = store_dir
+		self.entities = self.load_array(ENTITIES_FILE)
+		self.offsets = self.load_array(OFFSETS_FILE)
+		self.fact_predicates = self.load_array(FACT_PREDICATES_FILE)
+		self.fact_objects = self.load_array(FACT_OBJECTS_FILE)
+
+		with open(os.path.join(store_dir, PREDICATES_FILE), 'r') as f:
+			self.predicates = f.read().splitlines()
+
+		# Stores built before the object index was added scan fact_objects instead
+		self.object_offsets = None
+		self.object_rows = None
+		if os.path.exists(os.path.join(store_dir, OBJECT_OFFSETS_FILE)):
+			self.object_offsets = self.load_array(OBJECT_OFFSETS_FILE)
+			self.object_rows = self.load_array(OBJECT_ROWS_FILE)
+
+		self.name_blob = None
+		self.name_offsets = None
+		if os.path.exists(os.path.join(store_dir, NAME_OFFSETS_FILE)):
+			self.name_offsets = self.load_array(NAME_OFFSETS_FILE)
+			self.name_blob = np.memmap(os.path.join(store_dir, NAME_BLOB_FILE), dtype=np.uint8, mode='r') \
+				if os.path.getsize(os.path.join(store_dir, NAME_BLOB_FILE)) > 0 else np.zeros(0, dtype=np.uint8)
+
+	def load_array(self, file_name):
+		return np.load(os.path.join(self.store_dir, file_name), mmap_mode='r')
+
+	def __len__(self):
+		return len(self.entities)
+
+	@property
+	def num_facts(self):
+		return len(self.fact_objects)
+
+	def entity_index(self, freebase_id):
+		""" Returns the interned id of freebase_id, or -1 if it is unknown """
+		key = freebase_id.encode('utf-8') if not isinstance(freebase_id, bytes) else freebase_id
+		index = int(np.searchsorted(self.entities, key))
+		if index < len(self.entities) and self.entities[index] == key:
+			return index
+		return -1
+
+	def entity_id(self, index):
+		""" Returns the freebase id of interned entity index """
+		return self.entities[index].decode('utf-8')
+
+	def fact_slice(self, freebase_id):
+		""" Returns (start, end) rows of the facts of freebase_id """
+		index = self.entity_index(freebase_id)
+		if index < 0:
+			return 0, 0
+		return int(self.offsets[index]), int(self.offsets[index + 1])
+
+	def predicate_mask(self, start, end, predicate_filter):
+		""" Returns which of the facts in rows start:end have a predicate matching predicate_filter,
+			matching every distinct predicate of the rows once
+		"""
+		predicate_ids, fact_ids = np.unique(self.fact_predicates[start:end], return_inverse=True)
+		return predicate_filter.mask([self.predicates[pred] for pred in predicate_ids])[fact_ids]
+
+	def count(self, freebase_id, predicate_filter=None):
+		""" Returns the number of facts of freebase_id whose predicate matches predicate_filter """
+		start, end = self.fact_slice(freebase_id)
+		if predicate_filter:
+			return int(self.predicate_mask(start, end, predicate_filter).sum())
+		return end - start
+
+	def facts(self, freebase_id, limit=None, predicate_filter=None):
+		""" Returns the first limit [(predicate, object freebase id)] of freebase_id whose
+			predicate matches predicate_filter
+		"""
+		start, end = self.fact_slice(freebase_id)
+		if predicate_filter:
+			# Matching rows are picked on the interned predicates before anything is decoded
+			rows = start + np.flatnonzero(self.predicate_mask(start, end, predicate_filter))
+			if limit is not None:
+				rows = rows[:limit]
+			predicates, objects = self.fact_predicates[rows], self.fact_objects[rows]
+		else:
+			if limit is not None:
+				end = min(end, start + limit)
+			predicates, objects = self.fact_predicates[start:end], self.fact_objects[start:end]
+		return [(self.predicates[pred], self.entity_id(tgt)) for pred, tgt in zip(predicates, objects)]
+
+	def incoming(self, freebase_id, limit=None):
+		""" Returns the first limit [(subject freebase id, predicate)] of the facts whose
+			object is freebase_id, in subject order
+		"""
+		index = self.entity_index(freebase_id)
+		if index < 0:
+			return []
+		if self.object_offsets is not None:
+			rows = self.object_rows[int(self.object_offsets[index]):int(self.object_offsets[index + 1])]
+		else:
+			rows = np.flatnonzero(self.fact_objects == index)
+		if limit is not None:
+			rows = rows[:limit]
+		# Rows are sorted by subject, the subject of a row is the last one starting at or before it
+		subjects = np.searchsorted(self.offsets, rows, side='right') - 1
+		return [(self.entity_id(subject), self.predicates[self.fact_predicates[row]]) \
+			for row, subject in zip(rows, subjects)]
+
+	def get_name(self, freebase_id):
+		""" Returns the name of freebase_id, or None if the store has no name for it """
+		if self.name_offsets is None:
+			return None
+		index = self.entity_index(freebase_id)
+		if index < 0:
+			return None
+		start, end = int(self.name_offsets[index]), int(self.name_offsets[index + 1])
+		if start == end:
+			return None
+		return self.name_blob[start:end].tobytes().decode('utf-8')
+
+def build_fact_store(fact_paths, store_dir, name_paths=None):
+	""" Builds a FactStore in store_dir from triple files and optional name files
+		fact_paths: Files in the annotated_fb_data_*.txt / FB_2M / FB_5M format
+		name_paths: Files of the form freebase_id <tab> name [<tab> description]
+	"""
+	if not os.path.exists(store_dir):
+		os.makedirs(store_dir)
+
+	# First pass interns every mid and predicate and counts the facts
+	entity_set = set()
+	predicate_set = set()
+	num_facts = 0
+	for fact_path in fact_paths:
+		for src, pred, tgt in read_triples(fact_path):
+			entity_set.add(src)
+			entity_set.add(tgt)
+			predicate_set.add(pred)
+			num_facts += 1
+
+	names = {}
+	for name_path in name_paths or []:
+		for freebase_id, name, _ in read_names(name_path):
+			names[freebase_id] = name
+			entity_set.add(freebase_id)
+
+	entities = np.array(sorted(entity_set), dtype=bytes)
+	predicates = sorted(predicate_set)
+	predicate_ids = dict((pred, i) for i, pred in enumerate(predicates))
+	print("Interned %d entities and %d predicates" % (len(entities), len(predicates)))
+
+	# Second pass encodes the facts as integers, CHUNK_SIZE triples at a time, into arrays
+	# sized by the first pass so the triples of a file are never all held as strings
+	subjects = np.zeros(num_facts, dtype=np.int32)
+	fact_predicates = np.zeros(num_facts, dtype=np.int32)
+	fact_objects = np.zeros(num_facts, dtype=np.int32)
+	row = 0
+	for fact_path in fact_paths:
+		triples = read_triples(fact_path)
+		while True:
+			chunk = list(itertools.islice(triples, CHUNK_SIZE))
+			if not chunk:
+				break
+			src_ids, pred_names, tgt_ids = zip(*chunk)
+			end = row + len(chunk)
+			subjects[row:end] = np.searchsorted(entities, np.array(src_ids, dtype=bytes))
+			fact_objects[row:end] = np.searchsorted(entities, np.array(tgt_ids, dtype=bytes))
+			fact_predicates[row:end] = [predicate_ids[pred] for pred in pred_names]
+			row = end
+
+	# Stable sort by subject keeps the file order of facts of a subject
+	order = np.argsort(subjects, kind='mergesort')
+	counts = np.bincount(subjects, minlength=len(entities))
+	offsets = np.zeros(len(entities) + 1, dtype=np.int64)
+	np.cumsum(counts, out=offsets[1:])
+
+	fact_predicates = fact_predicates[order]
+	fact_objects = fact_objects[order]
+
+	# Rows of every object, kept in subject order by the stable sort
+	object_rows = np.argsort(fact_objects, kind='mergesort').astype(np.int32)
+	object_offsets = np.zeros(len(entities) + 1, dtype=np.int64)
+	np.cumsum(np.bincount(fact_objects, minlength=len(entities)), out=object_offsets[1:])
+
+	np.save(os.path.join(store_dir, ENTITIES_FILE), entities)
+	np.save(os.path.join(store_dir, OFFSETS_FILE), offsets)
+	np.save(os.path.join(store_dir, FACT_PREDICATES_FILE), fact_predicates)
+	np.save(os.path.join(store_dir, FACT_OBJECTS_FILE), fact_objects)
+	np.save(os.path.join(store_dir, OBJECT_OFFSETS_FILE), object_offsets)
+	np.save(os.path.join(store_dir, OBJECT_ROWS_FILE), object_rows)
+	with open(os.path.join(store_dir, PREDICATES_FILE), 'w') as f:
+		for pred in predicates:
+			f.write(pred + '\n')
+
+	if names:
+		name_offsets = np.zeros(len(entities) + 1, dtype=np.int64)
+		with open(os.path.join(store_dir, NAME_BLOB_FILE), 'wb') as f:
+			position = 0
+			for i, freebase_id in enumerate(entities):
+				name = names.get(freebase_id.decode('utf-8'))
+				if name is not None:
+					encoded_name = name if isinstance(name, bytes) else name.encode('utf-8')
+					f.write(encoded_name)
+					position += len(encoded_name)
+				name_offsets[i + 1] = position
+		np.save(os.path.join(store_dir, NAME_OFFSETS_FILE), name_offsets)
+
+	print("Saved %d facts to %s" % (len(fact_objects), store_dir))
+	return FactStore(store_dir)
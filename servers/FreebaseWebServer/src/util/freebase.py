@@ -1,6 +1,19 @@
+import sys
+from collections import Counter
+from collections import defaultdict
+
+NO_ALIASES = ('NOALIAS',)
+
+# One shared object per predicate, whose id and name are the same interned string.
+# Freebase has a few thousand predicates, past MAX_PREDICATES new ones are not shared
+PREDICATES = {}
+MAX_PREDICATES = 100000
+
 class FreebaseObject(object):
-	def __init__(self, cur_id, freebase_id, freebase_name, 
-		freebase_aliases = ['NOALIAS'], 
+	__slots__ = ('id', 'freebase_id', 'freebase_name', 'freebase_aliases', 'freebase_description')
+
+	def __init__(self, cur_id, freebase_id, freebase_name,
+		freebase_aliases = NO_ALIASES,
 		freebase_description = 'NODESCRIPTION'):
 
 		self.freebase_aliases = freebase_aliases
@@ -11,9 +24,133 @@ class FreebaseObject(object):
 
 class FreebaseFact(object):
 	""" Creates a new freebase fact with specified src, predicate and target """
+	__slots__ = ('src', 'pred', 'tgt')
+
 	def __init__(self, src, pred, tgt):
-		self.src = src 
-		self.pred = pred 
+		self.src = src
+		self.pred = pred
 		self.tgt = tgt
 
-		
\ No newline at end of file
+def predicate_object(predicate):
+	""" Returns the shared freebase object of predicate """
+	pred_obj = PREDICATES.get(predicate)
+	if pred_obj is None:
+		pred_obj = FreebaseObject(-1, predicate, predicate)
+		if len(PREDICATES) < MAX_PREDICATES:
+			pred_obj = PREDICATES.setdefault(predicate, pred_obj)
+	return pred_obj
+
+class FactBatch(object):
+	""" Facts stored as parallel arrays of subject ids and names, interned predicates and
+		target ids and names. Indexing and iterating build FreebaseFact objects on demand
+	"""
+	__slots__ = ('src_ids', 'src_names', 'predicates', 'tgt_ids', 'tgt_names', 'strings')
+
+	# Column holding every field of response_format.FACT_FIELDS
+	FIELD_COLUMNS = {
+		'src_freebase_name': 'src_names',
+		'src_freebase_id': 'src_ids',
+		'pred_freebase_name': 'predicates',
+		'pred_freebase_id': 'predicates',
+		'tgt_freebase_name': 'tgt_names',
+		'tgt_freebase_id': 'tgt_ids'
+	}
+
+	def __init__(self):
+		self.src_ids = []
+		self.src_names = []
+		self.predicates = []
+		self.tgt_ids = []
+		self.tgt_names = []
+		# Subjects repeat for every fact of a topic, keep one copy of their strings
+		self.strings = {}
+
+	@classmethod
+	def from_facts(cls, facts):
+		if isinstance(facts, FactBatch):
+			return facts
+		batch = cls()
+		for fact in facts:
+			batch.append(fact.src.freebase_id, fact.src.freebase_name, fact.pred.freebase_name,
+				fact.tgt.freebase_id, fact.tgt.freebase_name)
+		return batch
+
+	def append(self, src_id, src_name, predicate, tgt_id, tgt_name):
+		strings = self.strings
+		self.src_ids.append(strings.setdefault(src_id, src_id))
+		self.src_names.append(strings.setdefault(src_name, src_name))
+		self.predicates.append(predicate_object(predicate).freebase_id)
+		self.tgt_ids.append(tgt_id)
+		self.tgt_names.append(tgt_name)
+
+	def __len__(self):
+		return len(self.src_ids)
+
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			return self.select(range(*i.indices(len(self))))
+		return FreebaseFact(FreebaseObject(-1, self.src_ids[i], self.src_names[i]),
+			predicate_object(self.predicates[i]), FreebaseObject(-1, self.tgt_ids[i], self.tgt_names[i]))
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self[i]
+
+	def column(self, field):
+		""" Returns the values of a response_format.FACT_FIELDS field for every fact """
+		return getattr(self, self.FIELD_COLUMNS[field])
+
+	def select(self, indices):
+		""" Returns a batch of the facts at indices, with its own strings of the selected subjects
+			so appending to it leaves this one unchanged
+		"""
+		batch = FactBatch()
+		strings = batch.strings
+		for i in indices:
+			batch.src_ids.append(strings.setdefault(self.src_ids[i], self.src_ids[i]))
+			batch.src_names.append(strings.setdefault(self.src_names[i], self.src_names[i]))
+			batch.predicates.append(self.predicates[i])
+			batch.tgt_ids.append(self.tgt_ids[i])
+			batch.tgt_names.append(self.tgt_names[i])
+		return batch
+
+	def copy(self):
+		""" Returns a batch with its own columns, appending to it leaves this one unchanged """
+		batch = FactBatch()
+		batch.strings = dict(self.strings)
+		batch.src_ids = list(self.src_ids)
+		batch.src_names = list(self.src_names)
+		batch.predicates = list(self.predicates)
+		batch.tgt_ids = list(self.tgt_ids)
+		batch.tgt_names = list(self.tgt_names)
+		return batch
+
+	def filter_per_topic(self, num_results_per_topic):
+		""" Same as KnowledgeBaseBackend.filter_facts_per_topic over the columns
+			returns: unique_facts, filtered_facts, name_facts_counter
+		"""
+		unique_indices = []
+		facts_seen = set()
+		name_facts_counter = defaultdict(Counter)
+		for i, (src_id, src_name, predicate) in enumerate(zip(self.src_ids, self.src_names, self.predicates)):
+			key = src_id + predicate
+			if key not in facts_seen:
+				facts_seen.add(key)
+				name_facts_counter[src_name][src_id] += 1
+				unique_indices.append(i)
+
+		corr_ids = set()
+		for id_counts in name_facts_counter.values():
+			corr_ids.update(x[0] for x in id_counts.most_common(num_results_per_topic))
+
+		unique_facts = self if len(unique_indices) == len(self) else self.select(unique_indices)
+		filtered_facts = unique_facts.select([i for i, src_id in enumerate(unique_facts.src_ids) if src_id in corr_ids])
+		return unique_facts, filtered_facts, name_facts_counter
+
+	def num_bytes(self):
+		""" Estimated bytes of the columns and their strings """
+		columns = (self.src_ids, self.src_names, self.predicates, self.tgt_ids, self.tgt_names)
+		return sum(sys.getsizeof(column) for column in columns) + \
+			sum(sys.getsizeof(value) for value in self.strings) + \
+			sum(sys.getsizeof(value) for value in self.tgt_ids) + \
+			sum(sys.getsizeof(value) for value in self.tgt_names)
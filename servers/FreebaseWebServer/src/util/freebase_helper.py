@@ -1,24 +1,63 @@
+import copy
 from datetime import datetime
 from elasticsearch import Elasticsearch
-from freebase import FreebaseObject, FreebaseFact
-from collections import Counter
-from collections import defaultdict
-
-class FreebaseHelper(object):
+from freebase import FreebaseObject, FactBatch
+from kb_backend import KnowledgeBaseBackend
+from es_pool import HedgedReader, parse_nodes
+from trigram_index import TrigramNameIndex
+from predicate_index import PredicateSetIndex
+import metrics
+
+class FreebaseHelper(KnowledgeBaseBackend):
 	FREEBASE_IP = 'softmaxfreebase.cloudapp.net:9200'
 	FREEBASE_2M = 'FB_2M'
 	FREEBASE_5M = 'FB_5M'
 
+	# Predicates per id returned by the predicate set aggregation
+	MAX_PREDICATES_PER_ID = 1000
+
 	"""An elasticsearch wrapper that helps index data """
-	def __init__(self, ip_addresses, create_index, timeout):
+	def __init__(self, ip_addresses, create_index, timeout, maxsize=10, sniff_interval=None,
+		name_timeout=None, fact_timeout=None, hedge_percentile=None):
+		""" ip_addresses: host:port nodes, as a list or comma separated
+			maxsize: Number of connections kept open per node
+			sniff_interval: Seconds between discovering the cluster nodes, None to not sniff
+			name_timeout, fact_timeout: Per request timeouts of name and fact reads
+			hedge_percentile: Latency percentile after which a read is duplicated on another node
+		"""
 		self.name = 'ElasticSearch'
 		self.name_index = 'names_v3'
 		self.fact_index = 'facts_v3'
-		self.es = Elasticsearch(ip_addresses, timeout=timeout)
+		self.name_timeout = name_timeout
+		self.fact_timeout = fact_timeout
+
+		nodes = parse_nodes(ip_addresses)
+		sniff_options = {}
+		if sniff_interval is not None:
+			sniff_options = {
+				'sniff_on_start': True,
+				'sniff_on_connection_fail': True,
+				'sniffer_timeout': sniff_interval
+			}
+		self.es = Elasticsearch(nodes, timeout=timeout, maxsize=maxsize, retry_on_timeout=True, **sniff_options)
+
+		self.hedged_reader = None
+		if hedge_percentile is not None and len(nodes) > 1:
+			self.hedged_reader = HedgedReader(nodes, hedge_percentile, timeout=timeout, maxsize=maxsize,
+				**sniff_options)
+
+		# Predicate sets and trigram index of the names of one index, read by get_predicate_sets
+		# and get_names_fuzzy, see index_view
+		self.predicate_index = None
+		self.fuzzy_index = None
 
 		if create_index:
 			self.create_indeces()
 
+	def clients(self):
+		""" Elasticsearch clients of this helper, shared with its index views """
+		return [self.es] + (self.hedged_reader.clients if self.hedged_reader is not None else [])
+
 	def create_indeces(self):
 		# Delete indeces
 		self.delete_index(self.name_index)
@@ -43,6 +82,19 @@ class FreebaseHelper(object):
 		else:
 			raise Exception("Unknown index given %s" % index_name)
 
+	def index_view(self, index_name, predicate_index_path=None, fuzzy_index_path=None):
+		""" Returns a helper reading index_name that shares the connections of this one,
+			so several indices are served at once without calling set_index on a shared helper
+			predicate_index_path: Predicate sets of index_name, which differ between knowledge bases
+			fuzzy_index_path: Trigram index of the names of index_name, fuzzy lookups are
+				unsupported without one
+		"""
+		view = copy.copy(self)
+		view.set_index(index_name)
+		view.predicate_index = PredicateSetIndex.load(predicate_index_path) if predicate_index_path else None
+		view.fuzzy_index = TrigramNameIndex.load(fuzzy_index_path) if fuzzy_index_path else None
+		return view
+
 	def delete_index(self, index_name):
 		""" Deletes index with specified name 
 			index_name: Index to delete 
@@ -119,9 +171,9 @@ class FreebaseHelper(object):
 	def index_names(self, freebase_objs):
 		bulk_operands = []
 		for i in range(0, len(freebase_objs)):
-			if i % 50000 == 1:
+			if i > 0 and i % 50000 == 0:
 				print("Index stuff on index %s" % i)
-				self.es.bulk(index = self.name_index, body = bulk_operands, refresh = True)
+				self.es.bulk(index = self.name_index, body = bulk_operands, refresh = False)
 				bulk_operands = []
 
 			cur_obj = freebase_objs[i]
@@ -171,9 +223,9 @@ class FreebaseHelper(object):
 
 		bulk_operands = []
 		for i in range(0, len(freebase_facts)):
-			if i % 5000 == 1:
+			if i > 0 and i % 5000 == 0:
 				print("Index stuff on index %s" % i)
-				self.es.bulk(index = self.fact_index, body = bulk_operands, refresh = True)
+				self.es.bulk(index = self.fact_index, body = bulk_operands, refresh = False)
 				bulk_operands = []
 
 			cur_fact = freebase_facts[i]
@@ -212,13 +264,56 @@ class FreebaseHelper(object):
 
 		self.es.bulk(index = self.fact_index, body = bulk_operands, refresh = True)
 
+	def read(self, method, request_timeout=None, **kwargs):
+		""" Runs a search or msearch, hedged across nodes when enabled """
+		if request_timeout is not None:
+			kwargs['request_timeout'] = request_timeout
+		if self.hedged_reader is not None:
+			res = self.hedged_reader.call(method, **kwargs)
+		else:
+			res = getattr(self.es, method)(**kwargs)
+
+		responses = res['responses'] if method == 'msearch' else [res]
+		metrics.count('es_calls')
+		metrics.count('es_hits', sum(len(response.get('hits', {}).get('hits', [])) for response in responses))
+		return res
+
 	def get_names(self, query, num_results):
 		""" Returns all freebase objects that match name
 			query: Query to run against freebase names index
 			num_results: Number of results to return
 		"""
-		print(query)
-		freebase_objs = []
+		elastic_query = self.name_query(query, num_results)
+		res = self.read('search', self.name_timeout, index=self.name_index, body=elastic_query)
+		return self.decode_name_hits(res)
+
+	def get_names_batch(self, queries, num_results):
+		""" Returns freebase objects for every query in a single _msearch request
+			queries: Queries to run against freebase names index
+			num_results: Number of results to return per query
+			returns: list of (freebase_objs, num_total), in the same order as queries
+		"""
+		if len(queries) == 0:
+			return []
+
+		bulk_body = []
+		for query in queries:
+			bulk_body.append({"index": self.name_index})
+			bulk_body.append(self.name_query(query, num_results))
+
+		res = self.read('msearch', self.name_timeout, index=self.name_index, body=bulk_body)
+		results = []
+		for query, response in zip(queries, res['responses']):
+			if 'error' in response:
+				raise Exception("Error searching names for %s: %s" % (query, response['error']))
+			results.append(self.decode_name_hits(response))
+		return results
+
+	def name_query(self, query, num_results):
+		""" Builds the elasticsearch body used to search names
+			query: Query to run against freebase names index
+			num_results: Number of results to return
+		"""
 		elastic_query = {
 		  "query": {
 		  #"match": {
@@ -231,14 +326,33 @@ class FreebaseHelper(object):
 		  },
 		  "size" : num_results
 		}
-		res = self.es.search(index=self.name_index, body=elastic_query)
-		num_total = res['hits']['total']
-		for hit in res['hits']['hits']:
-			src = hit["_source"]
-			cur_obj = FreebaseObject(-1, src["freebase_id"], src["name"], [], src["description"])
-			freebase_objs.append(cur_obj)
+		return elastic_query
+
+	def decode_name_hits(self, res):
+		""" Converts a names search response into freebase objects
+			res: Elasticsearch search response
+		"""
+		with metrics.stage('decode'):
+			freebase_objs = []
+			num_total = res['hits']['total']
+			for hit in res['hits']['hits']:
+				src = hit["_source"]
+				cur_obj = FreebaseObject(-1, src["freebase_id"], src["name"], [], src["description"])
+				freebase_objs.append(cur_obj)
 		return freebase_objs, num_total
 
+	def supports_fuzzy(self):
+		return self.fuzzy_index is not None
+
+	def get_names_fuzzy(self, query, num_results):
+		""" Returns freebase objects whose names are the most similar to query by character
+			trigrams, from the local trigram index instead of elasticsearch
+		"""
+		if self.fuzzy_index is None:
+			raise NotImplementedError("Fuzzy name lookups need a trigram index")
+		matches, num_total = self.fuzzy_index.search(query, num_results)
+		return [FreebaseObject(-1, freebase_id, name, []) for freebase_id, name, _ in matches], num_total
+
 	def get_names_by_ids(self, topic_ids):
 		""" Returns all freebase facts for topic_id
 			num_results: Number of results to return 
@@ -254,24 +368,10 @@ class FreebaseHelper(object):
 				  }
 		}
 
-		freebase_objs = []
-		res = self.es.search(index=self.name_index, body=elastic_query)
-		num_total = res['hits']['total']
-		for hit in res['hits']['hits']:
-			src = hit["_source"]
-			cur_obj = FreebaseObject(-1, src["freebase_id"], src["name"], [], src["description"])
-			freebase_objs.append(cur_obj)
-		return freebase_objs, num_total
-
-	def get_facts_by_id(self, topic_id, num_results, num_results_per_topic):
-		""" Returns all freebase facts for topic_id
-			num_results: Number of results to return 
-		"""
-		freebase_facts, filtered_facts, name_facts_counter, num_total = self.get_facts_by_ids([topic_id], num_results, num_results_per_topic)
-		
-		return freebase_facts, filtered_facts, name_facts_counter, num_total
+		res = self.read('search', self.name_timeout, index=self.name_index, body=elastic_query)
+		return self.decode_name_hits(res)
 
-	def get_facts_by_ids(self, topic_ids, num_results, num_results_per_topic):
+	def get_facts_by_ids(self, topic_ids, num_results, num_results_per_topic, predicate_filter=None):
 		""" Returns all freebase facts for topic_id
 			num_results: Number of results to return 
 		"""
@@ -286,47 +386,133 @@ class FreebaseHelper(object):
 				  },
 		    "size": num_results
 		}
+		if predicate_filter:
+			elastic_query["query"] = predicate_filter.es_query(elastic_query["query"])
 
-		seen_facts = {}
-
-		res = self.es.search(index=self.fact_index, body=elastic_query)
+		res = self.read('search', self.fact_timeout, index=self.fact_index, body=elastic_query)
 		
 		# Total freebase facts
-		freebase_facts = []
-		facts_seen = {}
+		freebase_facts = FactBatch()
 		num_total = res['hits']['total']
 
-		# Keep track of number of facts per name per id
-		name_facts_counter = defaultdict(Counter)
-
-		# Facts by id
-		for hit in res['hits']['hits']:
-		   	for hit in res['hits']['hits']:
+		# Facts by id, decoded straight into columns
+		with metrics.stage('decode'):
+			for hit in res['hits']['hits']:
 				src = hit["_source"]
-				src_id = src["src_freebase_id"]
-				key = src_id + src["predicate"]
-				name = src["src_freebase_name"]
-				if key not in facts_seen:
-					name_facts_counter[name].update([src_id])
-					facts_seen[key] = facts_seen
-					src_obj = FreebaseObject(-1, src["src_freebase_id"], src["src_freebase_name"])
-					tgt_obj = FreebaseObject(-1, src["tgt_freebase_id"], src["tgt_freebase_name"])
-					pred_obj = FreebaseObject(-1, src["predicate"], src["predicate"])
-
-					freebase_fact = FreebaseFact(src_obj, pred_obj, tgt_obj)
-					freebase_facts.append(freebase_fact)
-		
-		all_ids = []
-		for k, id_counts in name_facts_counter.iteritems():
-			curr_ids = map(lambda x:x[0], id_counts.most_common(num_results_per_topic))
-			print(curr_ids)
-			all_ids.extend(curr_ids)
+				freebase_facts.append(src["src_freebase_id"], src["src_freebase_name"], src["predicate"],
+					src["tgt_freebase_id"], src["tgt_freebase_name"])
+
+		freebase_facts, filtered_facts, name_facts_counter = \
+			self.filter_facts_per_topic(freebase_facts, num_results_per_topic)
+		return freebase_facts, filtered_facts, name_facts_counter, num_total
 
-		corr_ids = set(all_ids)
 
-		filtered_facts = filter(lambda fact: fact.src.freebase_id in corr_ids, freebase_facts)
+	def get_facts_by_ids_aggregated(self, topic_ids, num_predicates, num_results_per_topic, predicate_filter=None):
+		""" Returns all freebase facts for topic_ids, letting elasticsearch dedup facts by
+			(id, predicate) with terms aggregations and a top_hits per bucket, so topics with
+			huge fact counts only return one document per distinct predicate: the one with
+			the smallest target id
+			num_predicates: Maximum number of distinct predicates per id, the most frequent first
+		"""
+		elastic_query = {
+			"query": {
+				"terms": {"src_freebase_id": topic_ids}
+			},
+			"size": 0,
+			"aggs": {
+				"ids": {
+					"terms": {"field": "src_freebase_id", "size": len(topic_ids)},
+					"aggs": {
+						"predicates": {
+							"terms": {"field": "predicate", "size": num_predicates},
+							"aggs": {
+								"fact": {"top_hits": {"size": 1, "sort": [{"tgt_freebase_id": {"order": "asc"}}]}}
+							}
+						}
+					}
+				}
+			}
+		}
+		if predicate_filter:
+			elastic_query["query"] = predicate_filter.es_query(elastic_query["query"])
+
+		res = self.read('search', self.fact_timeout, index=self.fact_index, body=elastic_query)
+		num_total = res['hits']['total']
+
+		freebase_facts = FactBatch()
+		with metrics.stage('decode'):
+			for id_bucket in res['aggregations']['ids']['buckets']:
+				for predicate_bucket in id_bucket['predicates']['buckets']:
+					src = predicate_bucket['fact']['hits']['hits'][0]['_source']
+					freebase_facts.append(src["src_freebase_id"], src["src_freebase_name"], src["predicate"],
+						src["tgt_freebase_id"], src["tgt_freebase_name"])
+
+		freebase_facts, filtered_facts, name_facts_counter = \
+			self.filter_facts_per_topic(freebase_facts, num_results_per_topic)
 		return freebase_facts, filtered_facts, name_facts_counter, num_total
 
+	def get_neighbor_facts(self, topic_ids, num_results_per_id, predicates=None, reverse=False):
+		""" Returns the facts of topic_ids, picking at most num_results_per_id per id with a
+			terms aggregation over the id field and a top_hits per bucket
+		"""
+		id_field = "tgt_freebase_id" if reverse else "src_freebase_id"
+		filters = [{"terms": {id_field: topic_ids}}]
+		if predicates:
+			filters.append({"terms": {"predicate": predicates}})
+		elastic_query = {
+			"query": {
+				"bool": {"must": filters}
+			},
+			"size": 0,
+			"aggs": {
+				"ids": {
+					"terms": {"field": id_field, "size": len(topic_ids)},
+					"aggs": {
+						"facts": {"top_hits": {"size": int(num_results_per_id)}}
+					}
+				}
+			}
+		}
+
+		res = self.read('search', self.fact_timeout, index=self.fact_index, body=elastic_query)
+		num_total = res['hits']['total']
+
+		freebase_facts = FactBatch()
+		with metrics.stage('decode'):
+			for id_bucket in res['aggregations']['ids']['buckets']:
+				for hit in id_bucket['facts']['hits']['hits']:
+					src = hit['_source']
+					freebase_facts.append(src["src_freebase_id"], src["src_freebase_name"], src["predicate"],
+						src["tgt_freebase_id"], src["tgt_freebase_name"])
+		return freebase_facts, num_total
+
+	def get_predicate_sets(self, topic_ids, predicate_filter=None):
+		""" Returns the predicates of every id of topic_ids from the predicate index, or from a
+			terms aggregation over the predicates of their facts that returns no fact documents
+		"""
+		if self.predicate_index is not None:
+			return [self.predicate_index.predicate_set(topic_id, predicate_filter) for topic_id in topic_ids]
+
+		query = {"terms": {"src_freebase_id": topic_ids}}
+		elastic_query = {
+			"query": predicate_filter.es_query(query) if predicate_filter else query,
+			"size": 0,
+			"aggs": {
+				"ids": {
+					"terms": {"field": "src_freebase_id", "size": len(topic_ids)},
+					"aggs": {
+						"predicates": {"terms": {"field": "predicate", "size": self.MAX_PREDICATES_PER_ID}}
+					}
+				}
+			}
+		}
+
+		res = self.read('search', self.fact_timeout, index=self.fact_index, body=elastic_query)
+		predicate_sets = {}
+		with metrics.stage('decode'):
+			for id_bucket in res['aggregations']['ids']['buckets']:
+				predicate_sets[id_bucket['key']] = sorted(bucket['key'] for bucket in id_bucket['predicates']['buckets'])
+		return [predicate_sets.get(topic_id, []) for topic_id in topic_ids]
 
 	def get_facts_by_name(self, topic_name, num_results):
 		""" Returns all freebase facts for topic_id
@@ -341,18 +527,14 @@ class FreebaseHelper(object):
 		  "size" : num_results
 		}
 
-		freebase_facts = []
-		res = self.es.search(index=self.fact_index, body=elastic_query)
-		
+		res = self.read('search', self.fact_timeout, index=self.fact_index, body=elastic_query)
+
 		num_total = res['hits']['total']
-		for hit in res['hits']['hits']:
-		   	for hit in res['hits']['hits']:
+		freebase_facts = FactBatch()
+		with metrics.stage('decode'):
+			for hit in res['hits']['hits']:
 				src = hit["_source"]
-				src_obj = FreebaseObject(-1, src["src_freebase_id"], src["src_freebase_name"])
-				tgt_obj = FreebaseObject(-1, src["tgt_freebase_id"], src["tgt_freebase_name"])
-				pred_obj = FreebaseObject(-1, src["predicate"], src["predicate"])
+				freebase_facts.append(src["src_freebase_id"], src["src_freebase_name"], src["predicate"],
+					src["tgt_freebase_id"], src["tgt_freebase_name"])
 
-				freebase_fact = FreebaseFact(src_obj, pred_obj, tgt_obj)
-				freebase_facts.append(freebase_fact)
-		
 		return freebase_facts, num_total
\ No newline at end of file
@@ -0,0 +1,138 @@
+import os
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from .kb_backend import BackendWrapper, KnowledgeBaseBackend
+from .freebase import FactBatch
+
+BOTH = 'both'
+
+def total_value(num_total):
+	""" Elasticsearch 7 reports totals as {'value': n, 'relation': 'eq'} """
+	return num_total['value'] if isinstance(num_total, dict) else num_total
+
+def merge_names(results, num_results=None):
+	""" Merges (freebase_objs, num_total) results in order, keeping the first object of every id """
+	freebase_objs = []
+	seen_ids = set()
+	for names, _ in results:
+		for name in names:
+			if name.freebase_id not in seen_ids:
+				seen_ids.add(name.freebase_id)
+				freebase_objs.append(name)
+	if num_results is not None:
+		freebase_objs = freebase_objs[:int(num_results)]
+	return freebase_objs, max(total_value(num_total) for _, num_total in results)
+
+def merge_facts(fact_lists):
+	""" Merges fact lists in order, keeping the first of every (subject, predicate, target) """
+	merged = FactBatch()
+	seen_facts = set()
+	for facts in fact_lists:
+		batch = FactBatch.from_facts(facts)
+		for row in zip(batch.src_ids, batch.src_names, batch.predicates, batch.tgt_ids, batch.tgt_names):
+			key = (row[0], row[2], row[3])
+			if key not in seen_facts:
+				seen_facts.add(key)
+				merged.append(*row)
+	return merged
+
+class FanOutBackend(KnowledgeBaseBackend):
+	""" Sends every lookup to several backends at once and merges their results,
+		deduping names by freebase id and facts by (subject, predicate, target)
+	"""
+	def __init__(self, backends):
+		self.backends = backends
+		self.name = '+'.join(backend.name for backend in backends)
+		self.pool = None
+		self.pool_pid = None
+		self.lock = threading.Lock()
+
+	def get_pool(self):
+		with self.lock:
+			# A pool inherited from a parent process has no threads left, start a new one
+			if self.pool_pid != os.getpid():
+				self.pool = ThreadPool(len(self.backends) * 4)
+				self.pool_pid = os.getpid()
+			return self.pool
+
+	def map(self, func):
+		""" Returns func(backend) of every backend, run in threads of this process """
+		if len(self.backends) == 1:
+			return [func(self.backends[0])]
+		return self.get_pool().map(func, self.backends)
+
+	def get_names(self, query, num_results):
+		return merge_names(self.map(lambda backend: backend.get_names(query, num_results)), num_results)
+
+	def get_names_batch(self, queries, num_results):
+		batches = self.map(lambda backend: backend.get_names_batch(queries, num_results))
+		return [merge_names(results, num_results) for results in zip(*batches)]
+
+	def supports_fuzzy(self):
+		return all(backend.supports_fuzzy() for backend in self.backends)
+
+	def get_names_fuzzy(self, query, num_results):
+		return merge_names(self.map(lambda backend: backend.get_names_fuzzy(query, num_results)), num_results)
+
+	def get_names_by_ids(self, topic_ids):
+		return merge_names(self.map(lambda backend: backend.get_names_by_ids(topic_ids)))
+
+	def merge_fact_results(self, results, num_results_per_topic):
+		freebase_facts = merge_facts(result[0] for result in results)
+		freebase_facts, filtered_facts, name_facts_counter = \
+			self.filter_facts_per_topic(freebase_facts, num_results_per_topic)
+		return freebase_facts, filtered_facts, name_facts_counter, max(total_value(result[3]) for result in results)
+
+	def get_facts_by_ids(self, topic_ids, num_results, num_results_per_topic, predicate_filter=None):
+		results = self.map(lambda backend: \
+			backend.get_facts_by_ids(topic_ids, num_results, num_results_per_topic, predicate_filter))
+		return self.merge_fact_results(results, num_results_per_topic)
+
+	def get_facts_by_ids_aggregated(self, topic_ids, num_predicates, num_results_per_topic, predicate_filter=None):
+		results = self.map(lambda backend: \
+			backend.get_facts_by_ids_aggregated(topic_ids, num_predicates, num_results_per_topic, predicate_filter))
+		return self.merge_fact_results(results, num_results_per_topic)
+
+	def get_facts_by_name(self, topic_name, num_results):
+		results = self.map(lambda backend: backend.get_facts_by_name(topic_name, num_results))
+		return merge_facts(facts for facts, _ in results), max(total_value(num_total) for _, num_total in results)
+
+	def get_neighbor_facts(self, topic_ids, num_results_per_id, predicates=None, reverse=False):
+		results = self.map(lambda backend: backend.get_neighbor_facts(topic_ids, num_results_per_id, predicates, reverse))
+		return merge_facts(facts for facts, _ in results), max(total_value(num_total) for _, num_total in results)
+
+	def get_predicate_sets(self, topic_ids, predicate_filter=None):
+		results = self.map(lambda backend: backend.get_predicate_sets(topic_ids, predicate_filter))
+		return [sorted(set().union(*predicate_sets)) for predicate_sets in zip(*results)]
+
+class IndexRouter(BackendWrapper):
+	""" Serves several knowledge bases (FB_2M, FB_5M) from one process. Every index has its
+		own backend, picked per request with for_index, so nothing is switched in place.
+		Lookups made on the router itself go to the default index
+	"""
+	def __init__(self, backends, default_index):
+		self.backends = OrderedDict(backends)
+		self.default_index = default_index
+		self.default = self.backends[default_index]
+		self.name = self.default.name
+		self.both = FanOutBackend(list(self.backends.values()))
+
+	def __getattr__(self, attr):
+		return getattr(self.default, attr)
+
+	def forward(self, method, *args):
+		return getattr(self.default, method)(*args)
+
+	def supports_fuzzy(self):
+		return self.default.supports_fuzzy()
+
+	def for_index(self, index_name):
+		if index_name is None:
+			return self.default
+		if index_name == BOTH:
+			return self.both
+		if index_name not in self.backends:
+			raise ValueError("Unknown index %s, expected one of %s" % \
+				(index_name, ', '.join(list(self.backends.keys()) + [BOTH])))
+		return self.backends[index_name]
@@ -0,0 +1,169 @@
+from collections import Counter
+from collections import defaultdict
+from . import metrics
+from .freebase import FactBatch
+
+class KnowledgeBaseBackend(object):
+	""" Interface every freebase lookup backend implements.
+		FreebaseHelper serves it from elasticsearch, LocalFreebaseHelper from memory
+	"""
+
+	def for_index(self, index_name):
+		""" Returns the backend serving index_name (FB_2M, FB_5M or both), the default one for None.
+			A single backend only serves its own index, util.index_router.IndexRouter serves several
+		"""
+		if index_name is None:
+			return self
+		raise ValueError("This server only serves its default index, got %s" % index_name)
+
+	def get_names(self, query, num_results):
+		""" Returns (freebase objects that match name, total number of matches)
+			query: Query to run against freebase names
+			num_results: Number of results to return
+		"""
+		raise NotImplementedError()
+
+	def get_names_batch(self, queries, num_results):
+		""" Returns a list of (freebase_objs, num_total), one per query in order
+			queries: Queries to run against freebase names
+			num_results: Number of results to return per query
+		"""
+		return [self.get_names(query, num_results) for query in queries]
+
+	def get_names_fuzzy(self, query, num_results):
+		""" Returns (freebase objects whose names share the most character trigrams with
+			query, total number of names sharing one), for misspelled or oddly tokenized queries
+		"""
+		raise NotImplementedError()
+
+	def supports_fuzzy(self):
+		""" Returns whether get_names_fuzzy is served, elasticsearch needs a trigram index for it """
+		return False
+
+	def get_names_by_ids(self, topic_ids):
+		""" Returns (freebase objects with the given freebase ids, total number of matches)
+			topic_ids: Freebase ids to look up
+		"""
+		raise NotImplementedError()
+
+	def get_facts_by_id(self, topic_id, num_results, num_results_per_topic, predicate_filter=None):
+		""" Returns all freebase facts for topic_id
+			num_results: Number of results to return
+		"""
+		return self.get_facts_by_ids([topic_id], num_results, num_results_per_topic, predicate_filter)
+
+	def get_facts_by_ids(self, topic_ids, num_results, num_results_per_topic, predicate_filter=None):
+		""" Returns (facts, filtered_facts, name_facts_counter, num_total) for topic_ids
+			num_results: Number of results to return
+			num_results_per_topic: Number of ids to keep for every distinct name
+			predicate_filter: util.predicate_index.PredicateFilter applied by the lookup itself,
+				so num_results and num_total only count matching facts
+		"""
+		raise NotImplementedError()
+
+	def get_facts_by_ids_aggregated(self, topic_ids, num_predicates, num_results_per_topic, predicate_filter=None):
+		""" Same results as get_facts_by_ids, but dedups by (id, predicate) and picks the
+			num_results_per_topic ids per name over every fact of topic_ids instead of
+			over the first num_results hits
+			num_predicates: Maximum number of distinct predicates per id
+		"""
+		return self.get_facts_by_ids(topic_ids, num_predicates * len(topic_ids), num_results_per_topic,
+			predicate_filter)
+
+	def get_facts_by_name(self, topic_name, num_results):
+		""" Returns (freebase facts whose subject matches topic_name, total number of matches)
+			num_results: Number of results to return
+		"""
+		raise NotImplementedError()
+
+	def get_neighbor_facts(self, topic_ids, num_results_per_id, predicates=None, reverse=False):
+		""" Returns (facts of topic_ids, total number of matching facts) in one lookup,
+			keeping at most num_results_per_id facts of every id
+			predicates: Only return facts with one of these predicates, all when None
+			reverse: Match topic_ids against the fact targets (tgt_freebase_id) instead of the subjects
+		"""
+		raise NotImplementedError()
+
+	def get_predicate_sets(self, topic_ids, predicate_filter=None):
+		""" Returns the sorted distinct predicates of the facts of every id of topic_ids, in order,
+			without reading the facts
+			predicate_filter: Only return the predicates it matches
+		"""
+		raise NotImplementedError()
+
+	def filter_facts_per_topic(self, freebase_facts, num_results_per_topic):
+		""" Dedups facts by (id, predicate) and only keeps facts of the num_results_per_topic
+			ids with the most facts for every distinct subject name
+			freebase_facts: Facts in the order they were retrieved
+			returns: unique_facts, filtered_facts, name_facts_counter
+		"""
+		with metrics.stage('filter'):
+			if isinstance(freebase_facts, FactBatch):
+				return freebase_facts.filter_per_topic(num_results_per_topic)
+
+			unique_facts = []
+			facts_seen = set()
+
+			# Keep track of number of facts per name per id
+			name_facts_counter = defaultdict(Counter)
+			for fact in freebase_facts:
+				key = fact.src.freebase_id + fact.pred.freebase_name
+				if key not in facts_seen:
+					facts_seen.add(key)
+					name_facts_counter[fact.src.freebase_name].update([fact.src.freebase_id])
+					unique_facts.append(fact)
+
+			all_ids = []
+			for k, id_counts in name_facts_counter.items():
+				curr_ids = [x[0] for x in id_counts.most_common(num_results_per_topic)]
+				all_ids.extend(curr_ids)
+
+			corr_ids = set(all_ids)
+
+			filtered_facts = [fact for fact in unique_facts if fact.src.freebase_id in corr_ids]
+		return unique_facts, filtered_facts, name_facts_counter
+
+class BackendWrapper(KnowledgeBaseBackend):
+	""" Base of the backends that wrap another one in self.backend, like caches and stores.
+		Every lookup goes through forward, which runs it on the wrapped backend, so a new
+		lookup only has to be added here. Wrappers override the lookups they change, or
+		forward to change all of them
+	"""
+	def __getattr__(self, attr):
+		# Index management and other backend specific calls go to the backend
+		return getattr(self.backend, attr)
+
+	def forward(self, method, *args):
+		""" Returns the result of the lookup method of the wrapped backend """
+		return getattr(self.backend, method)(*args)
+
+	def supports_fuzzy(self):
+		return self.backend.supports_fuzzy()
+
+	def get_names(self, query, num_results):
+		return self.forward('get_names', query, num_results)
+
+	def get_names_batch(self, queries, num_results):
+		return self.forward('get_names_batch', queries, num_results)
+
+	def get_names_fuzzy(self, query, num_results):
+		return self.forward('get_names_fuzzy', query, num_results)
+
+	def get_names_by_ids(self, topic_ids):
+		return self.forward('get_names_by_ids', topic_ids)
+
+	def get_facts_by_ids(self, topic_ids, num_results, num_results_per_topic, predicate_filter=None):
+		return self.forward('get_facts_by_ids', topic_ids, num_results, num_results_per_topic, predicate_filter)
+
+	def get_facts_by_ids_aggregated(self, topic_ids, num_predicates, num_results_per_topic, predicate_filter=None):
+		return self.forward('get_facts_by_ids_aggregated', topic_ids, num_predicates, num_results_per_topic,
+			predicate_filter)
+
+	def get_facts_by_name(self, topic_name, num_results):
+		return self.forward('get_facts_by_name', topic_name, num_results)
+
+	def get_neighbor_facts(self, topic_ids, num_results_per_id, predicates=None, reverse=False):
+		return self.forward('get_neighbor_facts', topic_ids, num_results_per_id, predicates, reverse)
+
+	def get_predicate_sets(self, topic_ids, predicate_filter=None):
+		return self.forward('get_predicate_sets', topic_ids, predicate_filter)
@@ -0,0 +1,335 @@
+import threading
+from collections import Counter, defaultdict
+from .freebase import FreebaseObject, FactBatch
+from .kb_backend import KnowledgeBaseBackend
+from .name_index import ShingleNameIndex
+from .trigram_index import TrigramNameIndex
+from .predicate_index import PredicateSetIndex
+
+FREEBASE_URL_PREFIX = 'www.freebase.com'
+
+def strip_freebase_url(value):
+	""" Turns www.freebase.com/m/0abc into /m/0abc, leaves other values untouched """
+	if value.startswith(FREEBASE_URL_PREFIX):
+		return value[len(FREEBASE_URL_PREFIX):]
+	return value
+
+def read_triples(fact_path):
+	""" Yields (subject, predicate, object) triples from a file in the
+		annotated_fb_data_*.txt / FB_2M / FB_5M format:
+		subject <tab> predicate <tab> object [object ...] [<tab> question]
+	"""
+	with open(fact_path, 'r') as f:
+		for line in f:
+			items = line.rstrip('\r\n').split('\t')
+			if len(items) < 3:
+				continue
+			src = strip_freebase_url(items[0])
+			pred = strip_freebase_url(items[1])
+			for tgt in items[2].split():
+				yield src, pred, strip_freebase_url(tgt)
+
+def read_names(name_path):
+	""" Yields (freebase_id, name, description) from a file of the form
+		freebase_id <tab> name [<tab> description]
+	"""
+	with open(name_path, 'r') as f:
+		for line in f:
+			items = line.rstrip('\r\n').split('\t')
+			if len(items) < 2:
+				continue
+			description = items[2] if len(items) > 2 else 'NODESCRIPTION'
+			yield strip_freebase_url(items[0]), items[1], description
+
+class LocalFreebaseHelper(KnowledgeBaseBackend):
+	""" In-process freebase backend that keeps facts and names in memory.
+		Serves the same lookups as FreebaseHelper without an elasticsearch cluster
+	"""
+	def __init__(self, fact_paths, name_paths=None, fact_store_path=None, name_index_path=None,
+		fuzzy_index_path=None, predicate_index_path=None):
+		self.name = 'Local'
+		self.facts = defaultdict(list)
+		# Indices missing at startup are built by the first thread that needs them
+		self.index_lock = threading.Lock()
+
+		# Memory-mapped facts built with build_fact_store, used instead of fact_paths
+		self.fact_store = None
+		if fact_store_path:
+			from .fact_store import FactStore
+			self.fact_store = FactStore(fact_store_path)
+
+		self.names = {}
+		self.descriptions = {}
+		self.name_index = None
+		self.name_index_path = name_index_path
+		# object -> [(subject, predicate)] of the in-memory facts, built on the first reverse lookup
+		self.incoming = None
+
+		for fact_path in fact_paths:
+			self.load_facts(fact_path)
+
+		for name_path in name_paths or []:
+			self.load_names(name_path)
+
+		# Shingle index over names and descriptions, saved with `manage.py kb build_name_index`
+		# or built from the loaded names here, before server processes are forked
+		if name_index_path:
+			self.name_index = ShingleNameIndex.load(name_index_path)
+			if not self.name_index.has_names and not name_paths and \
+				(self.fact_store is None or self.fact_store.name_offsets is None):
+				raise Exception("Name index %s has no names, rebuild it with `manage.py kb build_name_index` "
+					"or set the name paths" % name_index_path)
+		elif self.names:
+			self.build_name_index()
+
+		# Character trigram index over names for fuzzy lookups, saved with
+		# `manage.py kb build_trigram_index` or built on the first fuzzy search
+		self.fuzzy_index = None
+		if fuzzy_index_path:
+			self.fuzzy_index = TrigramNameIndex.load(fuzzy_index_path)
+
+		# Distinct predicates of every subject, saved with `manage.py kb build_predicate_index`
+		# or built from the loaded facts on the first predicate set lookup
+		self.predicate_index = None
+		if predicate_index_path:
+			self.predicate_index = PredicateSetIndex.load(predicate_index_path)
+
+	def load_facts(self, fact_path):
+		""" Loads all triples of fact_path into memory """
+		print("Loading facts from %s" % fact_path)
+		for src, pred, tgt in read_triples(fact_path):
+			self.facts[src].append((pred, tgt))
+		self.incoming = None
+		self.predicate_index = None
+
+	def load_names(self, name_path):
+		""" Loads all names of name_path into memory and indexes them for search """
+		print("Loading names from %s" % name_path)
+		for freebase_id, name, description in read_names(name_path):
+			self.add_name(freebase_id, name, description)
+
+	def add_name(self, freebase_id, name, description='NODESCRIPTION'):
+		""" Adds a name for freebase_id, searchable unless the name index was loaded from
+			name_index_path
+		"""
+		self.names[freebase_id] = name
+		self.descriptions[freebase_id] = description
+		if not self.name_index_path:
+			self.name_index = None
+		self.fuzzy_index = None
+
+	def build_name_index(self):
+		""" Builds the name index from the loaded names unless it is up to date """
+		name_index = self.name_index
+		if name_index is None:
+			with self.index_lock:
+				if self.name_index is None:
+					self.name_index = ShingleNameIndex.build(
+						(freebase_id, name, self.descriptions[freebase_id]) for freebase_id, name in self.names.items())
+				name_index = self.name_index
+		return name_index
+
+	def build_fuzzy_index(self):
+		""" Builds the trigram index from the loaded names unless it is up to date """
+		fuzzy_index = self.fuzzy_index
+		if fuzzy_index is None:
+			with self.index_lock:
+				if self.fuzzy_index is None:
+					self.fuzzy_index = TrigramNameIndex.build(self.names.items())
+				fuzzy_index = self.fuzzy_index
+		return fuzzy_index
+
+	def build_predicate_index(self):
+		""" Builds the predicate set index from the loaded facts unless it is up to date """
+		predicate_index = self.predicate_index
+		if predicate_index is None:
+			with self.index_lock:
+				if self.predicate_index is None:
+					if self.fact_store is not None:
+						self.predicate_index = PredicateSetIndex.from_fact_store(self.fact_store)
+					else:
+						self.predicate_index = PredicateSetIndex.build(
+							(src, pred, tgt) for src, facts in self.facts.items() for pred, tgt in facts)
+				predicate_index = self.predicate_index
+		return predicate_index
+
+	def search_names(self, query, num_results, boosts=None):
+		""" Returns ([(freebase_id, score)], number of matches) from the name index """
+		return self.build_name_index().search(query, num_results, boosts)
+
+	def get_name(self, freebase_id):
+		""" Returns name of freebase_id, falling back to the id itself """
+		name = self.names.get(freebase_id)
+		if name is None and self.name_index is not None:
+			document = self.name_index.document(freebase_id)
+			if document is not None:
+				name = document[0]
+		if name is None and self.fact_store is not None:
+			name = self.fact_store.get_name(freebase_id)
+		return freebase_id if name is None else name
+
+	def get_description(self, freebase_id):
+		""" Returns the description of freebase_id, NODESCRIPTION if it has none """
+		description = self.descriptions.get(freebase_id)
+		if description is None and self.name_index is not None:
+			document = self.name_index.document(freebase_id)
+			if document is not None:
+				description = document[1]
+		return 'NODESCRIPTION' if description is None else description
+
+	def count_facts(self, topic_id, predicate_filter=None):
+		""" Returns the number of facts of topic_id whose predicate matches predicate_filter """
+		if self.fact_store is not None:
+			return self.fact_store.count(topic_id, predicate_filter)
+		if predicate_filter:
+			return sum(1 for pred, _ in self.facts.get(topic_id, ()) if predicate_filter.matches(pred))
+		return len(self.facts.get(topic_id, ()))
+
+	def topic_facts(self, topic_id, limit, predicate_filter=None):
+		""" Returns the first limit (predicate, object) pairs of topic_id whose predicate matches
+			predicate_filter
+		"""
+		if self.fact_store is not None:
+			return self.fact_store.facts(topic_id, limit, predicate_filter)
+		facts = self.facts.get(topic_id, [])
+		if predicate_filter:
+			facts = [(pred, tgt) for pred, tgt in facts if predicate_filter.matches(pred)]
+		return facts[:limit]
+
+	def incoming_facts(self, topic_id, limit):
+		""" Returns the first limit (subject, predicate) pairs of the facts whose object is topic_id """
+		if self.fact_store is not None:
+			return self.fact_store.incoming(topic_id, limit)
+		if self.incoming is None:
+			# Subjects in sorted order like the fact store
+			incoming = defaultdict(list)
+			for src in sorted(self.facts):
+				for pred, tgt in self.facts[src]:
+					incoming[tgt].append((src, pred))
+			self.incoming = incoming
+		return self.incoming.get(topic_id, [])[:limit]
+
+	def name_object(self, freebase_id):
+		return FreebaseObject(-1, freebase_id, self.get_name(freebase_id), [], self.get_description(freebase_id))
+
+	def get_names(self, query, num_results):
+		""" Returns all freebase objects that match name, ranked with BM25 over the
+			shingled name and description^2 like the es multi_match query
+			query: Query to run against freebase names
+			num_results: Number of results to return
+		"""
+		ranked_ids, num_total = self.search_names(query, num_results)
+		freebase_objs = [self.name_object(freebase_id) for freebase_id, _ in ranked_ids]
+		return freebase_objs, num_total
+
+	def supports_fuzzy(self):
+		# A trigram index is built from the names when none was loaded
+		return True
+
+	def get_names_fuzzy(self, query, num_results):
+		""" Returns the freebase objects whose names are the most similar to query by
+			character trigrams
+		"""
+		matches, num_total = self.build_fuzzy_index().search(query, num_results)
+		return [self.name_object(freebase_id) for freebase_id, _, _ in matches], num_total
+
+	def get_names_by_ids(self, topic_ids):
+		""" Returns all freebase objects with the given freebase ids
+			topic_ids: Freebase ids to look up
+		"""
+		freebase_objs = [self.name_object(topic_id) for topic_id in topic_ids \
+			if self.get_name(topic_id) != topic_id]
+		return freebase_objs, len(freebase_objs)
+
+	def facts_for_ids(self, topic_ids, num_results, predicate_filter=None):
+		""" Returns the first num_results facts of topic_ids and the total number of facts,
+			only counting facts whose predicate matches predicate_filter
+		"""
+		freebase_facts = FactBatch()
+		num_total = 0
+		for topic_id in topic_ids:
+			num_total += self.count_facts(topic_id, predicate_filter)
+			if len(freebase_facts) >= num_results:
+				continue
+
+			src_name = self.get_name(topic_id)
+			for pred, tgt in self.topic_facts(topic_id, num_results - len(freebase_facts), predicate_filter):
+				freebase_facts.append(topic_id, src_name, pred, tgt, self.get_name(tgt))
+		return freebase_facts, num_total
+
+	def get_facts_by_ids(self, topic_ids, num_results, num_results_per_topic, predicate_filter=None):
+		""" Returns all freebase facts for topic_ids
+			num_results: Number of results to return
+		"""
+		freebase_facts, num_total = self.facts_for_ids(topic_ids, int(num_results), predicate_filter)
+		freebase_facts, filtered_facts, name_facts_counter = \
+			self.filter_facts_per_topic(freebase_facts, num_results_per_topic)
+		return freebase_facts, filtered_facts, name_facts_counter, num_total
+
+	def get_facts_by_ids_aggregated(self, topic_ids, num_predicates, num_results_per_topic, predicate_filter=None):
+		""" Returns all freebase facts for topic_ids, picking the ids per name over every fact.
+			Picks the same facts as the elasticsearch aggregation: the most frequent predicates
+			of every id and the fact with the smallest target id of each
+			num_predicates: Maximum number of distinct predicates per id
+		"""
+		freebase_facts = FactBatch()
+		num_total = 0
+		for topic_id in topic_ids:
+			topic_facts, topic_total = self.facts_for_ids([topic_id], self.count_facts(topic_id, predicate_filter),
+				predicate_filter)
+			num_total += topic_total
+
+			predicate_counts = Counter(topic_facts.predicates)
+			first_facts = {}
+			for i, predicate in enumerate(topic_facts.predicates):
+				if predicate not in first_facts or topic_facts.tgt_ids[i] < topic_facts.tgt_ids[first_facts[predicate]]:
+					first_facts[predicate] = i
+
+			# Terms aggregation order: doc count, then predicate
+			predicates = sorted(predicate_counts, key=lambda predicate: (-predicate_counts[predicate], predicate))
+			for predicate in predicates[:num_predicates]:
+				i = first_facts[predicate]
+				freebase_facts.append(topic_facts.src_ids[i], topic_facts.src_names[i], predicate,
+					topic_facts.tgt_ids[i], topic_facts.tgt_names[i])
+
+		freebase_facts, filtered_facts, name_facts_counter = \
+			self.filter_facts_per_topic(freebase_facts, num_results_per_topic)
+		return freebase_facts, filtered_facts, name_facts_counter, num_total
+
+	def get_neighbor_facts(self, topic_ids, num_results_per_id, predicates=None, reverse=False):
+		""" Returns the first num_results_per_id facts of every id of topic_ids, following the
+			object index when reverse
+		"""
+		predicates = set(predicates) if predicates else None
+		freebase_facts = FactBatch()
+		num_total = 0
+		for topic_id in topic_ids:
+			# Every fact of the id has to be read to filter by predicate
+			limit = None if predicates is not None else int(num_results_per_id)
+			if reverse:
+				triples = [(src, pred, topic_id) for src, pred in self.incoming_facts(topic_id, limit)]
+			else:
+				triples = [(topic_id, pred, tgt) for pred, tgt in \
+					self.topic_facts(topic_id, self.count_facts(topic_id) if limit is None else limit)]
+
+			if predicates is not None:
+				triples = [triple for triple in triples if triple[1] in predicates]
+				num_total += len(triples)
+			else:
+				num_total += len(self.incoming_facts(topic_id, None)) if reverse else self.count_facts(topic_id)
+
+			for src, pred, tgt in triples[:int(num_results_per_id)]:
+				freebase_facts.append(src, self.get_name(src), pred, tgt, self.get_name(tgt))
+		return freebase_facts, num_total
+
+	def get_predicate_sets(self, topic_ids, predicate_filter=None):
+		""" Returns the predicates of every id of topic_ids from the predicate set index """
+		predicate_index = self.build_predicate_index()
+		return [predicate_index.predicate_set(topic_id, predicate_filter) for topic_id in topic_ids]
+
+	def get_facts_by_name(self, topic_name, num_results):
+		""" Returns all freebase facts whose subject name matches topic_name
+			num_results: Number of results to return
+		"""
+		ranked_ids, _ = self.search_names(topic_name, num_results, boosts={'name': 1.0})
+		return self.facts_for_ids([freebase_id for freebase_id, _ in ranked_ids], int(num_results))
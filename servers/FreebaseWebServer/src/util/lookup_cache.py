@@ -0,0 +1,223 @@
+import sys
+import copy
+import time
+import threading
+from collections import OrderedDict
+from .kb_backend import BackendWrapper
+from .freebase import FactBatch
+
+# Rough per object cost of a FreebaseObject with its attribute dict
+OBJECT_OVERHEAD = 400
+
+class LookupCache(object):
+	""" Thread-safe LRU cache bounded by number of entries and estimated bytes,
+		with an optional time to live and hit/miss/eviction counters
+	"""
+	def __init__(self, max_entries, max_bytes=None, ttl=None):
+		self.max_entries = max_entries
+		self.max_bytes = max_bytes
+		self.ttl = ttl
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+		self.num_bytes = 0
+
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.expirations = 0
+
+	def get(self, key):
+		""" Returns (True, value) if key is cached and fresh, (False, None) otherwise """
+		with self.lock:
+			entry = self.entries.pop(key, None)
+			if entry is None:
+				self.misses += 1
+				return False, None
+
+			value, size, expires_at = entry
+			if expires_at is not None and expires_at < time.time():
+				self.num_bytes -= size
+				self.expirations += 1
+				self.misses += 1
+				return False, None
+
+			# Re-insert to mark as most recently used
+			self.entries[key] = entry
+			self.hits += 1
+			return True, value
+
+	def put(self, key, value, size=0):
+		""" Caches value under key, evicting least recently used entries over the bounds
+			size: Estimated number of bytes used by value
+		"""
+		if self.max_entries <= 0 or (self.max_bytes is not None and size > self.max_bytes):
+			return
+
+		expires_at = time.time() + self.ttl if self.ttl else None
+		with self.lock:
+			old_entry = self.entries.pop(key, None)
+			if old_entry is not None:
+				self.num_bytes -= old_entry[1]
+
+			self.entries[key] = (value, size, expires_at)
+			self.num_bytes += size
+
+			while len(self.entries) > self.max_entries or \
+				(self.max_bytes is not None and self.num_bytes > self.max_bytes):
+				_, (_, evicted_size, _) = self.entries.popitem(last=False)
+				self.num_bytes -= evicted_size
+				self.evictions += 1
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.num_bytes = 0
+
+	def stats(self):
+		""" Returns the counters of the cache """
+		with self.lock:
+			num_lookups = self.hits + self.misses
+			return {
+				'entries': len(self.entries),
+				'bytes': self.num_bytes,
+				'max_entries': self.max_entries,
+				'max_bytes': self.max_bytes,
+				'ttl': self.ttl,
+				'hits': self.hits,
+				'misses': self.misses,
+				'evictions': self.evictions,
+				'expirations': self.expirations,
+				'hit_rate': float(self.hits) / num_lookups if num_lookups > 0 else 0.0,
+			}
+
+def object_size(freebase_obj):
+	return OBJECT_OVERHEAD + sys.getsizeof(freebase_obj.freebase_id) + sys.getsizeof(freebase_obj.freebase_name)
+
+def names_size(names):
+	""" Estimated bytes of a get_names result """
+	freebase_objs, _ = names
+	return sum(object_size(freebase_obj) for freebase_obj in freebase_objs)
+
+def facts_size(facts):
+	""" Estimated bytes of a get_facts_by_ids result, filtered facts share the fact objects """
+	freebase_facts = facts[0]
+	if isinstance(freebase_facts, FactBatch):
+		return freebase_facts.num_bytes()
+	return sum(OBJECT_OVERHEAD + object_size(fact.src) + object_size(fact.pred) + object_size(fact.tgt) \
+		for fact in freebase_facts)
+
+def copy_result(value):
+	""" Returns a copy of a cached lookup result that the caller can modify without changing
+		the cached one. Fact and name objects are shared, their containers are copied
+	"""
+	if isinstance(value, tuple):
+		return tuple(copy_result(item) for item in value)
+	if isinstance(value, FactBatch):
+		return value.copy()
+	if isinstance(value, list):
+		return list(value)
+	if isinstance(value, dict):
+		copied = copy.copy(value)
+		for key, item in value.items():
+			copied[key] = copy_result(item)
+		return copied
+	return value
+
+class CachedFreebaseHelper(BackendWrapper):
+	""" Caches name and fact lookups of another backend.
+		Names are keyed on the normalized query, facts on the topic ids in request order
+		since backends return the facts of the first ids first. Every lookup returns a copy
+		of the cached result
+	"""
+	def __init__(self, backend, max_entries, max_bytes=None, ttl=None):
+		self.backend = backend
+		self.name = backend.name
+		self.name_cache = LookupCache(max_entries, max_bytes, ttl)
+		self.fact_cache = LookupCache(max_entries, max_bytes, ttl)
+
+	def set_index(self, index_name):
+		self.backend.set_index(index_name)
+		self.name_cache.clear()
+		self.fact_cache.clear()
+
+	def get_names(self, query, num_results):
+		key = (query, str(num_results))
+		hit, names = self.name_cache.get(key)
+		if not hit:
+			names = self.backend.get_names(query, num_results)
+			self.name_cache.put(key, names, names_size(names))
+		return copy_result(names)
+
+	def get_names_batch(self, queries, num_results):
+		results = [None] * len(queries)
+		missed_queries = []
+		missed_indices = []
+		for i, query in enumerate(queries):
+			hit, names = self.name_cache.get((query, str(num_results)))
+			if hit:
+				results[i] = copy_result(names)
+			else:
+				missed_queries.append(query)
+				missed_indices.append(i)
+
+		if missed_queries:
+			missed_results = self.backend.get_names_batch(missed_queries, num_results)
+			for i, query, names in zip(missed_indices, missed_queries, missed_results):
+				self.name_cache.put((query, str(num_results)), names, names_size(names))
+				results[i] = copy_result(names)
+		return results
+
+	def get_facts_by_ids(self, topic_ids, num_results, num_results_per_topic, predicate_filter=None):
+		key = (tuple(topic_ids), str(num_results), str(num_results_per_topic))
+		if predicate_filter:
+			key += (predicate_filter.key(),)
+		hit, facts = self.fact_cache.get(key)
+		if not hit:
+			facts = self.backend.get_facts_by_ids(topic_ids, num_results, num_results_per_topic, predicate_filter)
+			self.fact_cache.put(key, facts, facts_size(facts))
+		return copy_result(facts)
+
+	def get_facts_by_ids_aggregated(self, topic_ids, num_predicates, num_results_per_topic, predicate_filter=None):
+		key = ('aggregated', tuple(topic_ids), str(num_predicates), str(num_results_per_topic),
+			predicate_filter.key() if predicate_filter else None)
+		hit, facts = self.fact_cache.get(key)
+		if not hit:
+			facts = self.backend.get_facts_by_ids_aggregated(topic_ids, num_predicates, num_results_per_topic,
+				predicate_filter)
+			self.fact_cache.put(key, facts, facts_size(facts))
+		return copy_result(facts)
+
+	def get_neighbor_facts(self, topic_ids, num_results_per_id, predicates=None, reverse=False):
+		key = ('neighbors', tuple(topic_ids), str(num_results_per_id),
+			tuple(sorted(predicates)) if predicates else None, reverse)
+		hit, facts = self.fact_cache.get(key)
+		if not hit:
+			facts = self.backend.get_neighbor_facts(topic_ids, num_results_per_id, predicates, reverse)
+			self.fact_cache.put(key, facts, facts_size(facts))
+		return copy_result(facts)
+
+	def get_predicate_sets(self, topic_ids, predicate_filter=None):
+		# Every id is cached on its own, like the queries of a name batch
+		filter_key = predicate_filter.key() if predicate_filter else None
+		results = [None] * len(topic_ids)
+		missed_ids = []
+		missed_indices = []
+		for i, topic_id in enumerate(topic_ids):
+			hit, predicates = self.fact_cache.get(('predicates', topic_id, filter_key))
+			if hit:
+				results[i] = list(predicates)
+			else:
+				missed_ids.append(topic_id)
+				missed_indices.append(i)
+
+		if missed_ids:
+			missed_results = self.backend.get_predicate_sets(missed_ids, predicate_filter)
+			for i, topic_id, predicates in zip(missed_indices, missed_ids, missed_results):
+				self.fact_cache.put(('predicates', topic_id, filter_key), predicates,
+					sum(sys.getsizeof(predicate) for predicate in predicates))
+				results[i] = list(predicates)
+		return results
+
+	def stats(self):
+		""" Returns the counters of the name and fact caches """
+		return {'names': self.name_cache.stats(), 'facts': self.fact_cache.stats()}
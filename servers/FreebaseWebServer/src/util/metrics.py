@@ -0,0 +1,158 @@
+import time
+import bisect
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+def format_labels(labelnames, labels):
+	if not labelnames:
+		return ''
+	return '{%s}' % ','.join('%s="%s"' % (name, value) for name, value in zip(labelnames, labels))
+
+def format_value(value):
+	return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram(object):
+	""" Prometheus histogram with one series per combination of label values """
+	def __init__(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+		self.name = name
+		self.documentation = documentation
+		self.labelnames = labelnames
+		self.buckets = buckets
+		self.series = OrderedDict()
+		self.lock = threading.Lock()
+
+	def observe(self, value, *labels):
+		with self.lock:
+			series = self.series.get(labels)
+			if series is None:
+				series = self.series[labels] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+			index = bisect.bisect_left(self.buckets, value)
+			if index < len(self.buckets):
+				series['buckets'][index] += 1
+			series['sum'] += value
+			series['count'] += 1
+
+	def render(self):
+		lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s histogram' % self.name]
+		with self.lock:
+			for labels, series in self.series.items():
+				cumulative = 0
+				for bound, count in zip(self.buckets, series['buckets']):
+					cumulative += count
+					bucket_labels = format_labels(self.labelnames + ('le',), labels + (format_value(bound),))
+					lines.append('%s_bucket%s %d' % (self.name, bucket_labels, cumulative))
+				bucket_labels = format_labels(self.labelnames + ('le',), labels + ('+Inf',))
+				lines.append('%s_bucket%s %d' % (self.name, bucket_labels, series['count']))
+				lines.append('%s_sum%s %s' % (self.name, format_labels(self.labelnames, labels), format_value(series['sum'])))
+				lines.append('%s_count%s %d' % (self.name, format_labels(self.labelnames, labels), series['count']))
+		return lines
+
+class Counter(object):
+	""" Prometheus counter with one series per combination of label values """
+	def __init__(self, name, documentation, labelnames=()):
+		self.name = name
+		self.documentation = documentation
+		self.labelnames = labelnames
+		self.series = OrderedDict()
+		self.lock = threading.Lock()
+
+	def inc(self, value, *labels):
+		with self.lock:
+			self.series[labels] = self.series.get(labels, 0) + value
+
+	def render(self):
+		lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s counter' % self.name]
+		with self.lock:
+			for labels, value in self.series.items():
+				lines.append('%s%s %s' % (self.name, format_labels(self.labelnames, labels), format_value(value)))
+		return lines
+
+STAGE_SECONDS = Histogram('freebase_stage_seconds',
+	'Time spent in each stage of a request, excluding nested stages', ('endpoint', 'stage'))
+REQUEST_SECONDS = Histogram('freebase_request_seconds', 'Time spent handling a request', ('endpoint',))
+REQUEST_COUNTS = Histogram('freebase_request_counts',
+	'Elasticsearch calls and hits per request', ('endpoint', 'count'), COUNT_BUCKETS)
+COUNTS_TOTAL = Counter('freebase_counts_total', 'Elasticsearch calls and hits over all requests', ('endpoint', 'count'))
+METRICS = [STAGE_SECONDS, REQUEST_SECONDS, REQUEST_COUNTS, COUNTS_TOTAL]
+
+# Timings of the request handled by the current thread (or greenlet when patched by gevent)
+local = threading.local()
+
+class RequestTimings(object):
+	""" Stage durations and counters of one request. Time spent in a nested stage
+		is only reported for that stage, so the stages add up to the request time
+	"""
+	def __init__(self):
+		self.start_time = time.time()
+		self.stages = OrderedDict()
+		self.counts = OrderedDict()
+		self.stack = []
+
+	def start_stage(self):
+		self.stack.append(0.0)
+		return time.time()
+
+	def end_stage(self, name, start_time):
+		duration = time.time() - start_time
+		nested = self.stack.pop()
+		self.stages[name] = self.stages.get(name, 0.0) + duration - nested
+		if self.stack:
+			self.stack[-1] += duration
+
+	def count(self, name, value):
+		self.counts[name] = self.counts.get(name, 0) + value
+
+	def server_timing(self):
+		""" Returns the Server-Timing header value with stage durations in milliseconds """
+		return ', '.join('%s;dur=%.3f' % (name, duration * 1000.0) for name, duration in self.stages.items())
+
+	def publish(self, endpoint):
+		REQUEST_SECONDS.observe(time.time() - self.start_time, endpoint)
+		for name, duration in self.stages.items():
+			STAGE_SECONDS.observe(duration, endpoint, name)
+		for name, value in self.counts.items():
+			REQUEST_COUNTS.observe(value, endpoint, name)
+			COUNTS_TOTAL.inc(value, endpoint, name)
+
+def start_request():
+	local.timings = RequestTimings()
+	return local.timings
+
+def current():
+	""" Returns the timings of the current request, None outside of one """
+	return getattr(local, 'timings', None)
+
+def finish_request():
+	timings = current()
+	local.timings = None
+	return timings
+
+@contextmanager
+def stage(name):
+	""" Times the enclosed block as stage name of the current request, if any """
+	timings = current()
+	if timings is None:
+		yield
+		return
+	start_time = timings.start_stage()
+	try:
+		yield
+	finally:
+		timings.end_stage(name, start_time)
+
+def count(name, value=1):
+	""" Adds value to counter name of the current request, if any """
+	timings = current()
+	if timings is not None:
+		timings.count(name, value)
+
+def render():
+	""" Returns every metric in the Prometheus text format """
+	lines = []
+	for metric in METRICS:
+		lines.extend(metric.render())
+	return '\n'.join(lines) + '\n'
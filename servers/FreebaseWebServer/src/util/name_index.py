@@ -0,0 +1,245 @@
+import os
+import re
+import hashlib
+from collections import Counter
+import numpy as np
+
+TERMS_FILE = '%s_terms.npy'
+OFFSETS_FILE = '%s_offsets.npy'
+DOCS_FILE = '%s_docs.npy'
+TFS_FILE = '%s_tfs.npy'
+LENGTHS_FILE = '%s_lengths.npy'
+DOC_IDS_FILE = 'doc_ids.npy'
+DOC_ORDER_FILE = 'doc_order.npy'
+NAMES_FILE = 'doc_names.npy'
+NAME_OFFSETS_FILE = 'doc_name_offsets.npy'
+DESCRIPTIONS_FILE = 'doc_descriptions.npy'
+DESCRIPTION_OFFSETS_FILE = 'doc_description_offsets.npy'
+
+TOKEN_REGEX = re.compile(r'\w+', re.UNICODE)
+
+def analyze(text):
+	""" Lowercases text and splits it into word tokens """
+	return TOKEN_REGEX.findall(text.lower())
+
+def shingles(tokens, min_shingle_size=1, max_shingle_size=5):
+	""" Returns all word shingles of tokens, like the custom_shingle filter of
+		FreebaseHelper.create_index (output_unigrams is on)
+	"""
+	all_shingles = []
+	for i in range(len(tokens)):
+		for size in range(min_shingle_size, max_shingle_size + 1):
+			if i + size > len(tokens):
+				break
+			all_shingles.append(' '.join(tokens[i:i + size]))
+	return all_shingles
+
+def pack_strings(values):
+	""" Returns (blob, offsets) holding utf-8 values back to back, value i is
+		blob[offsets[i]:offsets[i + 1]]. Unlike a bytes array, no value is padded to the longest one
+	"""
+	encoded = [value if isinstance(value, bytes) else value.encode('utf-8') for value in values]
+	offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+	np.cumsum([len(value) for value in encoded], out=offsets[1:])
+	return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+def unpack_string(blob, offsets, i):
+	""" Returns value i of pack_strings as unicode """
+	return blob[int(offsets[i]):int(offsets[i + 1])].tobytes().decode('utf-8')
+
+def term_hash(term):
+	""" Stable 64 bit hash of a term, used as its key in the term dictionary """
+	if not isinstance(term, bytes):
+		term = term.encode('utf-8')
+	return int(hashlib.md5(term).hexdigest()[:16], 16)
+
+class ShingleNameIndex(object):
+	""" Inverted index over entity names and descriptions that mirrors the
+		evolutionAnalyzer (standard tokens, lowercase, 1-5 word shingles) and
+		scores the multi_match query of FreebaseHelper.get_names with BM25.
+		Every field keeps a sorted array of term hashes and CSR posting lists
+		(sorted doc ids with term frequencies), so the index can be saved and
+		memory-mapped back. Names and descriptions are saved with it, so a saved index
+		resolves the names of its docs without the name files.
+	"""
+	FIELDS = ('name', 'description')
+	BOOSTS = {'name': 1.0, 'description': 2.0}
+	K1 = 1.2
+	B = 0.75
+
+	def __init__(self, arrays):
+		self.doc_ids = arrays[DOC_IDS_FILE]
+		self.num_docs = len(self.doc_ids)
+
+		# Indices saved before names were stored with them only have doc ids
+		self.has_names = NAMES_FILE in arrays
+		if self.has_names:
+			self.doc_order = arrays[DOC_ORDER_FILE]
+			self.names = arrays[NAMES_FILE]
+			self.name_offsets = arrays[NAME_OFFSETS_FILE]
+			self.descriptions = arrays[DESCRIPTIONS_FILE]
+			self.description_offsets = arrays[DESCRIPTION_OFFSETS_FILE]
+		self.fields = {}
+		for field in ShingleNameIndex.FIELDS:
+			lengths = arrays[LENGTHS_FILE % field]
+			num_field_docs = int(np.count_nonzero(lengths))
+			self.fields[field] = {
+				'terms': arrays[TERMS_FILE % field],
+				'offsets': arrays[OFFSETS_FILE % field],
+				'docs': arrays[DOCS_FILE % field],
+				'tfs': arrays[TFS_FILE % field],
+				'lengths': lengths,
+				'avg_length': float(lengths.sum()) / num_field_docs if num_field_docs > 0 else 1.0,
+			}
+
+	@classmethod
+	def analyze(cls, text):
+		""" Returns the shingles of text indexed by the evolutionAnalyzer """
+		return shingles(analyze(text))
+
+	@classmethod
+	def build(cls, documents, index_dir=None):
+		""" Builds an index from (freebase_id, name, description) documents and
+			optionally saves it to index_dir
+		"""
+		doc_ids = []
+		names = []
+		descriptions = []
+		postings = dict((field, ([], [], [])) for field in ShingleNameIndex.FIELDS)
+		lengths = dict((field, []) for field in ShingleNameIndex.FIELDS)
+
+		for doc, (freebase_id, name, description) in enumerate(documents):
+			doc_ids.append(freebase_id)
+			names.append(name)
+			descriptions.append(description)
+			field_values = {'name': name, 'description': description if description != 'NODESCRIPTION' else ''}
+			for field in ShingleNameIndex.FIELDS:
+				tokens = analyze(field_values[field])
+				# Shingles share the position of their first token, so only unigrams count towards length
+				lengths[field].append(len(tokens))
+				hashes, docs, tfs = postings[field]
+				for term, tf in Counter(shingles(tokens)).items():
+					hashes.append(term_hash(term))
+					docs.append(doc)
+					tfs.append(tf)
+
+		arrays = {DOC_IDS_FILE: np.array(doc_ids, dtype=bytes)}
+		arrays[DOC_ORDER_FILE] = np.argsort(arrays[DOC_IDS_FILE], kind='mergesort').astype(np.int32)
+		arrays[NAMES_FILE], arrays[NAME_OFFSETS_FILE] = pack_strings(names)
+		arrays[DESCRIPTIONS_FILE], arrays[DESCRIPTION_OFFSETS_FILE] = pack_strings(descriptions)
+		for field in ShingleNameIndex.FIELDS:
+			hashes, docs, tfs = postings[field]
+			hashes = np.array(hashes, dtype=np.uint64)
+			# Stable sort keeps the doc ids of every posting list sorted
+			order = np.argsort(hashes, kind='mergesort')
+			hashes = hashes[order]
+			terms, starts = np.unique(hashes, return_index=True)
+			offsets = np.append(starts, len(hashes)).astype(np.int64)
+
+			arrays[TERMS_FILE % field] = terms
+			arrays[OFFSETS_FILE % field] = offsets
+			arrays[DOCS_FILE % field] = np.array(docs, dtype=np.int32)[order]
+			arrays[TFS_FILE % field] = np.minimum(np.array(tfs, dtype=np.int64), 65535).astype(np.uint16)[order]
+			arrays[LENGTHS_FILE % field] = np.minimum(np.array(lengths[field], dtype=np.int64), 65535).astype(np.uint16)
+
+		if index_dir is not None:
+			if not os.path.exists(index_dir):
+				os.makedirs(index_dir)
+			for file_name, array in arrays.items():
+				np.save(os.path.join(index_dir, file_name), array)
+			print("Saved name index of %d documents to %s" % (len(doc_ids), index_dir))
+
+		return cls(arrays)
+
+	@classmethod
+	def load(cls, index_dir):
+		""" Memory-maps an index saved with build """
+		arrays = {DOC_IDS_FILE: np.load(os.path.join(index_dir, DOC_IDS_FILE), mmap_mode='r')}
+		for file_name in (DOC_ORDER_FILE, NAMES_FILE, NAME_OFFSETS_FILE, DESCRIPTIONS_FILE, DESCRIPTION_OFFSETS_FILE):
+			if os.path.exists(os.path.join(index_dir, file_name)):
+				arrays[file_name] = np.load(os.path.join(index_dir, file_name), mmap_mode='r')
+		for field in ShingleNameIndex.FIELDS:
+			for file_name in (TERMS_FILE, OFFSETS_FILE, DOCS_FILE, TFS_FILE, LENGTHS_FILE):
+				arrays[file_name % field] = np.load(os.path.join(index_dir, file_name % field), mmap_mode='r')
+		return cls(arrays)
+
+	def freebase_id(self, doc):
+		return self.doc_ids[doc].decode('utf-8')
+
+	def doc(self, freebase_id):
+		""" Returns the doc of freebase_id, or -1 if it is not indexed """
+		key = freebase_id.encode('utf-8') if not isinstance(freebase_id, bytes) else freebase_id
+		position = int(np.searchsorted(self.doc_ids, key, sorter=self.doc_order))
+		if position < self.num_docs and self.doc_ids[self.doc_order[position]] == key:
+			return int(self.doc_order[position])
+		return -1
+
+	def document(self, freebase_id):
+		""" Returns (name, description) of freebase_id, or None if it is not indexed """
+		if not self.has_names:
+			return None
+		doc = self.doc(freebase_id)
+		if doc < 0:
+			return None
+		return unpack_string(self.names, self.name_offsets, doc), \
+			unpack_string(self.descriptions, self.description_offsets, doc)
+
+	def score_field(self, field, query_terms):
+		""" Returns (docs, BM25 scores) of every doc matching query_terms in field """
+		index = self.fields[field]
+		empty = np.zeros(0, dtype=np.int32), np.zeros(0)
+		if len(query_terms) == 0 or len(index['terms']) == 0:
+			return empty
+
+		keys = np.array([term_hash(term) for term in query_terms], dtype=np.uint64)
+		query_tfs = np.array(list(query_terms.values()), dtype=np.float64)
+		positions = np.minimum(np.searchsorted(index['terms'], keys), len(index['terms']) - 1)
+		found = index['terms'][positions] == keys
+		if not found.any():
+			return empty
+
+		positions = positions[found]
+		starts = index['offsets'][positions]
+		doc_freqs = index['offsets'][positions + 1] - starts
+		idfs = np.log(1.0 + (self.num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5))
+
+		# Gather all posting lists of the query in one shot
+		term_of_posting = np.repeat(np.arange(len(positions)), doc_freqs)
+		rows = starts[term_of_posting] + np.arange(len(term_of_posting)) - \
+			np.repeat(np.cumsum(doc_freqs) - doc_freqs, doc_freqs)
+		docs = index['docs'][rows]
+		tfs = index['tfs'][rows].astype(np.float64)
+		norms = ShingleNameIndex.K1 * (1.0 - ShingleNameIndex.B + \
+			ShingleNameIndex.B * index['lengths'][docs] / index['avg_length'])
+		scores = (query_tfs[found] * idfs)[term_of_posting] * tfs * (ShingleNameIndex.K1 + 1.0) / (tfs + norms)
+
+		docs, inverse = np.unique(docs, return_inverse=True)
+		return docs, np.bincount(inverse, weights=scores)
+
+	def search(self, query, num_results, boosts=None):
+		""" Returns ([(freebase_id, score)], number of matching docs) for query, scoring
+			every doc with its best boosted field like a best_fields multi_match
+			boosts: field -> boost, fields missing from it are not searched
+		"""
+		boosts = ShingleNameIndex.BOOSTS if boosts is None else boosts
+		query_terms = Counter(ShingleNameIndex.analyze(query))
+
+		field_docs = []
+		field_scores = []
+		for field, boost in boosts.items():
+			docs, scores = self.score_field(field, query_terms)
+			field_docs.append(docs)
+			field_scores.append(scores * boost)
+
+		docs, inverse = np.unique(np.concatenate(field_docs), return_inverse=True)
+		if len(docs) == 0:
+			return [], 0
+		scores = np.zeros(len(docs))
+		np.maximum.at(scores, inverse, np.concatenate(field_scores))
+
+		num_results = min(int(num_results), len(docs))
+		if num_results <= 0:
+			return [], len(docs)
+		top = np.argpartition(-scores, num_results - 1)[:num_results]
+		top = top[np.lexsort((docs[top], -scores[top]))]
+		return [(self.freebase_id(docs[i]), float(scores[i])) for i in top], len(docs)
@@ -0,0 +1,64 @@
+from collections import deque
+
+class AhoCorasick(object):
+	""" Aho-Corasick automaton over a list of patterns.
+		Finds every pattern occurring in a text in time linear in the text length
+		plus the number of distinct patterns found
+	"""
+	def __init__(self, patterns):
+		self.patterns = patterns
+
+		# Trie transitions, failure links, pattern ending at each node and
+		# link to the closest node on the failure chain that ends a pattern
+		self.goto = [{}]
+		self.fail = [0]
+		self.output = [-1]
+		self.output_link = [-1]
+
+		for i, pattern in enumerate(patterns):
+			node = 0
+			for char in pattern:
+				next_node = self.goto[node].get(char)
+				if next_node is None:
+					next_node = len(self.goto)
+					self.goto[node][char] = next_node
+					self.goto.append({})
+					self.fail.append(0)
+					self.output.append(-1)
+					self.output_link.append(-1)
+				node = next_node
+			if self.output[node] < 0:
+				self.output[node] = i
+
+		# Breadth first so failure links of shallower nodes are known
+		queue = deque(self.goto[0].values())
+		while queue:
+			node = queue.popleft()
+			for char, next_node in self.goto[node].items():
+				fail_node = self.fail[node]
+				while fail_node and char not in self.goto[fail_node]:
+					fail_node = self.fail[fail_node]
+				fail_node = self.goto[fail_node].get(char, 0)
+				self.fail[next_node] = fail_node
+				self.output_link[next_node] = fail_node if self.output[fail_node] >= 0 else self.output_link[fail_node]
+				queue.append(next_node)
+
+	def matches(self, text, found=None):
+		""" Returns the set of indices of patterns occurring in text
+			found: Set to add the indices to
+		"""
+		found = set() if found is None else found
+		visited = set()
+		node = 0
+		for char in text:
+			while node and char not in self.goto[node]:
+				node = self.fail[node]
+			node = self.goto[node].get(char, 0)
+
+			# Walk the nodes ending a pattern, each one at most once per text
+			match_node = node if self.output[node] >= 0 else self.output_link[node]
+			while match_node > 0 and match_node not in visited:
+				visited.add(match_node)
+				found.add(self.output[match_node])
+				match_node = self.output_link[match_node]
+		return found
@@ -0,0 +1,31 @@
+import re
+import string
+
+PUNCTUATION_REGEX = re.compile('[%s]' % re.escape(string.punctuation))
+
+def tokenize_text(text):
+	""" Port of datasets.tokenize_text_reg: lowercases text, drops line breaks and
+		splits it on whitespace after replacing punctuation with spaces
+	"""
+	text = text.lower().replace('\n', '').replace('\r', '')
+	return PUNCTUATION_REGEX.sub(' ', text).split()
+
+def split_text(text):
+	""" Port of string:split(' '), which drops empty fields """
+	return [token for token in text.split(' ') if token]
+
+def ngrams(tokens, n):
+	""" Port of dmn.functions.ngrams: every run of n consecutive tokens joined by spaces """
+	return [' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1)]
+
+def question_ngrams(question, max_ngrams):
+	""" Returns the candidate name queries EntityLinkerAPI:link builds for question:
+		1 to max_ngrams grams of the tokenized text, then of the space split text, per n
+	"""
+	tokenized_text = tokenize_text(question)
+	split_tokens = split_text(question)
+	all_possibilities = []
+	for n in range(1, max_ngrams + 1):
+		all_possibilities.extend(ngrams(tokenized_text, n))
+		all_possibilities.extend(ngrams(split_tokens, n))
+	return all_possibilities
@@ -0,0 +1,131 @@
+import os
+import numpy as np
+
+ENTITIES_FILE = 'entities.npy'
+OFFSETS_FILE = 'offsets.npy'
+PREDICATE_IDS_FILE = 'predicate_ids.npy'
+PREDICATES_FILE = 'predicates.npy'
+
+class PredicateFilter(object):
+	""" Predicates a fact lookup keeps: one of predicates or under one of the domains
+		(prefixes like /people/person/) when either is given, and neither one of
+		exclude_predicates nor under one of exclude_domains
+	"""
+	def __init__(self, predicates=None, exclude_predicates=None, domains=None, exclude_domains=None):
+		self.predicates = frozenset(predicates or ())
+		self.exclude_predicates = frozenset(exclude_predicates or ())
+		self.domains = tuple(sorted(set(domains or ())))
+		self.exclude_domains = tuple(sorted(set(exclude_domains or ())))
+
+	def __nonzero__(self):
+		return bool(self.predicates or self.exclude_predicates or self.domains or self.exclude_domains)
+
+	__bool__ = __nonzero__
+
+	def key(self):
+		""" Hashable value identifying the filter, for cache keys """
+		return (tuple(sorted(self.predicates)), tuple(sorted(self.exclude_predicates)), self.domains,
+			self.exclude_domains)
+
+	def matches(self, predicate):
+		if predicate in self.exclude_predicates or predicate.startswith(self.exclude_domains):
+			return False
+		if not self.predicates and not self.domains:
+			return True
+		return predicate in self.predicates or predicate.startswith(self.domains)
+
+	def mask(self, predicates):
+		""" Returns a boolean array of which of predicates match """
+		return np.array([self.matches(predicate) for predicate in predicates], dtype=bool)
+
+	def es_query(self, query):
+		""" Returns query restricted to the facts whose predicate field matches """
+		must = [query]
+		if self.predicates or self.domains:
+			should = [{"prefix": {"predicate": domain}} for domain in self.domains]
+			if self.predicates:
+				should.append({"terms": {"predicate": sorted(self.predicates)}})
+			must.append({"bool": {"should": should, "minimum_should_match": 1}})
+		must_not = [{"prefix": {"predicate": domain}} for domain in self.exclude_domains]
+		if self.exclude_predicates:
+			must_not.append({"terms": {"predicate": sorted(self.exclude_predicates)}})
+
+		bool_query = {"must": must}
+		if must_not:
+			bool_query["must_not"] = must_not
+		return {"bool": bool_query}
+
+class PredicateSetIndex(object):
+	""" Distinct predicates of every subject, for predicate candidate generation that
+		does not need the facts themselves. Subjects are a sorted array and the
+		predicates of subject i are the interned ids predicate_ids[offsets[i]:offsets[i + 1]]
+	"""
+	def __init__(self, arrays):
+		self.entities = arrays[ENTITIES_FILE]
+		self.offsets = arrays[OFFSETS_FILE]
+		self.predicate_ids = arrays[PREDICATE_IDS_FILE]
+		self.predicates = [predicate.decode('utf-8') for predicate in arrays[PREDICATES_FILE]]
+
+	@classmethod
+	def build(cls, triples, index_dir=None):
+		""" Builds an index from (subject, predicate, object) triples and optionally saves it to index_dir """
+		triples = list(triples)
+		entities = np.array(sorted(set(src for src, _, _ in triples)), dtype=bytes)
+		predicates = sorted(set(pred for _, pred, _ in triples))
+		predicate_ids = dict((pred, i) for i, pred in enumerate(predicates))
+
+		subjects = np.searchsorted(entities, np.array([src for src, _, _ in triples], dtype=bytes))
+		fact_predicates = np.array([predicate_ids[pred] for _, pred, _ in triples], dtype=np.int64)
+		return cls.from_columns(entities, predicates, subjects, fact_predicates, index_dir)
+
+	@classmethod
+	def from_fact_store(cls, fact_store, index_dir=None):
+		""" Builds an index from the interned facts of a FactStore """
+		subjects = np.repeat(np.arange(len(fact_store), dtype=np.int64), np.diff(fact_store.offsets))
+		return cls.from_columns(fact_store.entities, fact_store.predicates, subjects, fact_store.fact_predicates,
+			index_dir)
+
+	@classmethod
+	def from_columns(cls, entities, predicates, subjects, fact_predicates, index_dir=None):
+		""" entities: Sorted freebase ids, subjects: the index in entities of every fact's subject,
+			fact_predicates: the index in predicates of every fact's predicate
+		"""
+		num_predicates = max(len(predicates), 1)
+		# Distinct (subject, predicate) pairs, sorted by subject and then predicate
+		pairs = np.unique(np.asarray(subjects, dtype=np.int64) * num_predicates + np.asarray(fact_predicates))
+		offsets = np.zeros(len(entities) + 1, dtype=np.int64)
+		np.cumsum(np.bincount(pairs // num_predicates, minlength=len(entities)), out=offsets[1:])
+
+		arrays = {
+			ENTITIES_FILE: np.asarray(entities, dtype=bytes),
+			OFFSETS_FILE: offsets,
+			PREDICATE_IDS_FILE: (pairs % num_predicates).astype(np.int32),
+			PREDICATES_FILE: np.array([pred.encode('utf-8') if not isinstance(pred, bytes) else pred \
+				for pred in predicates], dtype=bytes)
+		}
+
+		if index_dir is not None:
+			if not os.path.exists(index_dir):
+				os.makedirs(index_dir)
+			for file_name, array in arrays.items():
+				np.save(os.path.join(index_dir, file_name), array)
+			print("Saved predicate sets of %d entities to %s" % (len(entities), index_dir))
+
+		return cls(arrays)
+
+	@classmethod
+	def load(cls, index_dir):
+		""" Memory-maps an index saved with build """
+		return cls(dict((file_name, np.load(os.path.join(index_dir, file_name), mmap_mode='r')) \
+			for file_name in (ENTITIES_FILE, OFFSETS_FILE, PREDICATE_IDS_FILE, PREDICATES_FILE)))
+
+	def predicate_set(self, freebase_id, predicate_filter=None):
+		""" Returns the sorted distinct predicates of freebase_id, [] if it has no facts """
+		key = freebase_id.encode('utf-8') if not isinstance(freebase_id, bytes) else freebase_id
+		index = int(np.searchsorted(self.entities, key))
+		if index >= len(self.entities) or self.entities[index] != key:
+			return []
+		predicates = [self.predicates[i] for i in self.predicate_ids[int(self.offsets[index]):int(self.offsets[index + 1])]]
+		if predicate_filter:
+			predicates = [predicate for predicate in predicates if predicate_filter.matches(predicate)]
+		return predicates
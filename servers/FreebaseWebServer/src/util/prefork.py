@@ -0,0 +1,220 @@
+import os
+import time
+import errno
+import select
+import random
+import signal
+import logging
+from werkzeug.serving import BaseWSGIServer
+
+logger = logging.getLogger(__name__)
+
+class WorkerWSGIServer(BaseWSGIServer):
+	""" Werkzeug server handling one request at a time on a listening socket shared
+		with the other workers. The socket is non-blocking, so a worker that loses the
+		race for a connection goes back to waiting instead of blocking in accept
+	"""
+	# Seconds handle_request waits for a connection before the worker checks its state
+	timeout = 1.0
+	request_queue_size = 2048
+
+	def __init__(self, host, port, app):
+		BaseWSGIServer.__init__(self, host, port, app)
+		self.socket.setblocking(0)
+		self.num_requests = 0
+
+	def handle_request(self):
+		""" Handles one request if a connection arrives within timeout """
+		try:
+			readable, _, _ = select.select([self], [], [], self.timeout)
+		except select.error as e:
+			if e.args[0] == errno.EINTR:
+				return
+			raise
+		if readable:
+			self._handle_request_noblock()
+
+	def get_request(self):
+		connection, address = BaseWSGIServer.get_request(self)
+		connection.setblocking(1)
+		return connection, address
+
+	def process_request(self, request, client_address):
+		BaseWSGIServer.process_request(self, request, client_address)
+		self.num_requests += 1
+
+class PreforkServer(object):
+	""" Binds the socket and loads the app in the parent, then forks num_workers processes
+		serving it, so everything loaded before the fork is shared copy-on-write.
+		The parent restarts workers that exit and handles signals:
+		SIGHUP: calls reload, starts a new set of workers and gracefully stops the old one
+		SIGTERM, SIGINT: gracefully stops the workers and exits
+		SIGTTIN, SIGTTOU: adds or removes a worker
+	"""
+	def __init__(self, app, host, port, num_workers, max_requests=0, max_requests_jitter=0,
+		graceful_timeout=30, reload=None, post_fork=None):
+		""" max_requests: Requests after which a worker exits and is replaced, 0 to never recycle
+			max_requests_jitter: Random extra requests per worker, so they do not all restart at once
+			graceful_timeout: Seconds stopping workers get to finish their requests before being killed
+			reload: Called in the parent on SIGHUP before the new workers are forked
+			post_fork: Called in every worker before it serves, to replace state like pooled
+				connections that must not be shared with the parent
+		"""
+		self.server = WorkerWSGIServer(host, port, app)
+		self.num_workers = num_workers
+		self.max_requests = max_requests
+		self.max_requests_jitter = max_requests_jitter
+		self.graceful_timeout = graceful_timeout
+		self.reload = reload
+		self.post_fork = post_fork
+		# pid -> generation of every running worker, bumped by every reload
+		self.workers = {}
+		self.generation = 0
+		self.signals = []
+		self.stopping = False
+
+	@property
+	def address(self):
+		return self.server.server_address
+
+	def handle_signal(self, signum, frame):
+		self.signals.append(signum)
+
+	def serve_forever(self):
+		for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGTTIN, signal.SIGTTOU):
+			signal.signal(signum, self.handle_signal)
+		logger.info("Serving on %s:%d with %d workers", self.address[0], self.address[1], self.num_workers)
+
+		try:
+			while not self.stopping:
+				self.reap_workers()
+				self.spawn_workers()
+				while self.signals:
+					self.process_signal(self.signals.pop(0))
+				# Signals interrupt the sleep
+				time.sleep(1.0)
+		finally:
+			self.stop_workers(list(self.workers))
+			self.server.server_close()
+
+	def process_signal(self, signum):
+		if signum == signal.SIGHUP:
+			self.reload_workers()
+		elif signum in (signal.SIGTERM, signal.SIGINT):
+			self.stopping = True
+		elif signum == signal.SIGTTIN:
+			self.num_workers += 1
+		elif signum == signal.SIGTTOU and self.num_workers > 1:
+			self.num_workers -= 1
+			current = self.current_workers()
+			if len(current) > self.num_workers:
+				self.signal_workers(current[:1], signal.SIGTERM)
+
+	def current_workers(self):
+		return sorted(pid for pid, generation in self.workers.items() if generation == self.generation)
+
+	def spawn_workers(self):
+		while not self.stopping and len(self.current_workers()) < self.num_workers:
+			self.spawn_worker()
+
+	def spawn_worker(self):
+		pid = os.fork()
+		if pid != 0:
+			self.workers[pid] = self.generation
+			return pid
+
+		# Worker process, never returns into the parent loop
+		exit_code = 0
+		try:
+			if self.post_fork is not None:
+				self.post_fork()
+			Worker(self.server, os.getppid(), self.worker_max_requests()).run()
+		except BaseException:
+			logger.exception("Worker %d failed", os.getpid())
+			exit_code = 1
+		finally:
+			os._exit(exit_code)
+
+	def worker_max_requests(self):
+		if self.max_requests <= 0:
+			return 0
+		return self.max_requests + random.randint(0, self.max_requests_jitter)
+
+	def reap_workers(self):
+		while self.workers:
+			try:
+				pid, status = os.waitpid(-1, os.WNOHANG)
+			except OSError as e:
+				if e.errno == errno.ECHILD:
+					self.workers.clear()
+					return
+				raise
+			if pid == 0:
+				return
+			if self.workers.pop(pid, None) is not None and status != 0:
+				logger.warning("Worker %d exited with status %d", pid, status)
+
+	def reload_workers(self):
+		""" Starts workers of a new generation before stopping the old ones, so requests
+			are served throughout the reload
+		"""
+		if self.reload is not None:
+			try:
+				self.reload()
+			except Exception:
+				logger.exception("Reload failed, keeping the current workers")
+				return
+		old_workers = list(self.workers)
+		self.generation += 1
+		self.spawn_workers()
+		self.stop_workers(old_workers)
+
+	def signal_workers(self, pids, signum):
+		for pid in pids:
+			try:
+				os.kill(pid, signum)
+			except OSError as e:
+				if e.errno != errno.ESRCH:
+					raise
+
+	def stop_workers(self, pids):
+		""" Asks workers to finish their current request and exit, killing them after graceful_timeout """
+		self.signal_workers(pids, signal.SIGTERM)
+		deadline = time.time() + self.graceful_timeout
+		while any(pid in self.workers for pid in pids) and time.time() < deadline:
+			time.sleep(0.1)
+			self.reap_workers()
+		remaining = [pid for pid in pids if pid in self.workers]
+		if remaining:
+			logger.warning("Killing workers %s after %d seconds", remaining, self.graceful_timeout)
+			self.signal_workers(remaining, signal.SIGKILL)
+			while any(pid in self.workers for pid in remaining):
+				time.sleep(0.1)
+				self.reap_workers()
+
+class Worker(object):
+	""" Serves requests until told to stop, max_requests were served or the parent died """
+	def __init__(self, server, parent_pid, max_requests=0):
+		self.server = server
+		self.parent_pid = parent_pid
+		self.max_requests = max_requests
+		self.alive = True
+
+	def stop(self, signum, frame):
+		self.alive = False
+
+	def run(self):
+		signal.signal(signal.SIGTERM, self.stop)
+		# Let the request being served finish its socket reads instead of failing with EINTR
+		signal.siginterrupt(signal.SIGTERM, False)
+		for signum in (signal.SIGTTIN, signal.SIGTTOU):
+			signal.signal(signum, signal.SIG_DFL)
+		# Ctrl-C and terminal hangups reach the whole process group, the parent stops or reloads the workers
+		for signum in (signal.SIGINT, signal.SIGHUP):
+			signal.signal(signum, signal.SIG_IGN)
+
+		while self.alive and os.getppid() == self.parent_pid:
+			self.server.handle_request()
+			if self.max_requests and self.server.num_requests >= self.max_requests:
+				logger.info("Worker %d recycled after %d requests", os.getpid(), self.server.num_requests)
+				break
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import threading
+from multiprocessing.pool import ThreadPool
+from .kb_backend import BackendWrapper
+from .local_freebase_helper import LocalFreebaseHelper, strip_freebase_url
+from .ngrams import question_ngrams
+
+def read_lines(path, limit=None):
+	with open(path, 'r') as f:
+		lines = [line.rstrip('\r\n') for line in f]
+	return lines[:limit] if limit else lines
+
+def load_simple_questions(dataset_dir):
+	""" Builds a local backend from annotated_fb_data_test.txt, naming subjects and objects
+		with the line aligned test/subject_names.txt and test/object_names.txt
+	"""
+	fact_path = os.path.join(dataset_dir, 'annotated_fb_data_test.txt')
+	helper = LocalFreebaseHelper([fact_path])
+	subject_names = read_lines(os.path.join(dataset_dir, 'test', 'subject_names.txt'))
+	object_names = read_lines(os.path.join(dataset_dir, 'test', 'object_names.txt'))
+
+	for line, subject_name, object_name in zip(read_lines(fact_path), subject_names, object_names):
+		items = line.split('\t')
+		for freebase_id, name in ((items[0], subject_name), (items[2].split()[0], object_name)):
+			freebase_id = strip_freebase_url(freebase_id)
+			if name and freebase_id not in helper.names:
+				helper.add_name(freebase_id, name)
+	helper.build_name_index()
+	return helper
+
+def percentile(sorted_values, percent):
+	""" Nearest rank percentile of already sorted values """
+	if not sorted_values:
+		return 0.0
+	return sorted_values[min(int(round(percent / 100.0 * (len(sorted_values) - 1))), len(sorted_values) - 1)]
+
+def peak_rss_mb():
+	""" Returns the peak resident set size of this process in MB, None if unknown """
+	try:
+		with open('/proc/self/status', 'r') as f:
+			for line in f:
+				if line.startswith('VmHWM:'):
+					return int(line.split()[1]) / 1024.0
+	except IOError:
+		pass
+	return None
+
+class CountingBackend(BackendWrapper):
+	""" Counts the lookups every thread sends to the wrapped backend """
+	def __init__(self, backend):
+		self.backend = backend
+		self.name = backend.name
+		self.local = threading.local()
+
+	def reset(self):
+		self.local.num_calls = 0
+
+	def num_calls(self):
+		return getattr(self.local, 'num_calls', 0)
+
+	def count(self):
+		self.local.num_calls = self.num_calls() + 1
+
+	def forward(self, method, *args):
+		self.count()
+		return BackendWrapper.forward(self, method, *args)
+
+class ReplayBenchmark(object):
+	""" Replays questions through the name and fact endpoints like the Lua evaluation:
+		candidate name queries, one batched name lookup, then one fact lookup for the
+		ids found, as QA_API:answer_v2 does with the entities of its queries
+		request: function(method, path, body) returning the decoded json response
+		counter: CountingBackend of an in-process server, None against a remote one
+	"""
+	def __init__(self, request, counter=None, num_results=1000, num_facts=10000):
+		self.request = request
+		self.counter = counter
+		self.num_results = num_results
+		self.num_facts = num_facts
+
+	def answer(self, queries):
+		""" Runs the lookups of one question, returns (seconds, requests, backend calls, number of facts) """
+		if self.counter is not None:
+			self.counter.reset()
+		start_time = time.time()
+
+		response = self.request('POST', '/api/v1/freebase/name/batch',
+			{'queries': queries, 'num_results': self.num_results, 'raw': False})
+		topic_ids = []
+		seen_ids = set()
+		for names in response['result']:
+			for name in names['result']:
+				if name['freebase_id'] not in seen_ids:
+					seen_ids.add(name['freebase_id'])
+					topic_ids.append(name['freebase_id'])
+
+		num_requests = 1
+		num_facts = 0
+		if topic_ids:
+			response = self.request('GET', '/api/v1/freebase/fact?topic_ids=%s&num_results=%d&raw=false' % \
+				(','.join(topic_ids), self.num_facts), None)
+			num_requests += 1
+			num_facts = len(response['result'])
+
+		num_backend_calls = self.counter.num_calls() if self.counter is not None else None
+		return time.time() - start_time, num_requests, num_backend_calls, num_facts
+
+	def run(self, workload, concurrency=1):
+		""" Answers every list of queries in workload with concurrency threads, returns a results dict """
+		pool = ThreadPool(concurrency)
+		start_time = time.time()
+		try:
+			answers = pool.map(self.answer, workload, chunksize=1)
+		finally:
+			pool.close()
+			pool.join()
+		elapsed = time.time() - start_time
+
+		latencies = sorted(answer[0] for answer in answers)
+		num_questions = len(answers)
+		results = {
+			'questions': num_questions,
+			'concurrency': concurrency,
+			'seconds': elapsed,
+			'questions_per_sec': num_questions / elapsed if elapsed > 0 else 0.0,
+			'latency_ms': {
+				'mean': 1000.0 * sum(latencies) / num_questions if num_questions else 0.0,
+				'p50': 1000.0 * percentile(latencies, 50),
+				'p95': 1000.0 * percentile(latencies, 95),
+				'p99': 1000.0 * percentile(latencies, 99),
+				'max': 1000.0 * latencies[-1] if latencies else 0.0
+			},
+			'requests_per_question': float(sum(answer[1] for answer in answers)) / max(num_questions, 1),
+			'backend_calls_per_question': None,
+			'facts_per_question': float(sum(answer[3] for answer in answers)) / max(num_questions, 1),
+			'peak_rss_mb': peak_rss_mb()
+		}
+		if self.counter is not None:
+			results['backend_calls_per_question'] = float(sum(answer[2] for answer in answers)) / max(num_questions, 1)
+		return results
+
+def question_workload(questions, max_ngrams):
+	""" Candidate queries of every question, expanded like EntityLinkerAPI:link """
+	return [question_ngrams(question, max_ngrams) for question in questions]
+
+def query_workload(queries):
+	""" One candidate query per question, like the reranked queries of answer_v2 """
+	return [[query] for query in queries]
+
+def save_results(results, output_path):
+	with open(output_path, 'w') as f:
+		json.dump(results, f, indent=2, sort_keys=True)
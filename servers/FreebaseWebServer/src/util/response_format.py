@@ -0,0 +1,89 @@
+import json
+from .freebase import FactBatch
+
+FACT_FIELDS = ('src_freebase_name', 'src_freebase_id', 'pred_freebase_name', 'pred_freebase_id',
+	'tgt_freebase_name', 'tgt_freebase_id')
+NAME_FIELDS = ('freebase_name', 'freebase_id')
+LINK_FIELDS = ('predicate_candidates', 'entity_candidates', 'entity_ids', 'fact_mappings')
+
+# json: a dict per fact or name, columnar: parallel arrays with interned predicates,
+# ndjson: one fact or name per line written as it is produced, msgpack: binary json
+FORMATS = ('json', 'columnar', 'ndjson', 'msgpack')
+
+def parse_fields(fields, all_fields):
+	""" Returns the requested fields in all_fields order, all of them when fields is empty
+		fields: Comma separated field names
+	"""
+	if not fields:
+		return all_fields
+	requested = set(field.strip() for field in fields.split(','))
+	unknown = requested.difference(all_fields)
+	if unknown:
+		raise ValueError("Unknown fields %s, expected some of %s" % (', '.join(sorted(unknown)), ', '.join(all_fields)))
+	return tuple(field for field in all_fields if field in requested)
+
+def fact_values(fact):
+	return {
+		'src_freebase_name': fact.src.freebase_name,
+		'src_freebase_id': fact.src.freebase_id,
+		'pred_freebase_name': fact.pred.freebase_name,
+		'pred_freebase_id': fact.pred.freebase_id,
+		'tgt_freebase_name': fact.tgt.freebase_name,
+		'tgt_freebase_id': fact.tgt.freebase_id
+	}
+
+def fact_row(fact, fields=FACT_FIELDS):
+	if fields is FACT_FIELDS:
+		return fact_values(fact)
+	values = fact_values(fact)
+	return dict((field, values[field]) for field in fields)
+
+def fact_rows(facts, fields=FACT_FIELDS):
+	""" Returns a dict of fields per fact, built from the columns of the fact batch """
+	batch = FactBatch.from_facts(facts)
+	return [dict(zip(fields, values)) for values in zip(*[batch.column(field) for field in fields])]
+
+def fact_columns(facts, fields=FACT_FIELDS):
+	""" Returns parallel arrays of fields. Predicates are interned, pred_freebase_name and
+		pred_freebase_id hold indices into the predicate names and ids arrays
+	"""
+	batch = FactBatch.from_facts(facts)
+	columns = dict((field, list(batch.column(field))) for field in fields if not field.startswith('pred_'))
+
+	if 'pred_freebase_name' in fields or 'pred_freebase_id' in fields:
+		# Predicate ids and names are the same string
+		predicate_indices = {}
+		predicates = []
+		indices = []
+		for predicate in batch.predicates:
+			index = predicate_indices.get(predicate)
+			if index is None:
+				index = predicate_indices[predicate] = len(predicates)
+				predicates.append(predicate)
+			indices.append(index)
+		if 'pred_freebase_name' in fields:
+			columns['pred_freebase_name'] = indices
+			columns['predicate_names'] = predicates
+		if 'pred_freebase_id' in fields:
+			columns['pred_freebase_id'] = indices
+			columns['predicate_ids'] = predicates
+	columns['length'] = len(batch)
+	return columns
+
+def name_rows(names, fields=NAME_FIELDS):
+	""" Returns a dict of fields per name, names are dicts with freebase_name and freebase_id """
+	if fields is NAME_FIELDS:
+		return names
+	return [dict((field, name[field]) for field in fields) for name in names]
+
+def name_columns(names, fields=NAME_FIELDS):
+	""" Returns parallel arrays of fields """
+	columns = dict((field, [name[field] for name in names]) for field in fields)
+	columns['length'] = len(names)
+	return columns
+
+def ndjson_lines(header, rows):
+	""" Yields header and every row as a line of json, rows can be a generator """
+	yield json.dumps(header) + '\n'
+	for row in rows:
+		yield json.dumps(row) + '\n'
@@ -0,0 +1,225 @@
+import os
+import json
+import zlib
+import struct
+import hashlib
+import threading
+
+# Every record is a header followed by its payload:
+# magic, slice, attempt, number of docs, payload length, crc32 of the payload
+RECORD = struct.Struct('<4sIIIII')
+HEADER = b'FBSH'
+CHUNK = b'FBSC'
+SLICE_DONE = b'FBSD'
+END = b'FBSE'
+VERSION = 1
+
+def encode_docs(docs):
+	""" Compresses (doc id, source) pairs as json lines """
+	return zlib.compress(b'\n'.join(json.dumps([doc_id, source], separators=(',', ':')).encode('utf-8') \
+		for doc_id, source in docs))
+
+def decode_docs(payload):
+	return [tuple(json.loads(line.decode('utf-8'))) for line in zlib.decompress(payload).split(b'\n') if line]
+
+def encode_record(magic, payload, slice_id=0, attempt=0, num_docs=0):
+	return RECORD.pack(magic, slice_id, attempt, num_docs, len(payload), zlib.crc32(payload) & 0xffffffff) + payload
+
+def read_records(f):
+	""" Yields (offset, magic, slice, attempt, num_docs, payload) of every record up to the
+		first torn or corrupt one, which an interrupted export leaves at the end
+	"""
+	while True:
+		offset = f.tell()
+		header = f.read(RECORD.size)
+		if len(header) < RECORD.size:
+			return
+		magic, slice_id, attempt, num_docs, length, crc = RECORD.unpack(header)
+		payload = f.read(length)
+		if magic not in (HEADER, CHUNK, SLICE_DONE, END) or len(payload) < length or \
+			zlib.crc32(payload) & 0xffffffff != crc:
+			return
+		yield offset, magic, slice_id, attempt, num_docs, payload
+
+def file_sha256(path, end):
+	""" Returns the sha256 of the first end bytes of path """
+	sha = hashlib.sha256()
+	with open(path, 'rb') as f:
+		remaining = end
+		while remaining > 0:
+			data = f.read(min(remaining, 1 << 20))
+			if not data:
+				break
+			sha.update(data)
+			remaining -= len(data)
+	return sha.hexdigest()
+
+class SnapshotState(object):
+	""" What an existing snapshot file holds: its header, the finished attempt of every
+		slice, the last attempt started per slice and where the intact records end
+	"""
+	def __init__(self, path):
+		self.header = None
+		self.finished = {}
+		self.attempts = {}
+		self.num_docs = 0
+		self.end = 0
+		self.summary = None
+		self.summary_offset = None
+		if not os.path.exists(path):
+			return
+
+		with open(path, 'rb') as f:
+			for offset, magic, slice_id, attempt, num_docs, payload in read_records(f):
+				if magic == HEADER:
+					self.header = json.loads(payload.decode('utf-8'))
+				elif magic == CHUNK:
+					self.attempts[slice_id] = max(attempt, self.attempts.get(slice_id, 0))
+				elif magic == SLICE_DONE:
+					self.finished[slice_id] = attempt
+					self.num_docs += num_docs
+				elif magic == END:
+					self.summary = json.loads(payload.decode('utf-8'))
+					self.summary_offset = offset
+				self.end = f.tell()
+
+	def next_attempt(self, slice_id):
+		return self.attempts.get(slice_id, -1) + 1
+
+class SnapshotExporter(object):
+	""" Exports an elasticsearch index into one snapshot file with a sliced scroll, one
+		worker thread per slice. Every scroll page is appended as a zlib compressed chunk
+		with a crc32, and a slice done record marks every finished slice, so an
+		interrupted export reruns only the slices it did not finish. The snapshot ends
+		with the sha256 of everything before it
+	"""
+	def __init__(self, es, index, doc_type, path, num_slices=4, chunk_size=1000, scroll='5m'):
+		self.es = es
+		self.index = index
+		self.doc_type = doc_type
+		self.path = path
+		self.num_slices = num_slices
+		self.chunk_size = chunk_size
+		self.scroll = scroll
+		self.lock = threading.Lock()
+		self.num_docs = 0
+		self.error = None
+
+	def append(self, f, record, sync=False):
+		with self.lock:
+			f.write(record)
+			f.flush()
+			if sync:
+				os.fsync(f.fileno())
+
+	def scroll_slice(self, slice_id):
+		""" Yields the pages of (doc id, source) of one slice of the index """
+		body = {"query": {"match_all": {}}, "sort": ["_doc"], "size": self.chunk_size}
+		if self.num_slices > 1:
+			body["slice"] = {"id": slice_id, "max": self.num_slices}
+		res = self.es.search(index=self.index, body=body, scroll=self.scroll)
+		scroll_id = res.get('_scroll_id')
+		try:
+			while res['hits']['hits'] and self.error is None:
+				yield [(hit['_id'], hit['_source']) for hit in res['hits']['hits']]
+				res = self.es.scroll(scroll_id=scroll_id, scroll=self.scroll)
+				scroll_id = res.get('_scroll_id', scroll_id)
+		finally:
+			if scroll_id is not None:
+				try:
+					self.es.clear_scroll(scroll_id=scroll_id)
+				except Exception:
+					pass
+
+	def export_slice(self, f, slice_id, attempt):
+		try:
+			num_docs = 0
+			for page in self.scroll_slice(slice_id):
+				self.append(f, encode_record(CHUNK, encode_docs(page), slice_id, attempt, len(page)))
+				num_docs += len(page)
+				with self.lock:
+					self.num_docs += len(page)
+			if self.error is None:
+				self.append(f, encode_record(SLICE_DONE, b'', slice_id, attempt, num_docs), sync=True)
+		except Exception as e:
+			self.error = e
+
+	def export(self):
+		""" Exports the slices missing from the snapshot
+			returns: Number of documents exported by this run
+		"""
+		state = SnapshotState(self.path)
+		if state.summary is not None:
+			print("Snapshot %s of %s is already complete" % (self.path, state.summary['index']))
+			return 0
+
+		header = {'version': VERSION, 'index': self.index, 'doc_type': self.doc_type, 'num_slices': self.num_slices}
+		if state.header is not None and state.header != header:
+			raise Exception("Snapshot %s was started for %s, resume it with the same index and slices" % \
+				(self.path, state.header))
+
+		self.num_docs = 0
+		self.error = None
+		with open(self.path, 'r+b' if os.path.exists(self.path) else 'wb') as f:
+			# Drop a record torn by the interruption
+			f.seek(state.end)
+			f.truncate()
+			if state.header is None:
+				self.append(f, encode_record(HEADER, json.dumps(header).encode('utf-8')), sync=True)
+
+			slices = [slice_id for slice_id in range(self.num_slices) if slice_id not in state.finished]
+			if state.finished:
+				print("Resuming %s, %d of %d slices left" % (self.path, len(slices), self.num_slices))
+			workers = [threading.Thread(target=self.export_slice, args=(f, slice_id, state.next_attempt(slice_id))) \
+				for slice_id in slices]
+			for worker in workers:
+				worker.daemon = True
+				worker.start()
+			for worker in workers:
+				worker.join()
+
+			if self.error is not None:
+				raise self.error
+
+			end = f.tell()
+			summary = dict(header, num_docs=state.num_docs + self.num_docs, sha256=file_sha256(self.path, end))
+			self.append(f, encode_record(END, json.dumps(summary).encode('utf-8')), sync=True)
+
+		print("Exported %d docs of %s to %s" % (self.num_docs, self.index, self.path))
+		return self.num_docs
+
+def snapshot_info(path):
+	""" Returns the header of a snapshot with its totals, after checking it is complete
+		and that its sha256 matches
+	"""
+	state = SnapshotState(path)
+	if state.summary is None:
+		raise Exception("Snapshot %s is incomplete, rerun its export to resume it" % path)
+	if file_sha256(path, state.summary_offset) != state.summary['sha256']:
+		raise Exception("Snapshot %s does not match its checksum" % path)
+	return state.summary
+
+def read_snapshot(path, verify=True):
+	""" Yields (doc id, source) of every document of a complete snapshot. Chunks of slice
+		attempts that did not finish are skipped
+	"""
+	if verify:
+		snapshot_info(path)
+	finished = SnapshotState(path).finished
+	with open(path, 'rb') as f:
+		for _, magic, slice_id, attempt, _, payload in read_records(f):
+			if magic == CHUNK and finished.get(slice_id) == attempt:
+				for doc in decode_docs(payload):
+					yield doc
+
+def snapshot_lines(path):
+	""" Yields the documents of a names or facts snapshot as lines of the name files and
+		triple files the local backend and build_fact_store read
+	"""
+	doc_type = snapshot_info(path)['doc_type']
+	for _, source in read_snapshot(path, verify=False):
+		if doc_type == 'name':
+			fields = (source['freebase_id'], source['name'], source.get('description') or 'NODESCRIPTION')
+		else:
+			fields = (source['src_freebase_id'], source['predicate'], source['tgt_freebase_id'])
+		yield u'\t'.join(fields).encode('utf-8') + b'\n'
@@ -0,0 +1,189 @@
+import os
+import re
+import json
+from six.moves.urllib.parse import urlencode
+from .local_freebase_helper import strip_freebase_url
+from .ngrams import tokenize_text
+from .tokenizer import replace_accents
+
+SHARD_FILE = 'shard_%04d.jsonl'
+DONE_FILE = 'shard_%04d.done'
+PREDICTION_FIELDS = ('entities', 'predicates', 'facts')
+
+def read_lines(path):
+	with open(path, 'r') as f:
+		return [line.rstrip('\r\n') for line in f]
+
+def load_gold(dataset_dir):
+	""" Returns one dict per test question with its question, subject name, predicate,
+		object ids and object name, from annotated_fb_data_test.txt and the aligned test/ files
+	"""
+	gold = []
+	subject_names = read_lines(os.path.join(dataset_dir, 'test', 'entities.txt'))
+	object_names = read_lines(os.path.join(dataset_dir, 'test', 'object_names.txt'))
+	for line, subject_name, object_name in zip(read_lines(os.path.join(dataset_dir, 'annotated_fb_data_test.txt')),
+		subject_names, object_names):
+		items = line.split('\t')
+		gold.append({
+			'question': items[3].strip() if len(items) > 3 else '',
+			'subject_id': strip_freebase_url(items[0]),
+			'subject_name': subject_name,
+			'predicate': strip_freebase_url(items[1]),
+			'object_ids': [strip_freebase_url(tgt) for tgt in items[2].split()],
+			'object_name': object_name
+		})
+	return gold
+
+def normalize_name(name):
+	if not isinstance(name, bytes):
+		name = name.encode('utf-8')
+	return replace_accents(name).lower().strip()
+
+def score_prediction(gold, prediction):
+	""" Returns (entity, predicate, fact, total) correctness of one prediction. Like the
+		Lua evaluation, a parse is correct when both entity and predicate are
+	"""
+	entity_correct = normalize_name(prediction['entity']) == normalize_name(gold['subject_name'])
+	predicate_correct = prediction['predicate'] == gold['predicate']
+	fact_ids = prediction['fact'].split()
+	fact_correct = any(fact_id in gold['object_ids'] for fact_id in fact_ids) or \
+		normalize_name(prediction['fact']) == normalize_name(gold['object_name'])
+	return entity_correct, predicate_correct, fact_correct, entity_correct and predicate_correct
+
+def score_predictions(gold, predictions):
+	""" Returns accuracies of predictions, a dict from question index to prediction """
+	totals = [0, 0, 0, 0]
+	for index, prediction in predictions.items():
+		for i, correct in enumerate(score_prediction(gold[index], prediction)):
+			totals[i] += int(correct)
+	num_seen = len(predictions)
+	accuracy = lambda total: float(total) / num_seen if num_seen else 0.0
+	return {
+		'questions': num_seen,
+		'entity_accuracy': accuracy(totals[0]),
+		'predicate_accuracy': accuracy(totals[1]),
+		'fact_accuracy': accuracy(totals[2]),
+		'accuracy': accuracy(totals[3])
+	}
+
+def predicate_words(predicate):
+	return set(word for word in re.split('[/_.]', predicate) if word)
+
+class LinkPredictor(object):
+	""" Baseline answerer over the /link endpoint, standing in for the Torch reranker:
+		picks the linked entity with the longest name found in the question, then its
+		predicate sharing the most words with the question
+		request: function(method, path, body) returning the decoded json response
+	"""
+	def __init__(self, request, max_ngrams=3, num_results=10, num_facts=5000):
+		self.request = request
+		self.max_ngrams = max_ngrams
+		self.num_results = num_results
+		self.num_facts = num_facts
+
+	def predict(self, question):
+		""" Returns {'entity', 'predicate', 'fact'}, empty strings when nothing was linked """
+		if isinstance(question, bytes):
+			question = question.decode('utf-8')
+		params = urlencode({'question': question.encode('utf-8'), 'ngrams': self.max_ngrams,
+			'num_results': self.num_results, 'num_facts': self.num_facts})
+		response = self.request('GET', '/api/v1/freebase/link?' + params, None)
+
+		question_text = ' %s ' % ' '.join(tokenize_text(question))
+		question_words = set(tokenize_text(question))
+		best_entity = ''
+		best_entity_score = None
+		for name in response['entity_candidates']:
+			name_text = ' '.join(tokenize_text(name))
+			score = (bool(name_text) and (' %s ' % name_text) in question_text, len(name_text))
+			if best_entity_score is None or score > best_entity_score:
+				best_entity, best_entity_score = name, score
+
+		best_predicate = ''
+		best_fact = ''
+		best_predicate_score = None
+		for key, fact in response['fact_mappings'].items():
+			if not key.startswith(best_entity + ' '):
+				continue
+			predicate = key[len(best_entity) + 1:]
+			score = (len(predicate_words(predicate) & question_words), predicate)
+			if best_predicate_score is None or score > best_predicate_score:
+				best_predicate, best_fact, best_predicate_score = predicate, fact, score
+		return {'entity': best_entity, 'predicate': best_predicate, 'fact': best_fact}
+
+def shard_ranges(num_questions, num_shards):
+	""" Splits question indices into num_shards contiguous (start, end) ranges """
+	shard_size = (num_questions + num_shards - 1) // num_shards
+	return [(start, min(start + shard_size, num_questions)) for start in range(0, num_questions, shard_size)]
+
+def read_shard(path):
+	""" Returns the predictions of a shard file, ignoring a last line cut off by a crash """
+	predictions = []
+	if not os.path.exists(path):
+		return predictions
+	with open(path, 'r') as f:
+		for line in f:
+			if not line.endswith('\n'):
+				break
+			predictions.append(json.loads(line))
+	return predictions
+
+def run_shard(predictor, questions, shard, start, end, output_dir):
+	""" Answers questions[start:end], appending one json line per question to the shard
+		file so a restarted run continues after the last answered question
+		returns: number of questions answered by this call
+	"""
+	done_path = os.path.join(output_dir, DONE_FILE % shard)
+	if os.path.exists(done_path):
+		return 0
+
+	shard_path = os.path.join(output_dir, SHARD_FILE % shard)
+	answered = read_shard(shard_path)
+	# Rewrite the complete lines in case the last one was cut off
+	with open(shard_path, 'w') as f:
+		for prediction in answered:
+			f.write(json.dumps(prediction) + '\n')
+
+		for index in range(start + len(answered), end):
+			prediction = predictor.predict(questions[index])
+			prediction['index'] = index
+			f.write(json.dumps(prediction) + '\n')
+			f.flush()
+
+	open(done_path, 'w').close()
+	return end - start - len(answered)
+
+def merge_shards(output_dir, num_shards):
+	""" Returns every prediction of the shard files, keyed on question index """
+	predictions = {}
+	for shard in range(num_shards):
+		for prediction in read_shard(os.path.join(output_dir, SHARD_FILE % shard)):
+			predictions[prediction['index']] = prediction
+	return predictions
+
+def write_predictions(predictions, output_dir):
+	""" Writes predictions_{entities,predicates,facts}.txt in question order, like the Lua evaluation """
+	indices = sorted(predictions.keys())
+	for field, key in zip(PREDICTION_FIELDS, ('entity', 'predicate', 'fact')):
+		with open(os.path.join(output_dir, 'predictions_%s.txt' % field), 'w') as f:
+			for index in indices:
+				value = predictions[index][key]
+				f.write((value if isinstance(value, bytes) else value.encode('utf-8')) + '\n')
+
+def read_lua_predictions(prediction_dir):
+	""" Returns the predictions of evaluate_sq_fb_dataset_v2.lua runs, merging every
+		predictions_*_<start_index>.txt set, keyed on question index
+	"""
+	predictions = {}
+	start_regex = re.compile(r'^predictions_entities_(\d+)\.txt$')
+	for file_name in sorted(os.listdir(prediction_dir)):
+		match = start_regex.match(file_name)
+		if match is None:
+			continue
+		start_index = int(match.group(1))
+		columns = [read_lines(os.path.join(prediction_dir, 'predictions_%s_%d.txt' % (field, start_index)))
+			for field in PREDICTION_FIELDS]
+		for offset, (entity, predicate, fact) in enumerate(zip(*columns)):
+			# Lua indices start at 1
+			predictions[start_index - 1 + offset] = {'entity': entity, 'predicate': predicate, 'fact': fact}
+	return predictions
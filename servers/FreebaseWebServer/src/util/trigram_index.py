@@ -0,0 +1,129 @@
+import os
+import numpy as np
+from unidecode import unidecode
+from .name_index import analyze, pack_strings, unpack_string
+
+TRIGRAMS_FILE = 'trigrams.npy'
+OFFSETS_FILE = 'offsets.npy'
+DOCS_FILE = 'docs.npy'
+SIZES_FILE = 'sizes.npy'
+DOC_IDS_FILE = 'doc_ids.npy'
+DOC_ID_OFFSETS_FILE = 'doc_id_offsets.npy'
+NAMES_FILE = 'names.npy'
+NAME_OFFSETS_FILE = 'name_offsets.npy'
+
+def normalize(text):
+	""" Lowercases text without accents and joins its word tokens with single spaces,
+		so 'Harder.....Faster' and 'harder faster' have the same trigrams
+	"""
+	if isinstance(text, bytes):
+		text = text.decode('utf-8', 'replace')
+	return ' '.join(analyze(unidecode(text)))
+
+def trigram_keys(text):
+	""" Returns the sorted distinct character trigrams of the space padded normalized
+		text, each packed into an integer from its three code points
+	"""
+	padded = ' %s ' % normalize(text)
+	if len(padded) <= 2:
+		return np.zeros(0, dtype=np.uint64)
+	codes = np.array([ord(c) for c in padded], dtype=np.uint64)
+	keys = (codes[:-2] << np.uint64(42)) | (codes[1:-1] << np.uint64(21)) | codes[2:]
+	return np.unique(keys)
+
+class TrigramNameIndex(object):
+	""" Character trigram index over entity names for typo tolerant lookups.
+		Keeps a sorted array of trigram keys with CSR posting lists of doc ids, and
+		scores docs by the Jaccard similarity of their trigram sets with the query.
+		Doc ids and names are utf-8 blobs with offsets, see name_index.pack_strings
+	"""
+	def __init__(self, arrays):
+		self.trigrams = arrays[TRIGRAMS_FILE]
+		self.offsets = arrays[OFFSETS_FILE]
+		self.docs = arrays[DOCS_FILE]
+		self.sizes = arrays[SIZES_FILE]
+		self.doc_ids = arrays[DOC_IDS_FILE]
+		self.doc_id_offsets = arrays[DOC_ID_OFFSETS_FILE]
+		self.names = arrays[NAMES_FILE]
+		self.name_offsets = arrays[NAME_OFFSETS_FILE]
+		self.num_docs = len(self.sizes)
+
+	@classmethod
+	def build(cls, documents, index_dir=None):
+		""" Builds an index from (freebase_id, name) documents and optionally saves it to index_dir """
+		doc_ids = []
+		names = []
+		doc_keys = []
+		for freebase_id, name in documents:
+			doc_ids.append(freebase_id)
+			names.append(name)
+			doc_keys.append(trigram_keys(name))
+
+		sizes = np.array([len(keys) for keys in doc_keys], dtype=np.int64)
+		keys = np.concatenate(doc_keys) if doc_keys else np.zeros(0, dtype=np.uint64)
+		docs = np.repeat(np.arange(len(doc_keys), dtype=np.int32), sizes)
+		# Stable sort keeps the doc ids of every posting list sorted
+		order = np.argsort(keys, kind='mergesort')
+		keys = keys[order]
+		trigrams, starts = np.unique(keys, return_index=True)
+
+		arrays = {
+			TRIGRAMS_FILE: trigrams,
+			OFFSETS_FILE: np.append(starts, len(keys)).astype(np.int64),
+			DOCS_FILE: docs[order],
+			SIZES_FILE: np.minimum(sizes, 65535).astype(np.uint16)
+		}
+		arrays[DOC_IDS_FILE], arrays[DOC_ID_OFFSETS_FILE] = pack_strings(doc_ids)
+		arrays[NAMES_FILE], arrays[NAME_OFFSETS_FILE] = pack_strings(names)
+
+		if index_dir is not None:
+			if not os.path.exists(index_dir):
+				os.makedirs(index_dir)
+			for file_name, array in arrays.items():
+				np.save(os.path.join(index_dir, file_name), array)
+			print("Saved trigram index of %d names to %s" % (len(doc_ids), index_dir))
+
+		return cls(arrays)
+
+	@classmethod
+	def load(cls, index_dir):
+		""" Memory-maps an index saved with build """
+		return cls(dict((file_name, np.load(os.path.join(index_dir, file_name), mmap_mode='r')) \
+			for file_name in (TRIGRAMS_FILE, OFFSETS_FILE, DOCS_FILE, SIZES_FILE, DOC_IDS_FILE, DOC_ID_OFFSETS_FILE,
+				NAMES_FILE, NAME_OFFSETS_FILE)))
+
+	def freebase_id(self, doc):
+		return unpack_string(self.doc_ids, self.doc_id_offsets, doc)
+
+	def name(self, doc):
+		return unpack_string(self.names, self.name_offsets, doc)
+
+	def search(self, query, num_results, min_similarity=0.0):
+		""" Returns ([(freebase_id, name, similarity)] best first, number of docs sharing a
+			trigram with query above min_similarity)
+		"""
+		query_keys = trigram_keys(query)
+		if len(query_keys) == 0 or len(self.trigrams) == 0:
+			return [], 0
+
+		positions = np.minimum(np.searchsorted(self.trigrams, query_keys), len(self.trigrams) - 1)
+		positions = positions[self.trigrams[positions] == query_keys]
+		if len(positions) == 0:
+			return [], 0
+
+		# Gather the posting lists of every query trigram in one shot and count shared trigrams per doc
+		starts = self.offsets[positions]
+		doc_freqs = self.offsets[positions + 1] - starts
+		rows = np.repeat(starts - (np.cumsum(doc_freqs) - doc_freqs), doc_freqs) + np.arange(doc_freqs.sum())
+		docs, overlaps = np.unique(self.docs[rows], return_counts=True)
+
+		similarities = overlaps / (len(query_keys) + self.sizes[docs].astype(np.float64) - overlaps)
+		matching = similarities > min_similarity
+		docs, similarities = docs[matching], similarities[matching]
+
+		num_results = min(int(num_results), len(docs))
+		if num_results <= 0:
+			return [], len(docs)
+		top = np.argpartition(-similarities, num_results - 1)[:num_results]
+		top = top[np.lexsort((docs[top], -similarities[top]))]
+		return [(self.freebase_id(docs[i]), self.name(docs[i]), float(similarities[i])) for i in top], len(docs)
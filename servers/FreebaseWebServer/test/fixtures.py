@@ -0,0 +1,13 @@
+from __future__ import absolute_import
+
+from util.freebase import FreebaseObject, FreebaseFact
+
+
+def freebase_name(freebase_id, name, description='NODESCRIPTION'):
+    return FreebaseObject(-1, freebase_id, name, [], description)
+
+
+def freebase_fact(src_id, src_name, predicate, tgt_id, tgt_name):
+    return FreebaseFact(FreebaseObject(-1, src_id, src_name),
+                        FreebaseObject(-1, predicate, predicate),
+                        FreebaseObject(-1, tgt_id, tgt_name))
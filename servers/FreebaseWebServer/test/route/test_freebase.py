@@ -0,0 +1,311 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import msgpack
+from mock import patch, MagicMock
+
+from server import server
+from util.local_freebase_helper import LocalFreebaseHelper
+from util.index_router import IndexRouter
+from test.fixtures import freebase_name, freebase_fact
+
+
+FACTS = [
+    freebase_fact('/m/0np6z99', 'Fearless', '/music/album/genre', '/m/01qzt1', 'Classic rock'),
+    freebase_fact('/m/0np6z99', 'Fearless', '/music/album/release_type', '/m/02lx2r', 'Album'),
+    freebase_fact('/m/0np6z98', 'Fearless', '/music/album/genre', '/m/064t9', 'Pop music'),
+]
+
+
+class TestFreebaseName(unittest.TestCase):
+
+    def setUp(self):
+        server.config['TESTING'] = True
+        self.client = server.test_client()
+
+    @patch('config.FREEBASE_HELPER')
+    def test_name_batch(self, fb_helper_mock):
+        fb_helper_mock.get_names_batch = MagicMock(return_value=[
+            ([freebase_name('/m/0np6z99', 'Fearless')], 1),
+            ([freebase_name('/m/0wzc58l', 'Alex Golfis')], 1),
+        ])
+
+        response = self.client.post(
+            '/api/v1/freebase/name/batch',
+            data=json.dumps({
+                'queries': ['is fearless', 'fearless', 'was alex golfis'],
+                'num_results': 10,
+            }),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # Both fearless queries normalize to the same backend query
+        fb_helper_mock.get_names_batch.assert_called_once_with(['fearless', 'alex golfis'], 10)
+
+        result = json.loads(response.data.decode('utf-8'))['result']
+        self.assertEqual(len(result), 3)
+        self.assertEqual(result[0]['result'], [{'freebase_name': 'Fearless', 'freebase_id': '/m/0np6z99'}])
+        self.assertEqual(result[1]['result'], result[0]['result'])
+        self.assertEqual(result[2]['result'], [{'freebase_name': 'Alex Golfis', 'freebase_id': '/m/0wzc58l'}])
+
+    @patch('config.FREEBASE_HELPER')
+    def test_name_batch_validates_queries(self, fb_helper_mock):
+        for body in ({}, {'queries': 'fearless'}, {'queries': ['fearless', 3]}, ['fearless']):
+            response = self.client.post('/api/v1/freebase/name/batch', data=json.dumps(body),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        self.assertFalse(fb_helper_mock.get_names_batch.called)
+
+    @patch('config.FREEBASE_HELPER')
+    def test_name_without_raw(self, fb_helper_mock):
+        fb_helper_mock.get_names = MagicMock(return_value=([freebase_name('/m/0np6z99', 'Fearless')], 1))
+        response = self.client.get('/api/v1/freebase/name?query=what+format+is+fearless&num_results=10&raw=false')
+        response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(response, {'result': [{'freebase_name': 'Fearless', 'freebase_id': '/m/0np6z99'}], 'num_items': 1})
+
+    @patch('config.FREEBASE_HELPER')
+    def test_fuzzy_name(self, fb_helper_mock):
+        fb_helper_mock.get_names_fuzzy = MagicMock(return_value=([freebase_name('/m/0np6z99', 'Fearless')], 4))
+        response = self.client.get('/api/v1/freebase/name?query=fearles&num_results=5&fuzzy=true&raw=false')
+        fb_helper_mock.get_names_fuzzy.assert_called_once_with('fearles', 5)
+        self.assertFalse(fb_helper_mock.get_names.called)
+
+        # Fuzzy matches are kept even though they do not appear in the query
+        response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(response, {'result': [{'freebase_name': 'Fearless', 'freebase_id': '/m/0np6z99'}], 'num_items': 4})
+
+        # Backends without a trigram index are not asked
+        fb_helper_mock.supports_fuzzy = MagicMock(return_value=False)
+        response = self.client.get('/api/v1/freebase/name?query=fearles&fuzzy=true')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(fb_helper_mock.get_names_fuzzy.call_count, 1)
+
+    def test_index(self):
+        fb_2m, fb_5m = MagicMock(), MagicMock()
+        fb_2m.name, fb_5m.name = 'FB_2M', 'FB_5M'
+        fb_2m.get_names = MagicMock(return_value=([freebase_name('/m/0np6z99', 'Fearless')], 1))
+        fb_5m.get_names = MagicMock(return_value=([freebase_name('/m/0np6z98', 'Fearless')], 1))
+        with patch('config.FREEBASE_HELPER', IndexRouter([('FB_2M', fb_2m), ('FB_5M', fb_5m)], 'FB_2M')):
+            response = self.client.get('/api/v1/freebase/name?query=fearless&raw=false&index=FB_5M')
+            self.assertEqual(json.loads(response.data.decode('utf-8'))['result'],
+                             [{'freebase_name': 'Fearless', 'freebase_id': '/m/0np6z98'}])
+            self.assertFalse(fb_2m.get_names.called)
+
+            response = self.client.get('/api/v1/freebase/name?query=fearless&raw=false&index=both')
+            self.assertEqual([name['freebase_id'] for name in json.loads(response.data.decode('utf-8'))['result']],
+                             ['/m/0np6z99', '/m/0np6z98'])
+
+            response = self.client.get('/api/v1/freebase/name?query=fearless&index=FB_10M')
+            self.assertEqual(response.status_code, 400)
+
+
+
+class TestFreebaseFact(unittest.TestCase):
+
+    def setUp(self):
+        server.config['TESTING'] = True
+        self.client = server.test_client()
+
+    def get_facts(self, fb_helper_mock, params=''):
+        fb_helper_mock.get_facts_by_ids = MagicMock(return_value=(FACTS, FACTS[:2], {}, 3))
+        return self.client.get('/api/v1/freebase/fact?topic_ids=/m/0np6z99,/m/0np6z98&num_results=10' + params)
+
+    @patch('config.FREEBASE_HELPER')
+    def test_default_response(self, fb_helper_mock):
+        response = json.loads(self.get_facts(fb_helper_mock).data.decode('utf-8'))
+        self.assertEqual(sorted(response.keys()), ['num_items', 'num_results_per_topic', 'raw_facts', 'result'])
+        self.assertEqual(len(response['raw_facts']), 3)
+        self.assertEqual(response['result'][1], {
+            'src_freebase_name': 'Fearless', 'src_freebase_id': '/m/0np6z99',
+            'pred_freebase_name': '/music/album/release_type', 'pred_freebase_id': '/music/album/release_type',
+            'tgt_freebase_name': 'Album', 'tgt_freebase_id': '/m/02lx2r'})
+
+    @patch('config.FREEBASE_HELPER')
+    def test_fields_without_raw(self, fb_helper_mock):
+        response = self.get_facts(fb_helper_mock, '&raw=false&fields=pred_freebase_name,tgt_freebase_id')
+        response = json.loads(response.data.decode('utf-8'))
+        self.assertNotIn('raw_facts', response)
+        self.assertEqual(response['result'], [
+            {'pred_freebase_name': '/music/album/genre', 'tgt_freebase_id': '/m/01qzt1'},
+            {'pred_freebase_name': '/music/album/release_type', 'tgt_freebase_id': '/m/02lx2r'}])
+
+        self.assertEqual(self.get_facts(fb_helper_mock, '&fields=pred').status_code, 400)
+
+    @patch('config.FREEBASE_HELPER')
+    def test_columnar(self, fb_helper_mock):
+        response = self.get_facts(fb_helper_mock, '&format=columnar&fields=src_freebase_id,pred_freebase_name')
+        raw_facts = json.loads(response.data.decode('utf-8'))['raw_facts']
+        self.assertEqual(raw_facts, {
+            'length': 3,
+            'src_freebase_id': ['/m/0np6z99', '/m/0np6z99', '/m/0np6z98'],
+            'pred_freebase_name': [0, 1, 0],
+            'predicate_names': ['/music/album/genre', '/music/album/release_type']})
+
+    @patch('config.FREEBASE_HELPER')
+    def test_ndjson(self, fb_helper_mock):
+        response = self.get_facts(fb_helper_mock, '&format=ndjson&raw=false&fields=tgt_freebase_name')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+        self.assertEqual(lines[0], {'num_items': 3, 'num_results_per_topic': 10, 'num_result': 2, 'num_raw_facts': 0})
+        self.assertEqual(lines[1:], [{'tgt_freebase_name': 'Classic rock'}, {'tgt_freebase_name': 'Album'}])
+
+    @patch('config.FREEBASE_HELPER')
+    def test_msgpack_matches_json(self, fb_helper_mock):
+        json_response = json.loads(self.get_facts(fb_helper_mock).data.decode('utf-8'))
+        response = self.get_facts(fb_helper_mock, '&format=msgpack')
+        self.assertEqual(response.mimetype, 'application/x-msgpack')
+        self.assertEqual(msgpack.unpackb(response.data, raw=False), json_response)
+
+
+class TestFreebaseLink(unittest.TestCase):
+
+    def setUp(self):
+        server.config['TESTING'] = True
+        self.client = server.test_client()
+        self.tmp_dir = tempfile.mkdtemp()
+        fact_path = os.path.join(self.tmp_dir, 'facts.txt')
+        with open(fact_path, 'w') as f:
+            f.write('www.freebase.com/m/0np6z99\twww.freebase.com/music/album/release_type\twww.freebase.com/m/02lx2r\n'
+                    'www.freebase.com/m/0np6z99\twww.freebase.com/music/album/genre\twww.freebase.com/m/01qzt1\n'
+                    'www.freebase.com/m/0wzc58l\twww.freebase.com/people/person/place_of_birth\twww.freebase.com/m/0n2z\n')
+        self.helper = LocalFreebaseHelper([fact_path])
+        self.helper.add_name('/m/0np6z99', 'Fearless')
+        self.helper.add_name('/m/0wzc58l', 'Alex Golfis')
+        self.helper.add_name('/m/02lx2r', 'Album')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_link(self):
+        with patch('config.FREEBASE_HELPER', self.helper):
+            response = self.client.get('/api/v1/freebase/link?question=what+format+is+fearless&ngrams=2&num_results=10')
+        self.assertEqual(response.status_code, 200)
+        response = json.loads(response.data.decode('utf-8'))
+
+        self.assertEqual(response['entity_candidates'], ['Fearless'])
+        self.assertEqual(response['entity_ids'], ['/m/0np6z99'])
+        self.assertEqual(sorted(response['predicate_candidates']), ['/music/album/genre', '/music/album/release_type'])
+        self.assertEqual(response['fact_mappings']['Fearless /music/album/release_type'], '/m/02lx2r')
+        self.assertEqual(response['num_queries'], 14)
+
+    def test_link_filters_and_formats(self):
+        fact_path = os.path.join(self.tmp_dir, 'typed_facts.txt')
+        with open(fact_path, 'w') as f:
+            f.write('www.freebase.com/m/0np6z99\twww.freebase.com/music/album/genre\twww.freebase.com/m/01qzt1\n'
+                    'www.freebase.com/m/0np6z99\twww.freebase.com/type/object/type\twww.freebase.com/m/0album\n')
+        helper = LocalFreebaseHelper([fact_path])
+        helper.add_name('/m/0np6z99', 'Fearless')
+
+        url = '/api/v1/freebase/link?question=what+genre+is+fearless'
+        with patch('config.FREEBASE_HELPER', helper):
+            unfiltered = json.loads(self.client.get(url).data.decode('utf-8'))
+            response = self.client.get(url + '&exclude_domains=/type/object/&fields=predicate_candidates&format=msgpack')
+            self.assertEqual(self.client.get(url + '&format=ndjson').status_code, 400)
+            self.assertEqual(self.client.get(url + '&fields=facts').status_code, 400)
+        self.assertEqual(sorted(unfiltered['predicate_candidates']), ['/music/album/genre', '/type/object/type'])
+
+        # The same candidates as the facts path, which drops /type/object/
+        self.assertEqual(response.mimetype, 'application/x-msgpack')
+        self.assertEqual(msgpack.unpackb(response.data, raw=False),
+                         {'predicate_candidates': ['/music/album/genre'], 'num_queries': unfiltered['num_queries']})
+
+    def test_name_num_results(self):
+        with patch('config.FREEBASE_HELPER', self.helper):
+            response = self.client.get('/api/v1/freebase/name?query=fearless')
+            self.assertEqual(self.client.get('/api/v1/freebase/name?query=fearless&num_results=ten').status_code, 400)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['result'],
+                         [{'freebase_name': 'Fearless', 'freebase_id': '/m/0np6z99'}])
+
+    def test_link_arguments(self):
+        with patch('config.FREEBASE_HELPER', self.helper):
+            for arg in ('ngrams', 'num_results', 'num_facts', 'num_results_per_topic'):
+                response = self.client.get('/api/v1/freebase/link?question=what+is+fearless&%s=abc' % arg)
+                self.assertEqual(response.status_code, 400, arg)
+
+    def test_fact_arguments(self):
+        with patch('config.FREEBASE_HELPER', self.helper):
+            response = self.client.get('/api/v1/freebase/fact?topic_ids=/m/0np6z99')
+            self.assertEqual(self.client.get('/api/v1/freebase/fact?topic_ids=/m/0np6z99&num_results=ten').status_code, 400)
+            # num_results does not limit the predicates of an aggregated lookup
+            aggregated = self.client.get('/api/v1/freebase/fact?topic_ids=/m/0np6z99&aggregate=true&num_results=1')
+            self.assertEqual(self.client.get('/api/v1/freebase/fact?topic_ids=/m/0np6z99&aggregate=true'
+                                             '&num_predicates=1').status_code, 200)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.data.decode('utf-8'))['result']), 2)
+        self.assertEqual(len(json.loads(aggregated.data.decode('utf-8'))['result']), 2)
+
+    def test_predicates(self):
+        with patch('config.FREEBASE_HELPER', self.helper):
+            response = self.client.get('/api/v1/freebase/predicates?topic_ids=/m/0np6z99,/m/0wzc58l'
+                                       '&exclude_predicates=/music/album/genre')
+            facts = self.client.get('/api/v1/freebase/fact?topic_ids=/m/0np6z99&num_results=1&raw=false'
+                                    '&domains=/music/album/&exclude_predicates=/music/album/release_type')
+        response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(response['result'], {'/m/0np6z99': ['/music/album/release_type'],
+                                              '/m/0wzc58l': ['/people/person/place_of_birth']})
+        self.assertEqual(response['predicate_candidates'], ['/music/album/release_type', '/people/person/place_of_birth'])
+
+        facts = json.loads(facts.data.decode('utf-8'))
+        self.assertEqual(facts['num_items'], 1)
+        self.assertEqual([fact['pred_freebase_name'] for fact in facts['result']], ['/music/album/genre'])
+
+    def test_two_hops(self):
+        with patch('config.FREEBASE_HELPER', self.helper):
+            response = self.client.get('/api/v1/freebase/expand?topic_ids=/m/0np6z99&hops=2&fanout=10;1'
+                                       '&predicates=/music/album/release_type;&fields=src_freebase_id,tgt_freebase_id')
+        self.assertEqual(response.status_code, 200)
+        response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(response['result'], [{'src_freebase_id': '/m/0np6z99', 'tgt_freebase_id': '/m/02lx2r'}])
+        self.assertEqual(response['nodes'], [
+            {'freebase_id': '/m/0np6z99', 'freebase_name': 'Fearless', 'hop': 0},
+            {'freebase_id': '/m/02lx2r', 'freebase_name': 'Album', 'hop': 1}])
+        self.assertEqual(response['num_items'], [1, 0])
+
+    def test_reverse(self):
+        with patch('config.FREEBASE_HELPER', self.helper):
+            response = self.client.get('/api/v1/freebase/expand?topic_ids=/m/02lx2r&direction=in&raw=false')
+            self.assertEqual(self.client.get('/api/v1/freebase/expand?topic_ids=/m/02lx2r&hops=3').status_code, 400)
+        response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([fact['src_freebase_id'] for fact in response['result']], ['/m/0np6z99'])
+        self.assertEqual(response['nodes'][1], {'freebase_id': '/m/0np6z99', 'freebase_name': 'Fearless', 'hop': 1})
+
+    def test_expand_limits(self):
+        with patch('config.FREEBASE_HELPER', self.helper):
+            for query in ('topic_ids=/m/0np6z99&hops=two', 'topic_ids=/m/0np6z99&fanout=101',
+                          'topic_ids=/m/0np6z99&fanout=10;0&hops=2', 'topic_ids=/m/0np6z99,/m/0wzc58l'):
+                with patch('config.FREEBASE_EXPAND_MAX_FRONTIER', 1):
+                    response = self.client.get('/api/v1/freebase/expand?' + query)
+                self.assertEqual(response.status_code, 400, query)
+
+            # Only the first entity the first hop reached is expanded
+            with patch('config.FREEBASE_EXPAND_MAX_FRONTIER', 1), \
+                    patch.object(self.helper, 'get_neighbor_facts', wraps=self.helper.get_neighbor_facts) as lookup:
+                response = self.client.get('/api/v1/freebase/expand?topic_ids=/m/0np6z99&hops=2')
+        self.assertEqual(response.status_code, 200)
+        nodes = json.loads(response.data.decode('utf-8'))['nodes']
+        self.assertGreater(len([node for node in nodes if node['hop'] == 1]), 1)
+        self.assertEqual([call[0][0] for call in lookup.call_args_list], [['/m/0np6z99'], [nodes[1]['freebase_id']]])
+
+
+class TestFreebaseMetrics(unittest.TestCase):
+
+    def setUp(self):
+        server.config['TESTING'] = True
+        self.client = server.test_client()
+
+    @patch('config.FREEBASE_HELPER')
+    def test_stage_timings(self, fb_helper_mock):
+        fb_helper_mock.get_names = MagicMock(return_value=([freebase_name('/m/0np6z99', 'Fearless')], 1))
+        response = self.client.get('/api/v1/freebase/name?query=fearless&num_results=10')
+        stages = [timing.split(';')[0] for timing in response.headers['Server-Timing'].split(', ')]
+        self.assertEqual(stages, ['normalize', 'backend', 'filter', 'serialize'])
+
+        body = self.client.get('/metrics').data.decode('utf-8')
+        self.assertIn('freebase_stage_seconds_count{endpoint="freebase.freebasenameapi",stage="backend"}', body)
+
+if __name__ == '__main__':
+    unittest.main()
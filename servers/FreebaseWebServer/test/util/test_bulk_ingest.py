@@ -0,0 +1,108 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+from util import bulk_ingest
+from util.bulk_ingest import BulkIngester
+
+
+class BulkSink(object):
+    """ Stands in for an elasticsearch client, records bulk bodies and index settings """
+
+    def __init__(self, fail_on_doc=None):
+        self.fail_on_doc = fail_on_doc
+        self.lock = threading.Lock()
+        self.docs = {}
+        self.settings = {'refresh_interval': '1s', 'number_of_replicas': '1'}
+        self.settings_during_bulk = []
+        self.num_refreshes = 0
+        self.indices = self
+
+    def get_settings(self, index):
+        return {index: {'settings': {'index': dict(self.settings)}}}
+
+    def put_settings(self, index, body):
+        self.settings.update(body['index'])
+
+    def refresh(self, index):
+        self.num_refreshes += 1
+
+    def bulk(self, index, body, refresh):
+        actions, docs = body[::2], body[1::2]
+        with self.lock:
+            self.settings_during_bulk.append(dict(self.settings))
+        if any(action['index']['_id'] == self.fail_on_doc for action in actions):
+            raise Exception("Bulk request failed")
+        with self.lock:
+            for action, doc in zip(actions, docs):
+                self.docs[action['index']['_id']] = doc
+        return {'errors': False, 'items': []}
+
+
+def documents(num_docs):
+    return ((i, {'freebase_id': '/m/%d' % i}) for i in range(num_docs))
+
+
+class TestBulkIngester(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.checkpoint_path = os.path.join(self.tmp_dir, 'names.checkpoint')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_chunks(self):
+        self.assertEqual(list(bulk_ingest.chunks(range(5), 2)), [[0, 1], [2, 3], [4]])
+
+    def test_ingest(self):
+        sink = BulkSink()
+        ingester = BulkIngester(sink, 'fb_2m_names', 'name', chunk_size=7, num_workers=3)
+        num_docs, _ = ingester.ingest(documents(100))
+
+        self.assertEqual(num_docs, 100)
+        self.assertEqual(sorted(sink.docs.keys()), list(range(100)))
+
+        # Refresh and replicas are off while loading and restored afterwards
+        for settings in sink.settings_during_bulk:
+            self.assertEqual((settings['refresh_interval'], settings['number_of_replicas']), ('-1', 0))
+        self.assertEqual(sink.settings, {'refresh_interval': '1s', 'number_of_replicas': '1'})
+        self.assertEqual(sink.num_refreshes, 1)
+
+    def test_resume(self):
+        sink = BulkSink(fail_on_doc=50)
+        ingester = BulkIngester(sink, 'fb_2m_names', 'name', chunk_size=10, num_workers=1,
+                                checkpoint_path=self.checkpoint_path)
+        self.assertRaises(Exception, ingester.ingest, documents(100))
+        self.assertEqual(sink.settings['refresh_interval'], '1s')
+
+        with open(self.checkpoint_path) as f:
+            self.assertEqual(json.load(f)['chunks_done'], 5)
+
+        # Second run only sends the chunks the first one did not finish
+        sink.fail_on_doc = None
+        sink.docs = {}
+        num_docs, _ = ingester.ingest(documents(100))
+        self.assertEqual(num_docs, 50)
+        self.assertEqual(sorted(sink.docs.keys()), list(range(50, 100)))
+
+    def test_checkpoint_mismatch(self):
+        BulkIngester(BulkSink(), 'fb_2m_names', 'name', chunk_size=10,
+                     checkpoint_path=self.checkpoint_path).ingest(documents(20))
+        ingester = BulkIngester(BulkSink(), 'fb_2m_names', 'name', chunk_size=5,
+                                checkpoint_path=self.checkpoint_path)
+        self.assertRaises(Exception, ingester.ingest, documents(20))
+
+    def test_fact_documents(self):
+        fact_path = os.path.join(self.tmp_dir, 'facts.txt')
+        with open(fact_path, 'w') as f:
+            f.write('www.freebase.com/m/01\twww.freebase.com/music/album/genre\twww.freebase.com/m/02 www.freebase.com/m/03\n')
+        docs = list(bulk_ingest.fact_documents([fact_path], {'/m/01': 'fearless', '/m/02': 'pop'}))
+
+        self.assertEqual([doc_id for doc_id, _ in docs], [0, 1])
+        self.assertEqual(docs[0][1]['src_freebase_name'], 'fearless')
+        self.assertEqual(docs[0][1]['tgt_freebase_name'], 'pop')
+        self.assertEqual(docs[1][1]['tgt_freebase_name'], '/m/03')
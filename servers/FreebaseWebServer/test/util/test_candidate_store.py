@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mock import MagicMock
+
+from util.kb_backend import KnowledgeBaseBackend
+from util.candidate_store import CandidateStore, CandidateStoreBackend
+from test.fixtures import freebase_name, freebase_fact
+
+
+class TestCandidateStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store_path = os.path.join(self.tmp_dir, 'candidates.db')
+        self.facts = [freebase_fact('/m/0np6z99', 'Fearless', '/music/album/release_type', '/m/02lx2r', 'Album'),
+                      freebase_fact('/m/0np6z99', 'Fearless', '/music/album/genre', '/m/06by7', 'Rock music')]
+        self.fearless = ([freebase_name('/m/0np6z99', 'Fearless', 'Album')], 3)
+
+        self.backend = MagicMock()
+        self.backend.name = 'Mock'
+        self.backend.get_names_batch = MagicMock(side_effect=lambda queries, num_results: \
+            [self.fearless for _ in queries])
+        self.backend.get_facts_by_ids = MagicMock(side_effect=lambda topic_ids, num_results, num_results_per_topic: \
+            KnowledgeBaseBackend().filter_facts_per_topic(self.facts, num_results_per_topic) + (2,))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_stored_lookups_skip_the_backend(self):
+        writer = CandidateStoreBackend(self.backend, CandidateStore(self.store_path), write=True)
+        writer.get_names_batch(['fearless', 'format'], 10)
+        writer.get_facts_by_ids(['/m/0np6z99'], 5000, 10)
+        self.assertEqual(writer.stats()['misses'], 3)
+
+        # A new process reading the same file
+        reader = CandidateStoreBackend(self.backend, CandidateStore(self.store_path))
+        self.backend.get_names_batch.reset_mock()
+        self.backend.get_facts_by_ids.reset_mock()
+
+        names, num_total = reader.get_names('fearless', 10)
+        self.assertEqual(num_total, 3)
+        self.assertEqual([(name.freebase_id, name.freebase_name, name.freebase_description) for name in names],
+                         [('/m/0np6z99', 'Fearless', 'Album')])
+
+        facts, filtered_facts, _, num_total = reader.get_facts_by_ids(['/m/0np6z99'], 5000, 10)
+        self.assertEqual(num_total, 2)
+        self.assertEqual([(fact.pred.freebase_name, fact.tgt.freebase_id) for fact in filtered_facts],
+                         [('/music/album/release_type', '/m/02lx2r'), ('/music/album/genre', '/m/06by7')])
+        self.assertFalse(self.backend.get_names_batch.called)
+        self.assertFalse(self.backend.get_facts_by_ids.called)
+        self.assertEqual(reader.stats()['hit_rate'], 1.0)
+
+    def test_missing_lookups_go_to_the_backend(self):
+        CandidateStoreBackend(self.backend, CandidateStore(self.store_path), write=True).get_names('fearless', 10)
+        reader = CandidateStoreBackend(self.backend, CandidateStore(self.store_path))
+        self.backend.get_names_batch.reset_mock()
+
+        # Only the query missing from the store is sent, and the read-only store is left as is
+        results = reader.get_names_batch(['fearless', 'taylor swift'], 10)
+        self.assertEqual(len(results), 2)
+        self.backend.get_names_batch.assert_called_once_with(['taylor swift'], 10)
+        self.assertEqual(reader.stats()['names'], 1)
+
+        # Different numbers of results are separate lookups
+        reader.get_names('fearless', 20)
+        self.backend.get_names_batch.assert_called_with(['fearless'], 20)
+
+    def test_writes_and_keys(self):
+        store = CandidateStore(self.store_path)
+        store.put_many = MagicMock(wraps=store.put_many)
+        writer = CandidateStoreBackend(self.backend, store, write=True)
+
+        # The names missed by a batch are stored in one transaction
+        writer.get_names_batch(['fearless', 'format', 'album'], 10)
+        self.assertEqual(store.put_many.call_count, 1)
+        self.assertEqual(store.count('names'), 3)
+
+        # Facts are keyed on the ids in request order
+        writer.get_facts_by_ids(['/m/0np6z99', '/m/02lx2r'], 5000, 10)
+        writer.get_facts_by_ids(['/m/02lx2r', '/m/0np6z99'], 5000, 10)
+        self.assertEqual(self.backend.get_facts_by_ids.call_count, 2)
+        self.assertEqual(store.count('facts'), 2)
+
+if __name__ == '__main__':
+    unittest.main()
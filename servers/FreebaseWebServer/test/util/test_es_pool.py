@@ -0,0 +1,158 @@
+import json
+import time
+import threading
+import unittest
+from mock import patch
+from six.moves import BaseHTTPServer, socketserver
+
+from util.es_pool import HedgedReader, LatencyTracker, parse_nodes, reset_connections
+from util.freebase_helper import FreebaseHelper
+
+
+class StubNode(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ Local HTTP server answering every elasticsearch search with one name hit after a delay """
+    daemon_threads = True
+
+    def __init__(self, name, delay=0.0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.name = name
+        self.delay = delay
+        self.num_requests = 0
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.01,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def address(self):
+        return '127.0.0.1:%d' % self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('X-Elastic-Product', 'Elasticsearch')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.respond({'version': {'number': '7.17.0', 'build_flavor': 'default'}, 'tagline': 'You Know, for Search'})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.num_requests += 1
+        time.sleep(self.server.delay)
+        hit = {'_source': {'freebase_id': '/m/0np6z99', 'name': self.server.name, 'description': 'NODESCRIPTION'}}
+        self.respond({'hits': {'total': 1, 'hits': [hit]}})
+
+
+class TestEsPool(unittest.TestCase):
+
+    def setUp(self):
+        self.fast_node = StubNode('fast')
+        self.slow_node = StubNode('slow', delay=2.0)
+
+    def tearDown(self):
+        self.fast_node.stop()
+        self.slow_node.stop()
+
+    def test_parse_nodes(self):
+        self.assertEqual(parse_nodes('a:9200, b:9200,'), ['a:9200', 'b:9200'])
+        self.assertEqual(parse_nodes(['a:9200']), ['a:9200'])
+
+    def test_latency_percentile(self):
+        tracker = LatencyTracker(window=100, min_samples=10)
+        for latency in range(9):
+            tracker.add(latency)
+        self.assertEqual(tracker.percentile(90), None)
+        tracker.add(9)
+        self.assertEqual(tracker.percentile(90), 9)
+        self.assertEqual(tracker.percentile(50), 5)
+
+    def test_hedged_read_skips_slow_node(self):
+        reader = HedgedReader([self.slow_node.address, self.fast_node.address], percentile=90, min_samples=1)
+        reader.latencies.add(0.05)
+
+        start_time = time.time()
+        res = reader.call('search', index='names_v3', body={'query': {'match_all': {}}})
+        self.assertLess(time.time() - start_time, 1.0)
+        self.assertEqual(res['hits']['hits'][0]['_source']['name'], 'fast')
+        self.assertEqual(reader.stats()['hedged'], 1)
+
+    def test_read_fails_over_to_other_node(self):
+        self.slow_node.stop()
+        reader = HedgedReader([self.slow_node.address, self.fast_node.address], percentile=90, max_retries=0)
+        res = reader.call('search', index='names_v3', body={})
+        self.assertEqual(res['hits']['hits'][0]['_source']['name'], 'fast')
+        self.slow_node = StubNode('slow')
+
+    def test_reads_share_a_thread_pool(self):
+        reader = HedgedReader([self.fast_node.address, self.slow_node.address], num_threads=2)
+        read_threads = set()
+
+        def search(**kwargs):
+            read_threads.add(threading.current_thread())
+            return {'hits': {'total': 0, 'hits': []}}
+        for client in reader.clients:
+            client.search = search
+
+        callers = [threading.Thread(target=reader.call, args=('search',), kwargs={'index': 'names_v3', 'body': {}})
+                   for _ in range(8)]
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join()
+
+        # Reads ran on the threads of one pool, and every one was counted
+        self.assertTrue(read_threads <= set(reader.pool._pool))
+        self.assertEqual(reader.stats()['reads'], 8)
+
+    def test_hedged_clients_sniff(self):
+        with patch('elasticsearch.transport.Transport.sniff_hosts') as sniff_hosts:
+            helper = FreebaseHelper(','.join([self.slow_node.address, self.fast_node.address]),
+                                    create_index=False, timeout=5, sniff_interval=60, hedge_percentile=90)
+        # The main client and both hedged clients sniffed on start
+        self.assertEqual(sniff_hosts.call_count, 3)
+        self.assertEqual([client.transport.sniffer_timeout for client in helper.hedged_reader.clients], [60, 60])
+
+    def test_reset_connections(self):
+        helper = FreebaseHelper(','.join([self.slow_node.address, self.fast_node.address]),
+                                create_index=False, timeout=5, hedge_percentile=90)
+        view = helper.index_view('FB_5M')
+        self.assertEqual(len(helper.clients()), 3)
+        transport = view.es.transport
+        inherited = list(transport.connection_pool.connections)
+        with patch.object(inherited[0], 'close') as close:
+            reset_connections(view.es)
+        close.assert_called_once_with()
+
+        # The helper and its views read through new connections to the same hosts
+        connections = helper.es.transport.connection_pool.connections
+        self.assertFalse(set(connections) & set(inherited))
+        self.assertEqual(sorted(connection.host for connection in connections),
+                         sorted(connection.host for connection in inherited))
+        self.assertEqual(transport.seed_connections, connections)
+        self.assertEqual(helper.es.search(index='names_v3', body={})['hits']['total'], 1)
+
+    def test_helper_uses_hedged_reads(self):
+        helper = FreebaseHelper(','.join([self.slow_node.address, self.fast_node.address]),
+                                create_index=False, timeout=5, name_timeout=5, hedge_percentile=90)
+        helper.hedged_reader.latencies.min_samples = 1
+        helper.hedged_reader.latencies.add(0.05)
+
+        for _ in range(2):
+            names, num_total = helper.get_names('fearless', 1)
+            self.assertEqual(names[0].freebase_name, 'fast')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import threading
+import unittest
+from multiprocessing.pool import ThreadPool
+from mock import MagicMock
+
+from util.executor_backend import ExecutorBackend, with_executor
+from util.index_router import IndexRouter
+from util.local_freebase_helper import LocalFreebaseHelper
+from util.lookup_cache import CachedFreebaseHelper
+
+
+class TestExecutorBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ThreadPool(2)
+        self.lookup_threads = []
+        self.backend = MagicMock()
+        self.backend.name = 'Local'
+
+        def get_names(query, num_results):
+            self.lookup_threads.append(threading.current_thread())
+            return [query], 1
+        self.backend.get_names.side_effect = get_names
+
+    def tearDown(self):
+        self.pool.terminate()
+
+    def test_lookups_run_on_executor(self):
+        helper = ExecutorBackend(self.backend, self.pool)
+        self.assertEqual(helper.get_names('fearless', 10), (['fearless'], 1))
+        self.assertNotEqual(self.lookup_threads[0], threading.current_thread())
+
+        # Batches go to the backend as one call
+        helper.get_names_batch(['fearless', 'album'], 10)
+        self.backend.get_names_batch.assert_called_once_with(['fearless', 'album'], 10)
+
+    def test_other_calls_go_to_backend(self):
+        helper = ExecutorBackend(self.backend, self.pool)
+        helper.set_index('FB_5M')
+        self.backend.set_index.assert_called_once_with('FB_5M')
+        self.assertEqual(helper.name, 'Local')
+
+    def test_executor_goes_above_local_backends(self):
+        local_2m = LocalFreebaseHelper([])
+        local_5m = LocalFreebaseHelper([])
+        cached_5m = CachedFreebaseHelper(CachedFreebaseHelper(local_5m, max_entries=10), max_entries=10)
+        router = IndexRouter([('FB_2M', local_2m), ('FB_5M', cached_5m)], 'FB_2M')
+
+        self.assertIs(with_executor(router, self.pool), router)
+        # Right above the local backend, behind every cache
+        self.assertIs(router.default.backend, local_2m)
+        self.assertIs(router.backends['FB_5M'].backend.backend.backend, local_5m)
+        self.assertIs(router.both.backends[0], router.default)
+        self.assertIs(router.both.backends[1], cached_5m)
+
+        # Wrapping again leaves the executors as they are
+        with_executor(router, self.pool)
+        self.assertIs(router.default.backend, local_2m)
+
+if __name__ == '__main__':
+    unittest.main()
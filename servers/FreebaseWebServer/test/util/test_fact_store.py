@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mock import patch
+
+from util.fact_store import FactStore, build_fact_store
+from util.local_freebase_helper import LocalFreebaseHelper
+
+
+FACTS = [
+    'www.freebase.com/m/0np6z99\twww.freebase.com/music/album/release_type\twww.freebase.com/m/02lx2r',
+    'www.freebase.com/m/01jp8ww\twww.freebase.com/music/album/genre\twww.freebase.com/m/01qzt1',
+    'www.freebase.com/m/0np6z99\twww.freebase.com/music/album/genre\twww.freebase.com/m/01qzt1 www.freebase.com/m/02lx2r',
+]
+
+NAMES = [
+    '/m/01jp8ww\tHarder.....Faster',
+    '/m/0np6z99\tFearless',
+    '/m/01qzt1\tClassic rock',
+]
+
+
+class TestFactStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fact_path = os.path.join(self.tmp_dir, 'facts.txt')
+        self.name_path = os.path.join(self.tmp_dir, 'names.txt')
+        self.store_dir = os.path.join(self.tmp_dir, 'store')
+        with open(self.fact_path, 'w') as f:
+            f.write('\n'.join(FACTS) + '\n')
+        with open(self.name_path, 'w') as f:
+            f.write('\n'.join(NAMES) + '\n')
+        build_fact_store([self.fact_path], self.store_dir, [self.name_path])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_facts_are_contiguous_per_subject(self):
+        store = FactStore(self.store_dir)
+        self.assertEqual(store.num_facts, 4)
+        self.assertEqual(store.count('/m/0np6z99'), 3)
+        self.assertEqual(store.facts('/m/0np6z99'), [
+            ('/music/album/release_type', '/m/02lx2r'),
+            ('/music/album/genre', '/m/01qzt1'),
+            ('/music/album/genre', '/m/02lx2r'),
+        ])
+        self.assertEqual(store.facts('/m/0np6z99', limit=1), [('/music/album/release_type', '/m/02lx2r')])
+        self.assertEqual(store.facts('/m/unknown'), [])
+        self.assertEqual(store.get_name('/m/01qzt1'), 'Classic rock')
+        self.assertEqual(store.get_name('/m/02lx2r'), None)
+
+    def test_chunked_build(self):
+        # Files are encoded a few triples at a time, across the chunk and file boundaries
+        chunked_dir = os.path.join(self.tmp_dir, 'chunked')
+        with patch('util.fact_store.CHUNK_SIZE', 3):
+            build_fact_store([self.fact_path, self.fact_path], chunked_dir)
+        store = FactStore(chunked_dir)
+        self.assertEqual(store.num_facts, 8)
+        self.assertEqual(store.facts('/m/0np6z99'), FactStore(self.store_dir).facts('/m/0np6z99') * 2)
+        self.assertEqual(store.count('/m/01jp8ww'), 2)
+
+    def test_local_helper_reads_fact_store(self):
+        in_memory = LocalFreebaseHelper([self.fact_path], [self.name_path])
+        mapped = LocalFreebaseHelper([], fact_store_path=self.store_dir)
+
+        topic_ids = ['/m/0np6z99', '/m/01jp8ww']
+        expected = in_memory.get_facts_by_ids(topic_ids, 10, 5)
+        actual = mapped.get_facts_by_ids(topic_ids, 10, 5)
+
+        def triples(facts):
+            return [(fact.src.freebase_name, fact.pred.freebase_name, fact.tgt.freebase_name) for fact in facts]
+        self.assertEqual(triples(actual[0]), triples(expected[0]))
+        self.assertEqual(triples(actual[1]), triples(expected[1]))
+        self.assertEqual(actual[3], expected[3])
+
+    def test_incoming(self):
+        store = FactStore(self.store_dir)
+        expected = [('/m/0np6z99', '/music/album/release_type'), ('/m/0np6z99', '/music/album/genre')]
+        self.assertEqual(store.incoming('/m/02lx2r'), expected)
+        self.assertEqual(store.incoming('/m/02lx2r', limit=1), expected[:1])
+        self.assertEqual(store.incoming('/m/0np6z99'), [])
+
+        # Stores without the object index scan the objects
+        store.object_offsets = None
+        self.assertEqual(store.incoming('/m/02lx2r'), expected)
+
+        in_memory = LocalFreebaseHelper([self.fact_path], [self.name_path])
+        mapped = LocalFreebaseHelper([], fact_store_path=self.store_dir)
+        self.assertEqual(list(mapped.get_neighbor_facts(['/m/01qzt1'], 10, reverse=True)[0].src_ids),
+                         list(in_memory.get_neighbor_facts(['/m/01qzt1'], 10, reverse=True)[0].src_ids))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from mock import patch
+
+from util import freebase, response_format
+from util.freebase import FreebaseObject, FreebaseFact, FactBatch, predicate_object
+from util.kb_backend import KnowledgeBaseBackend
+
+
+FACTS = [
+    ('/m/0np6z99', 'Fearless', '/music/album/release_type', '/m/02lx2r', 'Album'),
+    ('/m/0np6z99', 'Fearless', '/music/album/release_type', '/m/02lx2r', 'Album'),
+    ('/m/0np6z99', 'Fearless', '/music/album/genre', '/m/06by7', 'Rock music'),
+    ('/m/01fear', 'Fearless', '/film/film/genre', '/m/07s9rl0', 'Drama'),
+    ('/m/0alex', 'Alex Golfis', '/people/person/place_of_birth', '/m/0n2z', 'Athens'),
+]
+
+
+class TestFactBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.batch = FactBatch()
+        for fact in FACTS:
+            self.batch.append(*fact)
+        self.facts = [FreebaseFact(FreebaseObject(-1, src_id, src_name), FreebaseObject(-1, predicate, predicate),
+                                   FreebaseObject(-1, tgt_id, tgt_name))
+                      for src_id, src_name, predicate, tgt_id, tgt_name in FACTS]
+
+    def test_facts_are_built_on_demand(self):
+        self.assertEqual(len(self.batch), 5)
+        fact = self.batch[2]
+        self.assertEqual((fact.src.freebase_id, fact.pred.freebase_name, fact.tgt.freebase_name),
+                         ('/m/0np6z99', '/music/album/genre', 'Rock music'))
+        # Predicates are shared objects
+        self.assertIs(fact.pred, predicate_object('/music/album/genre'))
+        self.assertEqual([fact.tgt.freebase_id for fact in self.batch[3:]], ['/m/07s9rl0', '/m/0n2z'])
+
+    def test_selected_batches_own_their_strings(self):
+        strings = dict(self.batch.strings)
+        selected = self.batch.select([3, 4])
+        selected.append('/m/0new', 'New name', '/film/film/genre', '/m/07s9rl0', 'Drama')
+        self.assertEqual(self.batch.strings, strings)
+        self.assertEqual(len(self.batch), 5)
+        self.assertEqual(list(selected.src_ids), ['/m/01fear', '/m/0alex', '/m/0new'])
+
+    def test_predicate_table_is_bounded(self):
+        with patch('util.freebase.MAX_PREDICATES', len(freebase.PREDICATES)):
+            pred_obj = predicate_object('/unseen/type/predicate')
+            self.assertEqual(pred_obj.freebase_name, '/unseen/type/predicate')
+            self.assertNotIn('/unseen/type/predicate', freebase.PREDICATES)
+        self.assertIs(predicate_object('/music/album/genre'), self.batch[2].pred)
+
+    def test_filter_matches_fact_lists(self):
+        backend = KnowledgeBaseBackend()
+        batch_results = backend.filter_facts_per_topic(self.batch, 1)
+        list_results = backend.filter_facts_per_topic(self.facts, 1)
+        for batch_facts, list_facts in zip(batch_results[:2], list_results[:2]):
+            self.assertIsInstance(batch_facts, FactBatch)
+            self.assertEqual(response_format.fact_rows(batch_facts), response_format.fact_rows(list_facts))
+        self.assertEqual(batch_results[2], list_results[2])
+        self.assertEqual(len(batch_results[1]), 3)
+
+    def test_serializes_from_columns(self):
+        fields = ('pred_freebase_id', 'tgt_freebase_name')
+        self.assertEqual(response_format.fact_rows(self.batch, fields)[2],
+                         {'pred_freebase_id': '/music/album/genre', 'tgt_freebase_name': 'Rock music'})
+        columns = response_format.fact_columns(self.batch, fields)
+        self.assertEqual(columns['predicate_ids'], ['/music/album/release_type', '/music/album/genre',
+                                                    '/film/film/genre', '/people/person/place_of_birth'])
+        self.assertEqual(columns['pred_freebase_id'], [0, 0, 1, 2, 3])
+        self.assertEqual(columns['length'], 5)
+
+if __name__ == '__main__':
+    unittest.main()
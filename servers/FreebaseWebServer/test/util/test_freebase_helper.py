@@ -0,0 +1,158 @@
+import shutil
+import tempfile
+import unittest
+from mock import MagicMock
+
+from util import metrics
+from util.freebase_helper import FreebaseHelper
+from util.lookup_cache import CachedFreebaseHelper
+from util.predicate_index import PredicateFilter
+from util.trigram_index import TrigramNameIndex
+
+
+def fact_source(src_id, src_name, predicate, tgt_id):
+    return {
+        'src_freebase_id': src_id,
+        'src_freebase_name': src_name,
+        'predicate': predicate,
+        'tgt_freebase_id': tgt_id,
+        'tgt_freebase_name': tgt_id,
+    }
+
+FACTS = [
+    fact_source('/m/a', 'Fearless', '/music/album/genre', '/m/rock'),
+    fact_source('/m/a', 'Fearless', '/music/album/genre', '/m/pop'),
+    fact_source('/m/a', 'Fearless', '/music/album/release_type', '/m/album'),
+    fact_source('/m/b', 'Fearless', '/film/film/genre', '/m/drama'),
+    fact_source('/m/c', 'Alex Golfis', '/people/person/place_of_birth', '/m/athens'),
+]
+
+
+def search_response(facts):
+    return {'hits': {'total': len(facts), 'hits': [{'_source': fact} for fact in facts]}}
+
+
+def top_hit(fact):
+    return {'hits': {'total': 1, 'max_score': None, 'hits': [
+        {'_index': 'fb_5m', '_type': 'fact', '_id': fact['src_freebase_id'] + fact['tgt_freebase_id'], '_score': None,
+         '_source': fact, 'sort': [fact['tgt_freebase_id']]}]}}
+
+# Response of elasticsearch to the aggregation of FACTS with 1 predicate per id: predicate buckets
+# are ordered by doc count and top_hits returns the fact with the smallest target id
+AGGREGATION_RESPONSE = {
+    'took': 3, 'timed_out': False,
+    'hits': {'total': 5, 'max_score': 0.0, 'hits': []},
+    'aggregations': {'ids': {'doc_count_error_upper_bound': 0, 'sum_other_doc_count': 0, 'buckets': [
+        {'key': '/m/a', 'doc_count': 3, 'predicates': {'doc_count_error_upper_bound': 0, 'sum_other_doc_count': 1,
+            'buckets': [{'key': '/music/album/genre', 'doc_count': 2, 'fact': top_hit(FACTS[1])}]}},
+        {'key': '/m/b', 'doc_count': 1, 'predicates': {'doc_count_error_upper_bound': 0, 'sum_other_doc_count': 0,
+            'buckets': [{'key': '/film/film/genre', 'doc_count': 1, 'fact': top_hit(FACTS[3])}]}},
+        {'key': '/m/c', 'doc_count': 1, 'predicates': {'doc_count_error_upper_bound': 0, 'sum_other_doc_count': 0,
+            'buckets': [{'key': '/people/person/place_of_birth', 'doc_count': 1, 'fact': top_hit(FACTS[4])}]}},
+    ]}}
+}
+
+
+class TestFreebaseHelper(unittest.TestCase):
+
+    def setUp(self):
+        self.helper = FreebaseHelper('localhost:9200', create_index=False, timeout=1)
+        self.helper.es = MagicMock()
+
+    def test_get_facts_by_ids_dedups_facts(self):
+        self.helper.es.search.return_value = search_response(FACTS)
+        facts, filtered_facts, name_facts_counter, num_total = \
+            self.helper.get_facts_by_ids(['/m/a', '/m/b', '/m/c'], 100, 1)
+
+        self.assertEqual(num_total, 5)
+        self.assertEqual(len(facts), 4)
+        self.assertEqual(name_facts_counter['Fearless']['/m/a'], 2)
+        self.assertEqual(sorted(set(fact.src.freebase_id for fact in filtered_facts)), ['/m/a', '/m/c'])
+
+    def test_supports_fuzzy(self):
+        # Wrappers ask the backend, which needs a trigram index
+        self.assertFalse(CachedFreebaseHelper(self.helper, max_entries=10).supports_fuzzy())
+        self.helper.fuzzy_index = TrigramNameIndex.build([('/m/a', 'Fearless')])
+        self.assertTrue(CachedFreebaseHelper(self.helper, max_entries=10).supports_fuzzy())
+
+    def test_index_view_binds_fuzzy_index(self):
+        index_dir = tempfile.mkdtemp()
+        try:
+            TrigramNameIndex.build([('/m/a', 'Fearless')], index_dir)
+            fb_5m = self.helper.index_view('FB_5M', fuzzy_index_path=index_dir)
+            fb_2m = self.helper.index_view('FB_2M')
+        finally:
+            shutil.rmtree(index_dir)
+        # Names of one index are not fuzzy matched against the trigrams of another
+        self.assertTrue(fb_5m.supports_fuzzy())
+        self.assertFalse(fb_2m.supports_fuzzy())
+        self.assertFalse(self.helper.supports_fuzzy())
+        self.assertIs(fb_5m.es, fb_2m.es)
+
+    def test_get_facts_by_name(self):
+        self.helper.es.search.return_value = search_response(FACTS[:3])
+        facts, num_total = self.helper.get_facts_by_name('fearless', 10)
+        self.assertEqual(num_total, 3)
+        # One fact per hit, in hit order
+        self.assertEqual([(fact.pred.freebase_name, fact.tgt.freebase_id) for fact in facts], [
+            ('/music/album/genre', '/m/rock'), ('/music/album/genre', '/m/pop'),
+            ('/music/album/release_type', '/m/album')])
+
+    def test_aggregated_facts(self):
+        self.helper.es.search.return_value = AGGREGATION_RESPONSE
+        facts, filtered_facts, name_facts_counter, num_total = \
+            self.helper.get_facts_by_ids_aggregated(['/m/a', '/m/b', '/m/c'], 1, 1)
+
+        self.assertEqual(num_total, 5)
+        self.assertEqual([(fact.src.freebase_id, fact.pred.freebase_name, fact.tgt.freebase_id) for fact in facts], [
+            ('/m/a', '/music/album/genre', '/m/pop'),
+            ('/m/b', '/film/film/genre', '/m/drama'),
+            ('/m/c', '/people/person/place_of_birth', '/m/athens')])
+        self.assertEqual(dict(name_facts_counter['Fearless']), {'/m/a': 1, '/m/b': 1})
+        self.assertEqual(len(filtered_facts), 2)
+
+        body = self.helper.es.search.call_args[1]['body']
+        self.assertEqual(body['size'], 0)
+        self.assertEqual(body['query'], {'terms': {'src_freebase_id': ['/m/a', '/m/b', '/m/c']}})
+        self.assertEqual(body['aggs']['ids']['terms'], {'field': 'src_freebase_id', 'size': 3})
+        predicates = body['aggs']['ids']['aggs']['predicates']
+        self.assertEqual(predicates['terms'], {'field': 'predicate', 'size': 1})
+        self.assertEqual(predicates['aggs']['fact']['top_hits'],
+                         {'size': 1, 'sort': [{'tgt_freebase_id': {'order': 'asc'}}]})
+
+    def test_neighbor_facts_follow_targets(self):
+        self.helper.es.search.return_value = {'hits': {'total': 2, 'hits': []}, 'aggregations': {'ids': {'buckets': [
+            {'key': '/m/rock', 'doc_count': 1, 'facts': search_response([FACTS[0]])}]}}}
+        facts, num_total = self.helper.get_neighbor_facts(['/m/rock', '/m/pop'], 5, ['/music/album/genre'], reverse=True)
+        self.assertEqual(list(facts.src_ids), ['/m/a'])
+        self.assertEqual(num_total, 2)
+
+        # Facts are matched and grouped by their target, with one of the predicates
+        body = self.helper.es.search.call_args[1]['body']
+        self.assertEqual(body['query']['bool']['must'], [{'terms': {'tgt_freebase_id': ['/m/rock', '/m/pop']}},
+                                                         {'terms': {'predicate': ['/music/album/genre']}}])
+        self.assertEqual(body['aggs']['ids']['terms'], {'field': 'tgt_freebase_id', 'size': 2})
+        self.assertEqual(body['aggs']['ids']['aggs']['facts']['top_hits']['size'], 5)
+
+    def test_predicate_sets_aggregate_predicates(self):
+        self.helper.es.search.return_value = {'hits': {'total': 3, 'hits': []}, 'aggregations': {'ids': {'buckets': [
+            {'key': '/m/a', 'predicates': {'buckets': [{'key': '/music/album/release_type'}, {'key': '/music/album/genre'}]}}
+        ]}}}
+        predicate_sets = self.helper.get_predicate_sets(['/m/a', '/m/b'], PredicateFilter(exclude_domains=['/type/object/']))
+        self.assertEqual(predicate_sets, [['/music/album/genre', '/music/album/release_type'], []])
+
+        body = self.helper.es.search.call_args[1]['body']
+        self.assertEqual(body['size'], 0)
+        self.assertEqual(body['query']['bool']['must_not'], [{'prefix': {'predicate': '/type/object/'}}])
+
+    def test_counts_calls_and_hits(self):
+        self.helper.es.search.return_value = search_response(FACTS)
+        timings = metrics.start_request()
+        self.helper.get_facts_by_ids(['/m/a', '/m/b', '/m/c'], 100, 1)
+        metrics.finish_request()
+
+        self.assertEqual(dict(timings.counts), {'es_calls': 1, 'es_hits': 5})
+        self.assertEqual(sorted(timings.stages.keys()), ['decode', 'filter'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from multiprocessing.pool import ThreadPool
+from mock import MagicMock
+
+from util.kb_backend import KnowledgeBaseBackend
+from util.index_router import IndexRouter
+from test.fixtures import freebase_name, freebase_fact
+
+
+def make_backend(name, names, num_total, facts):
+    backend = MagicMock()
+    backend.name = name
+    backend.get_names = MagicMock(return_value=(names, num_total))
+    backend.get_names_batch = MagicMock(side_effect=lambda queries, num_results: [(names, num_total) for _ in queries])
+    backend.get_facts_by_ids = MagicMock(side_effect=lambda topic_ids, num_results, num_results_per_topic, predicate_filter=None: \
+        KnowledgeBaseBackend().filter_facts_per_topic(facts, num_results_per_topic) + ({'value': len(facts)},))
+    return backend
+
+
+class TestIndexRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.fb_2m = make_backend('FB_2M', [freebase_name('/m/0np6z99', 'Fearless')], 1, [
+            freebase_fact('/m/0np6z99', 'Fearless', '/music/album/genre', '/m/06by7', 'Rock music')])
+        self.fb_5m = make_backend('FB_5M', [freebase_name('/m/0np6z99', 'Fearless'), freebase_name('/m/0np6z98', 'Fearless')],
+            2, [freebase_fact('/m/0np6z99', 'Fearless', '/music/album/genre', '/m/06by7', 'Rock music'),
+                freebase_fact('/m/0np6z99', 'Fearless', '/music/album/release_type', '/m/02lx2r', 'Album')])
+        self.router = IndexRouter([('FB_2M', self.fb_2m), ('FB_5M', self.fb_5m)], 'FB_2M')
+
+    def test_for_index(self):
+        self.assertIs(self.router.for_index(None), self.fb_2m)
+        self.assertIs(self.router.for_index('FB_5M'), self.fb_5m)
+        self.assertRaises(ValueError, self.router.for_index, 'FB_10M')
+        self.assertRaises(ValueError, KnowledgeBaseBackend().for_index, 'FB_5M')
+
+        self.router.get_names('fearless', 10)
+        self.fb_2m.get_names.assert_called_once_with('fearless', 10)
+        self.assertFalse(self.fb_5m.get_names.called)
+
+    def test_both_dedups_names_by_id(self):
+        names, num_total = self.router.for_index('both').get_names('fearless', 10)
+        self.assertEqual([name.freebase_id for name in names], ['/m/0np6z99', '/m/0np6z98'])
+        self.assertEqual(num_total, 2)
+
+        (names, _), = self.router.for_index('both').get_names_batch(['fearless'], 1)
+        self.assertEqual([name.freebase_id for name in names], ['/m/0np6z99'])
+
+    def test_both_dedups_facts(self):
+        facts, filtered_facts, _, num_total = self.router.for_index('both').get_facts_by_ids(['/m/0np6z99'], 100, 10)
+        self.assertEqual(list(facts.predicates), ['/music/album/genre', '/music/album/release_type'])
+        self.assertEqual(len(filtered_facts), 2)
+        self.assertEqual(num_total, 2)
+
+    def test_both_starts_one_pool(self):
+        both = self.router.for_index('both')
+        pools = ThreadPool(8).map(lambda _: both.get_pool(), range(8))
+        self.assertTrue(all(pool is pools[0] for pool in pools))
+
+if __name__ == '__main__':
+    unittest.main()
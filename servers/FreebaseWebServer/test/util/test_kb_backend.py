@@ -0,0 +1,36 @@
+import inspect
+import unittest
+from mock import MagicMock
+
+from util.kb_backend import BackendWrapper, KnowledgeBaseBackend
+
+
+# Helpers of the interface built on the lookups, not lookups of their own
+HELPERS = ('for_index', 'get_facts_by_id', 'filter_facts_per_topic')
+
+
+class TestBackendWrapper(unittest.TestCase):
+
+    def test_every_lookup_is_forwarded(self):
+        lookups = [name for name, _ in inspect.getmembers(KnowledgeBaseBackend, inspect.ismethod)
+                   if not name.startswith('_') and name not in HELPERS]
+        self.assertIn('get_predicate_sets', lookups)
+
+        backend = MagicMock()
+        wrapper = BackendWrapper()
+        wrapper.backend = backend
+        for name in lookups:
+            self.assertIsNot(getattr(BackendWrapper, name), getattr(KnowledgeBaseBackend, name), name)
+            num_args = len(inspect.getargspec(getattr(KnowledgeBaseBackend, name)).args) - 1
+            args = tuple(range(num_args))
+            self.assertIs(getattr(wrapper, name)(*args), getattr(backend, name).return_value)
+            getattr(backend, name).assert_called_once_with(*args)
+
+    def test_other_calls_go_to_backend(self):
+        wrapper = BackendWrapper()
+        wrapper.backend = MagicMock()
+        wrapper.set_index('FB_5M')
+        wrapper.backend.set_index.assert_called_once_with('FB_5M')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from util.local_freebase_helper import LocalFreebaseHelper, read_names
+from util.name_index import NAMES_FILE, ShingleNameIndex
+
+
+FACTS = [
+    'www.freebase.com/m/01jp8ww\twww.freebase.com/music/album/genre\twww.freebase.com/m/01qzt1\tWhich genre of album is harder.....faster?',
+    'www.freebase.com/m/0np6z99\twww.freebase.com/music/album/release_type\twww.freebase.com/m/02lx2r\twhat format is fearless',
+    'www.freebase.com/m/0np6z99\twww.freebase.com/music/album/genre\twww.freebase.com/m/01qzt1 www.freebase.com/m/02lx2r',
+    'www.freebase.com/m/0np6z98\twww.freebase.com/music/album/genre\twww.freebase.com/m/01qzt1',
+]
+
+NAMES = [
+    '/m/01jp8ww\tHarder.....Faster',
+    '/m/0np6z99\tFearless',
+    '/m/0np6z98\tFearless',
+    '/m/01qzt1\tClassic rock',
+    '/m/02lx2r\tAlbum',
+]
+
+
+class TestLocalFreebaseHelper(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fact_path = os.path.join(self.tmp_dir, 'annotated_fb_data_test.txt')
+        self.name_path = os.path.join(self.tmp_dir, 'names.txt')
+        with open(self.fact_path, 'w') as f:
+            f.write('\n'.join(FACTS) + '\n')
+        with open(self.name_path, 'w') as f:
+            f.write('\n'.join(NAMES) + '\n')
+        self.helper = LocalFreebaseHelper([self.fact_path], [self.name_path])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_get_names(self):
+        names, num_items = self.helper.get_names('harder faster', 10)
+        self.assertEqual(num_items, 1)
+        self.assertEqual(names[0].freebase_id, '/m/01jp8ww')
+        self.assertEqual(names[0].freebase_name, 'Harder.....Faster')
+
+    def test_saved_name_index(self):
+        index_dir = os.path.join(self.tmp_dir, 'names')
+        ShingleNameIndex.build(read_names(self.name_path), index_dir)
+
+        # Names are resolved through the saved index without the name files
+        helper = LocalFreebaseHelper([self.fact_path], name_index_path=index_dir)
+        names, _ = helper.get_names('harder faster', 10)
+        self.assertEqual(names[0].freebase_name, 'Harder.....Faster')
+        facts, _ = helper.get_facts_by_name('harder', 10)
+        self.assertEqual(facts[0].tgt.freebase_name, 'Classic rock')
+
+        # A loaded index is kept when names are added
+        helper.add_name('/m/0new', 'Harder')
+        self.assertEqual(helper.get_names('harder faster', 10)[0][0].freebase_id, '/m/01jp8ww')
+
+        # An index saved without its names fails at startup instead of serving ids as names
+        os.remove(os.path.join(index_dir, NAMES_FILE))
+        self.assertRaises(Exception, LocalFreebaseHelper, [self.fact_path], name_index_path=index_dir)
+        LocalFreebaseHelper([self.fact_path], [self.name_path], name_index_path=index_dir)
+
+    def test_get_facts_by_ids(self):
+        facts, filtered_facts, name_facts_counter, num_items = \
+            self.helper.get_facts_by_ids(['/m/0np6z99', '/m/0np6z98'], 10, 1)
+        self.assertEqual(num_items, 4)
+
+        # Duplicate (id, predicate) pairs are dropped
+        self.assertEqual(len(facts), 3)
+        self.assertEqual(name_facts_counter['Fearless']['/m/0np6z99'], 2)
+
+        # Only the id with the most facts is kept for the name Fearless
+        self.assertEqual(set(fact.src.freebase_id for fact in filtered_facts), set(['/m/0np6z99']))
+        self.assertEqual(filtered_facts[0].tgt.freebase_name, 'Album')
+
+    def test_get_facts_by_ids_aggregated(self):
+        # The most frequent predicate first, with the fact of the smallest target id
+        facts, _, _, num_items = self.helper.get_facts_by_ids_aggregated(['/m/0np6z99'], 1, 10)
+        self.assertEqual(num_items, 3)
+        self.assertEqual([(fact.pred.freebase_name, fact.tgt.freebase_id) for fact in facts],
+                         [('/music/album/genre', '/m/01qzt1')])
+
+        facts, _, _, _ = self.helper.get_facts_by_ids_aggregated(['/m/0np6z99', '/m/01jp8ww'], 10, 10)
+        self.assertEqual([fact.pred.freebase_name for fact in facts],
+                         ['/music/album/genre', '/music/album/release_type', '/music/album/genre'])
+
+    def test_get_facts_by_name(self):
+        facts, num_items = self.helper.get_facts_by_name('harder', 10)
+        self.assertEqual(num_items, 1)
+        self.assertEqual(facts[0].pred.freebase_name, '/music/album/genre')
+        self.assertEqual(facts[0].tgt.freebase_name, 'Classic rock')
+
+    def test_get_neighbor_facts(self):
+        facts, num_items = self.helper.get_neighbor_facts(['/m/0np6z99', '/m/01jp8ww'], 2)
+        self.assertEqual(num_items, 4)
+        self.assertEqual(list(facts.src_ids), ['/m/0np6z99', '/m/0np6z99', '/m/01jp8ww'])
+
+        facts, num_items = self.helper.get_neighbor_facts(['/m/0np6z99'], 10, predicates=['/music/album/genre'])
+        self.assertEqual(num_items, 2)
+        self.assertEqual(list(facts.tgt_names), ['Classic rock', 'Album'])
+
+        # Facts pointing at Classic rock, subjects in sorted order
+        facts, num_items = self.helper.get_neighbor_facts(['/m/01qzt1'], 2, reverse=True)
+        self.assertEqual(num_items, 3)
+        self.assertEqual(list(facts.src_ids), ['/m/01jp8ww', '/m/0np6z98'])
+        self.assertEqual(set(facts.tgt_ids), set(['/m/01qzt1']))
+
+if __name__ == '__main__':
+    unittest.main()
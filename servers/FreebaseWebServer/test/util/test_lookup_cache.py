@@ -0,0 +1,96 @@
+import unittest
+from collections import Counter
+from mock import MagicMock, patch
+
+from util.freebase import FactBatch, FreebaseObject
+from util.lookup_cache import LookupCache, CachedFreebaseHelper
+
+
+class TestLookupCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = LookupCache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), (True, 1))
+        cache.put('c', 3)
+
+        # b was the least recently used entry
+        self.assertEqual(cache.get('b'), (False, None))
+        self.assertEqual(cache.get('c'), (True, 3))
+
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (2, 1, 1))
+
+    def test_byte_bound(self):
+        cache = LookupCache(max_entries=10, max_bytes=100)
+        cache.put('a', 1, size=60)
+        cache.put('b', 2, size=60)
+        self.assertEqual(cache.get('a'), (False, None))
+        self.assertEqual(cache.stats()['bytes'], 60)
+
+        # Values larger than the whole cache are not stored
+        cache.put('c', 3, size=200)
+        self.assertEqual(cache.get('c'), (False, None))
+
+    @patch('time.time')
+    def test_ttl(self, time_mock):
+        time_mock.return_value = 100.0
+        cache = LookupCache(max_entries=10, ttl=5)
+        cache.put('a', 1)
+        time_mock.return_value = 104.0
+        self.assertEqual(cache.get('a'), (True, 1))
+        time_mock.return_value = 106.0
+        self.assertEqual(cache.get('a'), (False, None))
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+
+class TestCachedFreebaseHelper(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = MagicMock()
+        self.backend.name = 'Mock'
+        self.fearless = ([FreebaseObject(-1, '/m/0np6z99', 'Fearless')], 1)
+        self.backend.get_names = MagicMock(return_value=self.fearless)
+        self.backend.get_names_batch = MagicMock(side_effect=lambda queries, num_results: \
+            [self.fearless for _ in queries])
+        self.backend.get_facts_by_ids = MagicMock(return_value=([], [], {}, 0))
+        self.helper = CachedFreebaseHelper(self.backend, max_entries=10)
+
+    def test_names_are_cached(self):
+        self.assertEqual(self.helper.get_names('fearless', 10), self.fearless)
+        self.assertEqual(self.helper.get_names('fearless', 10), self.fearless)
+        self.helper.get_names('fearless', 20)
+        self.assertEqual(self.backend.get_names.call_count, 2)
+
+        # Only the missing query of the batch goes to the backend
+        self.helper.get_names_batch(['fearless', 'alex golfis'], 10)
+        self.backend.get_names_batch.assert_called_once_with(['alex golfis'], 10)
+        self.assertEqual(self.helper.stats()['names']['hits'], 2)
+
+    def test_facts_are_keyed_on_topic_id_order(self):
+        self.helper.get_facts_by_ids(['/m/a', '/m/b'], 100, 10)
+        self.helper.get_facts_by_ids(['/m/a', '/m/b'], 100, 10)
+        self.assertEqual(self.backend.get_facts_by_ids.call_count, 1)
+
+        # Backends return the facts of the first ids first, so another order is another lookup
+        self.helper.get_facts_by_ids(['/m/b', '/m/a'], 100, 10)
+        self.assertEqual(self.backend.get_facts_by_ids.call_count, 2)
+        self.assertEqual(self.helper.stats()['facts']['misses'], 2)
+
+    def test_cached_facts_are_copied(self):
+        batch = FactBatch()
+        batch.append('/m/0np6z99', 'Fearless', '/music/album/genre', '/m/01qzt1', 'Classic rock')
+        self.backend.get_facts_by_ids = MagicMock(return_value=(batch, batch, {'Fearless': Counter({'/m/0np6z99': 1})}, 1))
+
+        facts, filtered_facts, name_facts_counter, _ = self.helper.get_facts_by_ids(['/m/0np6z99'], 100, 10)
+        facts.append('/m/0np6z99', 'Fearless', '/music/album/artist', '/m/0dl567', 'Taylor Swift')
+        name_facts_counter['Fearless']['/m/0np6z99'] += 1
+
+        facts, filtered_facts, name_facts_counter, _ = self.helper.get_facts_by_ids(['/m/0np6z99'], 100, 10)
+        self.assertEqual(len(facts), 1)
+        self.assertEqual(len(filtered_facts), 1)
+        self.assertEqual(name_facts_counter['Fearless']['/m/0np6z99'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import time
+import unittest
+
+from util import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def tearDown(self):
+        metrics.finish_request()
+
+    def test_nested_stages_are_exclusive(self):
+        timings = metrics.start_request()
+        with metrics.stage('backend'):
+            with metrics.stage('decode'):
+                time.sleep(0.02)
+        metrics.count('es_calls')
+        metrics.count('es_calls')
+
+        self.assertGreaterEqual(timings.stages['decode'], 0.02)
+        self.assertLess(timings.stages['backend'], 0.01)
+        self.assertEqual(timings.counts['es_calls'], 2)
+        self.assertTrue(timings.server_timing().startswith('decode;dur='))
+
+    def test_outside_of_request(self):
+        with metrics.stage('backend'):
+            metrics.count('es_calls')
+        self.assertEqual(metrics.current(), None)
+
+    def test_histogram_render(self):
+        histogram = metrics.Histogram('test_seconds', 'Test histogram', ('stage',), buckets=(0.1, 1.0))
+        histogram.observe(0.05, 'backend')
+        histogram.observe(0.5, 'backend')
+        histogram.observe(5.0, 'backend')
+        self.assertEqual(histogram.render(), [
+            '# HELP test_seconds Test histogram',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{stage="backend",le="0.1"} 1',
+            'test_seconds_bucket{stage="backend",le="1.0"} 2',
+            'test_seconds_bucket{stage="backend",le="+Inf"} 3',
+            'test_seconds_sum{stage="backend"} 5.55',
+            'test_seconds_count{stage="backend"} 3',
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import shutil
+import tempfile
+import unittest
+
+from util.name_index import ShingleNameIndex, shingles
+
+
+DOCUMENTS = [
+    ('/m/0np6z99', 'Fearless', 'NODESCRIPTION'),
+    ('/m/0wzc58l', 'Alex Golfis', 'Greek footballer'),
+    ('/m/01jp8ww', 'Harder.....Faster', 'NODESCRIPTION'),
+    ('/m/0fearls', 'Fearless Tour', 'Concert tour'),
+]
+
+
+class TestShingleNameIndex(unittest.TestCase):
+
+    def test_shingles(self):
+        self.assertEqual(shingles(['a', 'b', 'c'], 1, 2), ['a', 'a b', 'b', 'b c', 'c'])
+        self.assertEqual(len(shingles(['w'] * 7)), 7 + 6 + 5 + 4 + 3)
+
+    def test_search(self):
+        index = ShingleNameIndex.build(DOCUMENTS)
+        results, num_total = index.search('fearless', 10)
+        self.assertEqual(num_total, 2)
+
+        # The shorter name gets the higher BM25 score
+        self.assertEqual([freebase_id for freebase_id, _ in results], ['/m/0np6z99', '/m/0fearls'])
+
+        results, _ = index.search('alex golfis', 1)
+        self.assertEqual(results[0][0], '/m/0wzc58l')
+
+        # Description matches are boosted twice
+        results, _ = index.search('footballer', 10)
+        unboosted_results, _ = index.search('footballer', 10, boosts={'description': 1.0})
+        self.assertEqual(results[0][0], '/m/0wzc58l')
+        self.assertAlmostEqual(results[0][1], 2 * unboosted_results[0][1])
+
+        self.assertEqual(index.search('unknown', 10), ([], 0))
+
+    def test_save_and_load(self):
+        index_dir = tempfile.mkdtemp()
+        try:
+            index = ShingleNameIndex.build(DOCUMENTS, index_dir)
+            loaded = ShingleNameIndex.load(index_dir)
+            self.assertEqual(loaded.search('fearless tour', 10), index.search('fearless tour', 10))
+            self.assertEqual(loaded.document('/m/0wzc58l'), ('Alex Golfis', 'Greek footballer'))
+            self.assertEqual(loaded.document('/m/0fearls'), ('Fearless Tour', 'Concert tour'))
+            self.assertEqual(loaded.document('/m/unknown'), None)
+        finally:
+            shutil.rmtree(index_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from util.fact_store import build_fact_store
+from util.local_freebase_helper import LocalFreebaseHelper, read_triples
+from util.predicate_index import PredicateFilter, PredicateSetIndex
+
+
+FACTS = [
+    'www.freebase.com/m/0np6z99\twww.freebase.com/music/album/release_type\twww.freebase.com/m/02lx2r',
+    'www.freebase.com/m/0np6z99\twww.freebase.com/music/album/genre\twww.freebase.com/m/01qzt1 www.freebase.com/m/02lx2r',
+    'www.freebase.com/m/0np6z99\twww.freebase.com/type/object/type\twww.freebase.com/m/0album',
+    'www.freebase.com/m/0wzc58l\twww.freebase.com/people/person/place_of_birth\twww.freebase.com/m/0n2z',
+    'www.freebase.com/m/0wzc58l\twww.freebase.com/people/person/nationality\twww.freebase.com/m/035qy',
+]
+
+
+class TestPredicateFilter(unittest.TestCase):
+
+    def test_matches(self):
+        self.assertFalse(PredicateFilter())
+        exclude = PredicateFilter(exclude_domains=['/type/object/'])
+        self.assertTrue(exclude.matches('/music/album/genre'))
+        self.assertFalse(exclude.matches('/type/object/type'))
+
+        include = PredicateFilter(predicates=['/music/album/genre'], domains=['/people/person/'],
+                                  exclude_predicates=['/people/person/nationality'])
+        self.assertTrue(include.matches('/music/album/genre'))
+        self.assertTrue(include.matches('/people/person/place_of_birth'))
+        self.assertFalse(include.matches('/people/person/nationality'))
+        self.assertFalse(include.matches('/music/album/release_type'))
+
+    def test_es_query(self):
+        query = {'terms': {'src_freebase_id': ['/m/0np6z99']}}
+        bool_query = PredicateFilter(domains=['/people/person/'], exclude_domains=['/type/object/']).es_query(query)['bool']
+        self.assertEqual(bool_query['must'][0], query)
+        self.assertEqual(bool_query['must'][1]['bool']['should'], [{'prefix': {'predicate': '/people/person/'}}])
+        self.assertEqual(bool_query['must_not'], [{'prefix': {'predicate': '/type/object/'}}])
+
+
+class TestPredicateSetIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fact_path = os.path.join(self.tmp_dir, 'facts.txt')
+        with open(self.fact_path, 'w') as f:
+            f.write('\n'.join(FACTS) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_predicate_sets(self):
+        helper = LocalFreebaseHelper([self.fact_path])
+        self.assertEqual(helper.get_predicate_sets(['/m/0np6z99', '/m/unknown']), [
+            ['/music/album/genre', '/music/album/release_type', '/type/object/type'], []])
+        self.assertEqual(helper.get_predicate_sets(['/m/0np6z99'], PredicateFilter(exclude_domains=['/type/object/'])),
+                         [['/music/album/genre', '/music/album/release_type']])
+
+        # Saved, loaded and fact store built indices have the same sets
+        index_dir = os.path.join(self.tmp_dir, 'predicates')
+        PredicateSetIndex.build(read_triples(self.fact_path), index_dir)
+        store = build_fact_store([self.fact_path], os.path.join(self.tmp_dir, 'store'))
+        for index in (PredicateSetIndex.load(index_dir), PredicateSetIndex.from_fact_store(store)):
+            self.assertEqual(index.predicate_set('/m/0wzc58l'),
+                             ['/people/person/nationality', '/people/person/place_of_birth'])
+            self.assertEqual(index.predicate_set('/m/02lx2r'), [])
+
+    def test_filtered_facts(self):
+        in_memory = LocalFreebaseHelper([self.fact_path])
+        build_fact_store([self.fact_path], os.path.join(self.tmp_dir, 'store'))
+        mapped = LocalFreebaseHelper([], fact_store_path=os.path.join(self.tmp_dir, 'store'))
+
+        predicate_filter = PredicateFilter(domains=['/music/', '/people/person/'],
+                                           exclude_predicates=['/music/album/release_type'])
+        filter_state = dict(vars(predicate_filter))
+        for helper in (in_memory, mapped):
+            facts, _, _, num_items = helper.get_facts_by_ids(['/m/0np6z99', '/m/0wzc58l'], 2, 10, predicate_filter)
+            # Only matching facts count towards num_results and num_items
+            self.assertEqual(num_items, 4)
+            self.assertEqual([fact.pred.freebase_name for fact in facts], ['/music/album/genre'])
+            self.assertEqual(len(helper.get_facts_by_ids(['/m/0wzc58l'], 10, 10, predicate_filter)[0]), 2)
+        self.assertEqual(mapped.count_facts('/m/unknown', predicate_filter), 0)
+        # Lookups of several threads share one filter, which they do not change
+        self.assertEqual(vars(predicate_filter), filter_state)
+
+if __name__ == '__main__':
+    unittest.main()
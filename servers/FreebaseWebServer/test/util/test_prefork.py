@@ -0,0 +1,69 @@
+import os
+import time
+import signal
+import logging
+import unittest
+from six.moves.urllib.request import urlopen
+
+from util.prefork import PreforkServer
+
+
+# Pid of the process post_fork last ran in
+post_fork_pid = [None]
+
+
+def record_post_fork():
+    post_fork_pid[0] = os.getpid()
+
+
+def worker_pid_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    # Workers ran post_fork before serving
+    assert post_fork_pid[0] == os.getpid()
+    return [str(os.getpid()).encode('utf-8')]
+
+
+class TestPreforkServer(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = PreforkServer(worker_pid_app, '127.0.0.1', 0, num_workers=2, max_requests=2, graceful_timeout=5,
+                                post_fork=record_post_fork)
+        self.url = 'http://127.0.0.1:%d/' % server.address[1]
+        self.master_pid = os.fork()
+        if self.master_pid == 0:
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        server.server.server_close()
+
+    def tearDown(self):
+        os.kill(self.master_pid, signal.SIGTERM)
+        _, status = os.waitpid(self.master_pid, 0)
+        self.assertEqual(status, 0)
+
+    def worker_pids(self, num_requests):
+        return [int(urlopen(self.url, timeout=10).read()) for _ in range(num_requests)]
+
+    def test_workers_ignore_hangups(self):
+        # A hangup reaches the whole process group, the parent reloads the workers
+        worker_pid = self.worker_pids(1)[0]
+        os.kill(worker_pid, signal.SIGHUP)
+        time.sleep(0.5)
+        with open('/proc/%d/stat' % worker_pid) as f:
+            self.assertNotIn(f.read().split(')')[-1].split()[0], ('Z', 'X'))
+
+    def test_workers_are_recycled_and_reloaded(self):
+        pids = self.worker_pids(6)
+        self.assertNotIn(self.master_pid, pids)
+        # Every worker exits after 2 requests and is replaced
+        self.assertGreaterEqual(len(set(pids)), 3)
+        self.assertTrue(all(pids.count(pid) <= 2 for pid in pids))
+
+        os.kill(self.master_pid, signal.SIGHUP)
+        time.sleep(1.5)
+        self.assertFalse(set(self.worker_pids(2)) & set(pids))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from util import replay_bench
+from util.ngrams import tokenize_text, split_text, ngrams, question_ngrams
+
+
+class TestNgrams(unittest.TestCase):
+
+    def test_tokenize_text(self):
+        self.assertEqual(tokenize_text('Which genre of album is harder.....faster?'),
+                         ['which', 'genre', 'of', 'album', 'is', 'harder', 'faster'])
+        self.assertEqual(split_text('what  city'), ['what', 'city'])
+
+    def test_question_ngrams(self):
+        self.assertEqual(ngrams(['a', 'b'], 3), [])
+        self.assertEqual(question_ngrams('Who is A.J.?', 2), [
+            'who', 'is', 'a', 'j', 'Who', 'is', 'A.J.?',
+            'who is', 'is a', 'a j', 'Who is', 'is A.J.?'])
+
+
+class TestReplayBenchmark(unittest.TestCase):
+
+    def request(self, method, path, body):
+        if method == 'POST':
+            return {'result': [{'result': [{'freebase_id': '/m/' + query, 'freebase_name': query}]}
+                               for query in body['queries']]}
+        return {'result': [{'tgt_freebase_id': '/m/0'}] * 3}
+
+    def test_run(self):
+        benchmark = replay_bench.ReplayBenchmark(self.request, num_results=10, num_facts=100)
+        workload = replay_bench.question_workload(['what format is fearless'] * 20, 2)
+        results = benchmark.run(workload, concurrency=4)
+
+        self.assertEqual(results['questions'], 20)
+        self.assertEqual(results['requests_per_question'], 2.0)
+        self.assertEqual(results['facts_per_question'], 3.0)
+        self.assertLessEqual(results['latency_ms']['p50'], results['latency_ms']['p99'])
+
+    def test_percentile(self):
+        values = list(range(101))
+        self.assertEqual(replay_bench.percentile(values, 50), 50)
+        self.assertEqual(replay_bench.percentile(values, 99), 99)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from util import snapshot
+from util.snapshot import SnapshotExporter, read_snapshot, snapshot_info
+
+
+class ScrollSource(object):
+    """ Stands in for an elasticsearch client, serves sliced scrolls over a list of documents """
+
+    def __init__(self, docs, fail_on_slice=None):
+        self.docs = docs
+        self.fail_on_slice = fail_on_slice
+        self.scrolls = {}
+        self.sliced_searches = []
+
+    def search(self, index, body, scroll):
+        slice_id = body['slice']['id']
+        self.sliced_searches.append(slice_id)
+        # Slice i holds every max-th document
+        scroll_id = 'scroll-%d' % slice_id
+        self.scrolls[scroll_id] = (slice_id, self.docs[slice_id::body['slice']['max']], 0, body['size'])
+        return self.scroll(scroll_id, scroll)
+
+    def scroll(self, scroll_id, scroll):
+        slice_id, docs, position, size = self.scrolls[scroll_id]
+        if slice_id == self.fail_on_slice and position > 0:
+            raise Exception("Scroll of slice %d failed" % slice_id)
+        self.scrolls[scroll_id] = (slice_id, docs, position + size, size)
+        hits = [{'_id': doc_id, '_source': source} for doc_id, source in docs[position:position + size]]
+        return {'_scroll_id': scroll_id, 'hits': {'hits': hits}}
+
+    def clear_scroll(self, scroll_id):
+        pass
+
+
+def name_docs(num_docs):
+    return [('/m/%d' % i, {'freebase_id': '/m/%d' % i, 'name': u'Näme %d' % i, 'description': 'NODESCRIPTION'})
+            for i in range(num_docs)]
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'names.snapshot')
+        self.docs = name_docs(23)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def export(self, es):
+        return SnapshotExporter(es, 'names_v3', 'name', self.path, num_slices=3, chunk_size=4).export()
+
+    def test_export_and_read(self):
+        self.assertEqual(self.export(ScrollSource(self.docs)), 23)
+        self.assertEqual(sorted(read_snapshot(self.path)), sorted(self.docs))
+        self.assertEqual(snapshot_info(self.path)['num_docs'], 23)
+
+        # A complete snapshot is not exported again
+        self.assertEqual(self.export(ScrollSource(self.docs)), 0)
+
+        lines = list(snapshot.snapshot_lines(self.path))
+        self.assertEqual(len(lines), 23)
+        self.assertIn(u'/m/0\tNäme 0\tNODESCRIPTION\n'.encode('utf-8'), lines)
+
+    def test_resume_reruns_unfinished_slices(self):
+        self.assertRaises(Exception, self.export, ScrollSource(self.docs, fail_on_slice=1))
+        self.assertRaises(Exception, snapshot_info, self.path)
+        finished = snapshot.SnapshotState(self.path).finished
+        self.assertNotIn(1, finished)
+
+        # A torn record at the end is dropped on resume
+        with open(self.path, 'ab') as f:
+            f.write(b'FBSC\x01')
+
+        es = ScrollSource(self.docs)
+        self.export(es)
+        self.assertEqual(sorted(es.sliced_searches), [i for i in range(3) if i not in finished])
+        self.assertEqual(sorted(read_snapshot(self.path)), sorted(self.docs))
+        self.assertEqual(snapshot_info(self.path)['num_docs'], 23)
+
+    def test_checksum(self):
+        self.export(ScrollSource(self.docs))
+        with open(self.path, 'r+b') as f:
+            f.seek(snapshot.RECORD.size + 2)
+            f.write(b'X')
+        self.assertRaises(Exception, snapshot_info, self.path)
+
+if __name__ == '__main__':
+    unittest.main()
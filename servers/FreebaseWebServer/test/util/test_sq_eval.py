@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from util import sq_eval
+
+
+GOLD = {
+    'question': 'what format is fearless',
+    'subject_id': '/m/0np6z99',
+    'subject_name': 'Fearless',
+    'predicate': '/music/album/release_type',
+    'object_ids': ['/m/02lx2r'],
+    'object_name': 'Album',
+}
+
+
+class EchoPredictor(object):
+
+    def __init__(self):
+        self.questions = []
+
+    def predict(self, question):
+        self.questions.append(question)
+        return {'entity': question, 'predicate': '/music/album/genre', 'fact': '/m/01qzt1'}
+
+
+class TestSqEval(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_shard_ranges(self):
+        self.assertEqual(sq_eval.shard_ranges(10, 3), [(0, 4), (4, 8), (8, 10)])
+        self.assertEqual(sq_eval.shard_ranges(2, 4), [(0, 1), (1, 2)])
+
+    def test_score_prediction(self):
+        prediction = {'entity': 'fearless', 'predicate': '/music/album/release_type', 'fact': '/m/0abc /m/02lx2r'}
+        self.assertEqual(sq_eval.score_prediction(GOLD, prediction), (True, True, True, True))
+        prediction = {'entity': 'Fearless', 'predicate': '/music/album/genre', 'fact': 'album'}
+        self.assertEqual(sq_eval.score_prediction(GOLD, prediction), (True, False, True, False))
+
+    def test_run_shard_resumes(self):
+        questions = ['q%d' % i for i in range(10)]
+        shard_path = os.path.join(self.tmp_dir, sq_eval.SHARD_FILE % 1)
+
+        # A crashed run answered two questions and was cut off in the middle of the third
+        with open(shard_path, 'w') as f:
+            f.write('{"index": 4, "entity": "q4", "predicate": "", "fact": ""}\n')
+            f.write('{"index": 5, "entity": "q5", "predicate": "", "fact": ""}\n')
+            f.write('{"index": 6, "ent')
+
+        predictor = EchoPredictor()
+        self.assertEqual(sq_eval.run_shard(predictor, questions, 1, 4, 8, self.tmp_dir), 2)
+        self.assertEqual(predictor.questions, ['q6', 'q7'])
+
+        # Finished shards are skipped
+        self.assertEqual(sq_eval.run_shard(predictor, questions, 1, 4, 8, self.tmp_dir), 0)
+        predictions = sq_eval.merge_shards(self.tmp_dir, 2)
+        self.assertEqual(sorted(predictions.keys()), [4, 5, 6, 7])
+
+    def test_read_lua_predictions(self):
+        for field, lines in (('entities', 'Fearless\nAlex Golfis\n'),
+                             ('predicates', '/music/album/release_type\n/people/person/place_of_birth\n'),
+                             ('facts', '/m/02lx2r\n/m/0n2z\n')):
+            with open(os.path.join(self.tmp_dir, 'predictions_%s_2.txt' % field), 'w') as f:
+                f.write(lines)
+        predictions = sq_eval.read_lua_predictions(self.tmp_dir)
+        self.assertEqual(sorted(predictions.keys()), [1, 2])
+        self.assertEqual(predictions[1]['predicate'], '/music/album/release_type')
+
+        scores = sq_eval.score_predictions({1: GOLD, 2: GOLD}, predictions)
+        self.assertEqual((scores['questions'], scores['accuracy']), (2, 0.5))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import random
+import unittest
+
+import util.tokenizer as tokenizer
+
+
+def brute_force_clean_name_arr(name_arr, query):
+    query = query + " "
+    lowercase_query = query.lower()
+    variants = [lowercase_query, lowercase_query.replace('\\"', ''), lowercase_query.replace('?', ''),
+                lowercase_query.replace('"', '').replace('?', '')]
+    return [k for k in name_arr if any(k.lower() + " " in variant for variant in variants)]
+
+
+def brute_force_remove_substrings_arr(substring_arr):
+    return [item for item in substring_arr if not tokenizer.is_substring(item, set(substring_arr))]
+
+
+class TestTokenizer(unittest.TestCase):
+
+    def test_remove_stopwords(self):
+        self.assertEqual(tokenizer.remove_stopwords('what city was alex golfis born in?'), 'city alex golfis born')
+        self.assertEqual(tokenizer.remove_stopwords('what is the'), 'what is the')
+
+    def test_clean_name_arr(self):
+        query = 'Which genre of album is "Harder.....Faster"?'
+        names = ['Harder.....Faster', 'harder', 'Album', 'Faster"', 'genre of', 'Harder.....Faster', 'faster?']
+        self.assertEqual(tokenizer.clean_name_arr(names, query),
+                         ['Harder.....Faster', 'Album', 'Faster"', 'genre of', 'Harder.....Faster'])
+
+    def test_remove_substrings_arr(self):
+        names = ['Alex', 'Alex Golfis', 'Golfis', 'Alex Golfis', 'Athens', '']
+        self.assertEqual(tokenizer.remove_substrings_arr(names), ['Alex Golfis', 'Alex Golfis', 'Athens'])
+
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        words = ['a', 'ab', 'b', 'ba', 'abc', '"c"', 'c?', '']
+        for _ in range(200):
+            query = ' '.join(rng.choice(words) for _ in range(rng.randint(0, 6)))
+            names = [' '.join(rng.choice(words) for _ in range(rng.randint(1, 3))) for _ in range(rng.randint(0, 8))]
+            self.assertEqual(tokenizer.clean_name_arr(names, query), brute_force_clean_name_arr(names, query))
+            self.assertEqual(tokenizer.remove_substrings_arr(names), brute_force_remove_substrings_arr(names))
+
+if __name__ == '__main__':
+    unittest.main()
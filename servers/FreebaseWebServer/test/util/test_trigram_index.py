@@ -0,0 +1,79 @@
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from mock import patch
+
+from util.trigram_index import TrigramNameIndex, normalize, trigram_keys
+from util.local_freebase_helper import LocalFreebaseHelper
+
+
+NAMES = [
+    ('/m/0np6z99', 'Fearless'),
+    ('/m/0hhvnpm', 'Harder.....Faster'),
+    ('/m/0wzc58l', 'Alex Golfis'),
+    ('/m/02lx2r', 'Album'),
+    ('/m/0fearlt', 'Fear Itself'),
+]
+
+
+class TestTrigramNameIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = TrigramNameIndex.build(NAMES)
+
+    def test_normalize(self):
+        self.assertEqual(normalize('Harder.....Faster'), 'harder faster')
+        self.assertEqual(normalize(u'Beyonc\xe9'), 'beyonce')
+        self.assertEqual(len(trigram_keys('ab')), 2)
+        self.assertEqual(len(trigram_keys('...')), 0)
+
+    def test_misspelled_names(self):
+        matches, num_total = self.index.search('fearles', 2)
+        self.assertEqual([freebase_id for freebase_id, _, _ in matches], ['/m/0np6z99', '/m/0fearlt'])
+        self.assertEqual(num_total, 2)
+        self.assertTrue(matches[0][2] > matches[1][2])
+
+        matches, _ = self.index.search('hardr faster', 1)
+        self.assertEqual(matches[0][:2], ('/m/0hhvnpm', 'Harder.....Faster'))
+        self.assertEqual(self.index.search('zzz', 5), ([], 0))
+
+    def test_save_and_load(self):
+        index_dir = tempfile.mkdtemp()
+        try:
+            TrigramNameIndex.build(NAMES, index_dir)
+            loaded = TrigramNameIndex.load(index_dir)
+            self.assertEqual(loaded.search('alex golfs', 3), self.index.search('alex golfs', 3))
+            # Names are stored back to back, not padded to the longest one
+            self.assertEqual(loaded.names.nbytes, sum(len(name) for _, name in NAMES))
+            self.assertEqual(loaded.freebase_id(1), '/m/0hhvnpm')
+        finally:
+            shutil.rmtree(index_dir)
+
+    def test_local_backend(self):
+        helper = LocalFreebaseHelper([])
+        for freebase_id, name in NAMES:
+            helper.add_name(freebase_id, name)
+        names, _ = helper.get_names_fuzzy('alex golfs', 1)
+        self.assertEqual([(name.freebase_id, name.freebase_name) for name in names], [('/m/0wzc58l', 'Alex Golfis')])
+
+    def test_local_backend_builds_once(self):
+        helper = LocalFreebaseHelper([])
+        for freebase_id, name in NAMES:
+            helper.add_name(freebase_id, name)
+
+        build = TrigramNameIndex.build
+        def slow_build(documents):
+            time.sleep(0.05)
+            return build(documents)
+        with patch.object(TrigramNameIndex, 'build', side_effect=slow_build) as build_mock:
+            threads = [threading.Thread(target=helper.get_names_fuzzy, args=('fearles', 1)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(build_mock.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()